@@ -1,10 +1,14 @@
+import time
 import cv2
 from utils.logger import get_logger
-from communication.database_manager import DatabaseManager
+from utils.metrics import metrics, flatten_stats
 from arc_engine.video_stream_processor import VideoStreamProcessor
-from arc_engine.human_detection_module import HumanDetectionModule
 from arc_engine.target_tracking_module import TargetTrackingModule
-from arc_engine.facial_recognition_module import FacialRecognitionModule
+from arc_engine.perception_pipeline import PerceptionPipeline, DROP_OLDEST
+from arc_engine.detection_scheduler import DetectionScheduler
+from arc_engine.identity_cache import IdentityCache
+from arc_engine.shared_resources import SharedResources
+from arc_engine.detection_server import DetectionClient
 
 class ARCEngineCore:
     """
@@ -12,87 +16,465 @@ class ARCEngineCore:
     integrating and orchestrating all perception and decision-making modules.
     """
 
-    def __init__(self, video_source=0):
+    def __init__(self, video_source=0, pipeline_mode=False, queue_size=2, drop_policy=DROP_OLDEST,
+                 threaded_capture=False, tracking_mode='single', detection_interval=None,
+                 latency_budget_ms=None, min_tracking_confidence=0.3, recognition_workers=0,
+                 ann_index_path=None, ann_nprobe=16, gallery_shards=0, shard_timeout=0.5,
+                 gallery_precision='float32', gallery_rerank=16, event_store_path=None,
+                 shared=None, feed_name=None, detection_server=None):
         """
         Initializes the ARCEngineCore, setting up all necessary modules.
 
         Args:
             video_source (int or str): The video source for the VideoStreamProcessor.
+            pipeline_mode (bool): If True, capture, detection, tracking and recognition
+                run as separate worker threads instead of sequentially in process_frame.
+            queue_size (int): The capacity of each inter-stage queue in pipeline mode.
+            drop_policy (str): The overflow policy of the inter-stage queues in pipeline
+                mode ('drop_oldest', 'drop_newest' or 'block').
+            threaded_capture (bool): If True, frames are grabbed on a background thread
+                and only the newest one is processed.
+            tracking_mode (str): 'single' to follow one target with an OpenCV tracker,
+                'multi' to track every detected person.
+            detection_interval (int or None): Run detection every N frames while tracking.
+                None means only when tracking confidence drops in single mode and on
+                every frame in multi mode.
+            latency_budget_ms (float or None): If set, the detection interval adapts so
+                that the average per-frame processing time stays within this budget.
+            min_tracking_confidence (float): Detection is forced when the tracking
+                confidence falls below this value.
+            recognition_workers (int): If greater than 0, face detection and encoding run
+                asynchronously in a pool of this many worker processes.
+            ann_index_path (str or None): If set, known faces are matched with an approximate
+                IVF index stored in this directory (built on first use) instead of an
+                exact scan. Meant for watchlists of hundreds of thousands of faces.
+            ann_nprobe (int): The number of IVF cells scanned per face; higher is more
+                accurate and slower.
+            gallery_shards (int): If greater than 0 (and ann_index_path is not set), the
+                known faces are split across this many gallery shard processes.
+            shard_timeout (float): Seconds a face search waits for each gallery shard.
+            gallery_precision (str): 'float32', 'float16' or 'int8', the precision of the
+                in-memory gallery scanned for each face (exact and sharded galleries).
+            gallery_rerank (int): With a reduced gallery precision, the number of nearest
+                candidates re-scored in float32.
+            event_store_path (str or None): If set, detections, tracks and identifications
+                are persisted to this SQLite database by a background writer.
+            shared (SharedResources or None): Models, gallery, database and event store
+                shared with other engines (one per video feed). If given, the
+                recognition, gallery and event store arguments above are ignored and
+                shutdown() leaves the shared resources open. If None, the engine
+                loads its own.
+            feed_name (str or None): The name events of this feed are stored under.
+            detection_server (str, tuple or None): Run person detection in a detection
+                server process instead of this one: 'local' to start one, or the
+                (host, port) of a running server. Ignored if `shared` is given.
         """
         self.logger = get_logger(__name__)
         self.logger.info("Initializing ARCEngineCore...")
 
         # Initialize modules
-        self.db_manager = DatabaseManager()
-        self.video_stream_processor = VideoStreamProcessor(source=video_source)
-        self.human_detection_module = HumanDetectionModule()
-        self.target_tracking_module = TargetTrackingModule()
-        self.facial_recognition_module = FacialRecognitionModule(self.db_manager)
+        self._owns_shared = shared is None
+        if shared is None:
+            shared = SharedResources(recognition_workers=recognition_workers, ann_index_path=ann_index_path,
+                                     ann_nprobe=ann_nprobe, gallery_shards=gallery_shards,
+                                     shard_timeout=shard_timeout, gallery_precision=gallery_precision,
+                                     gallery_rerank=gallery_rerank, event_store_path=event_store_path,
+                                     detection_server=detection_server)
+        self.shared = shared
+        self.feed_name = feed_name
+        self._metrics_feed = feed_name or 'default'
+        self.fps = 0.0
+        self._last_frame_time = None
+        self.db_manager = shared.db_manager
+        # Frames from the threaded grabber live in a reusable buffer pool, so the pool must
+        # outlive every frame that can be in flight at once (queued in the pipeline, held by
+        # a stage, or still being painted by the GUI).
+        pool_size = 3 * queue_size + 6 if pipeline_mode else 5
+        self.video_stream_processor = VideoStreamProcessor(source=video_source, threaded=threaded_capture,
+                                                           pool_size=pool_size)
+        self.human_detection_module = shared.detector_for_feed()
+        self.target_tracking_module = TargetTrackingModule(mode=tracking_mode)
+        self.face_encoding_service = shared.face_encoding_service
+        self.facial_recognition_module = shared.facial_recognition_module
+        if not self._owns_shared:
+            # Per-track recognition state must not mix with other feeds' track IDs.
+            self.facial_recognition_module = self.facial_recognition_module.for_feed()
+        self.event_store = shared.event_store
+        on_identity = None
+        if self.event_store is not None:
+            on_identity = self._record_identification
+        self.identity_cache = IdentityCache(on_store=on_identity)
+        if detection_interval is None and tracking_mode == 'multi':
+            detection_interval = 1
+        self.detection_scheduler = DetectionScheduler(interval=detection_interval,
+                                                      latency_budget_ms=latency_budget_ms,
+                                                      min_confidence=min_tracking_confidence)
 
         # Initialize state variables
         self.is_tracking = False
         self.identified_person = None
+        self.active_tracks = []
+        self._frame_detections = None
+
+        self.pipeline = None
+        if pipeline_mode:
+            self.pipeline = PerceptionPipeline(
+                self.video_stream_processor,
+                self.human_detection_module,
+                self.target_tracking_module,
+                self.facial_recognition_module,
+                detection_scheduler=self.detection_scheduler,
+                identity_cache=self.identity_cache,
+                queue_size=queue_size,
+                drop_policy=drop_policy,
+                event_store=self.event_store,
+                feed_name=feed_name,
+            )
+        metrics.add_collector(self._collect_metrics)
         
         self.logger.info("ARCEngineCore initialized successfully.")
 
     def process_frame(self):
         """
         Processes a single frame from the video stream.
+
+        In pipeline mode this returns the newest frame completed by the pipeline
+        instead of processing one synchronously.
         """
-        status, frame = self.video_stream_processor.read_frame()
+        if self.pipeline is not None:
+            return self._process_pipeline_frame()
+
+        feed = self._metrics_feed
+        with metrics.time('capture', feed):
+            status, frame = self.video_stream_processor.read_frame()
         if not status:
             self.logger.warning("Failed to read frame from video stream.")
             return False, None, "Failed to read frame", None
 
+        start = time.perf_counter()
+        self._frame_detections = None
+        if self.target_tracking_module.mode == 'multi':
+            detected, message, name = self._process_multi_target_frame(frame)
+        else:
+            detected, message, name = self._process_single_target_frame(frame)
+        processing_ms = (time.perf_counter() - start) * 1000.0
+        self.detection_scheduler.record(detected, processing_ms)
+        if self.event_store is not None:
+            self.event_store.record_frame(self.video_stream_processor.last_seq, None, self._frame_detections,
+                                          self.target_tracking_module.current_tracks(), feed=self.feed_name)
+        metrics.observe('frame', processing_ms, feed)
+        self._update_fps()
+
+        return True, frame, message, name
+
+    def _update_fps(self):
+        now = time.perf_counter()
+        if self._last_frame_time is not None:
+            interval = now - self._last_frame_time
+            if interval > 0:
+                self.fps += 0.1 * (1.0 / interval - self.fps) if self.fps else 1.0 / interval
+        self._last_frame_time = now
+
+    def _process_single_target_frame(self, frame):
+        """
+        Acquires a target by detection, then follows it with the OpenCV tracker. While
+        tracking, the scheduler decides when to re-run detection to correct drift.
+
+        Returns:
+            tuple: Whether detection ran, the status message and the recognized name.
+        """
         message = "Status: Idle"
         name = None
+        detected = False
 
         if not self.is_tracking:
-            detections = self.human_detection_module.detect_humans(frame)
+            with metrics.time('detection', self._metrics_feed):
+                detections = self.human_detection_module.detect_humans(frame)
+            self._frame_detections = detections
+            detected = True
             if detections:
                 if self.target_tracking_module.select_target(frame, detections):
+                    self._prune_track_state({self.target_tracking_module.track_id})
                     self.is_tracking = True
                     message = "Status: Target Acquired"
                     self.logger.info("Target selected. Starting tracking.")
         else:
-            success, bbox = self.target_tracking_module.update_tracker(frame)
+            corrected = False
+            if self.detection_scheduler.should_detect(self.target_tracking_module.tracking_confidence()):
+                with metrics.time('detection', self._metrics_feed):
+                    detections = self.human_detection_module.detect_humans(frame)
+                self._frame_detections = detections
+                detected = True
+                corrected = self.target_tracking_module.correct_drift(frame, detections)
+
+            if corrected:
+                success, bbox = True, self.target_tracking_module.tracked_bbox
+            else:
+                with metrics.time('tracking', self._metrics_feed):
+                    success, bbox = self.target_tracking_module.update_tracker(frame)
             if success:
                 message = "Status: Tracking Target"
-                # Draw tracking box
-                p1 = (int(bbox[0]), int(bbox[1]))
-                p2 = (int(bbox[0] + bbox[2]), int(bbox[1] + bbox[3]))
-                cv2.rectangle(frame, p1, p2, (255, 0, 0), 2, 1)
 
                 # Facial recognition
-                tracked_bbox_xyxy = (int(bbox[0]), int(bbox[1]), int(bbox[0] + bbox[2]), int(bbox[1] + bbox[3]))
-                name, face_bbox = self.facial_recognition_module.recognize_face(frame, tracked_bbox_xyxy)
+                name, face_bbox = self._recognize_target(frame, bbox, self.target_tracking_module.track_id)
                 if name:
                     self.identified_person = name
                     message = f"Recognized: {name}"
                     self.logger.info(f"Recognized: {self.identified_person}")
-                    if face_bbox:
-                        cv2.rectangle(frame, (face_bbox[0], face_bbox[1]), (face_bbox[2], face_bbox[3]), (0, 255, 0), 2)
-                        cv2.putText(frame, name, (face_bbox[0], face_bbox[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                self._draw_annotations(frame, bbox, name, face_bbox)
             else:
                 self.logger.warning("Tracker update failed. Re-acquiring target.")
                 self.target_tracking_module.reacquire_target()
                 self.is_tracking = False
                 message = "Status: Target Lost, Re-acquiring"
 
-        return True, frame, message, name
+        return detected, message, name
+
+    def _process_multi_target_frame(self, frame):
+        """
+        Tracks every person in the frame and runs recognition on the primary target.
+        Detection runs on the frames picked by the scheduler; on the others the
+        tracks are propagated with their motion model.
+
+        Returns:
+            tuple: Whether detection ran, the status message and the recognized name.
+        """
+        detected = self.detection_scheduler.should_detect(self.target_tracking_module.tracking_confidence())
+        if detected:
+            with metrics.time('detection', self._metrics_feed):
+                boxes, scores = self.human_detection_module.detect_humans_batch([frame])[0]
+            self._frame_detections = (boxes, scores)
+            with metrics.time('tracking', self._metrics_feed):
+                self.active_tracks = self.target_tracking_module.update_tracks(boxes, scores)
+        else:
+            with metrics.time('tracking', self._metrics_feed):
+                self.active_tracks = self.target_tracking_module.update_tracks()
+        self._prune_track_state({track['track_id'] for track in self.active_tracks})
+        self.is_tracking = bool(self.active_tracks)
+        if not self.is_tracking:
+            return detected, "Status: Idle", None
+
+        message = f"Status: Tracking {len(self.active_tracks)} Targets"
+        bbox = self.target_tracking_module.tracked_bbox
+        name, face_bbox = self._recognize_target(frame, bbox, self.target_tracking_module.track_id)
+        if name:
+            self.identified_person = name
+            message = f"Recognized: {name}"
+            self.logger.info(f"Recognized: {self.identified_person}")
+
+        self._draw_tracks(frame, self.active_tracks)
+        self._draw_annotations(frame, bbox, name, face_bbox)
+        return detected, message, name
+
+    def _recognize_target(self, frame, bbox, track_id):
+        """
+        Recognizes the face of a tracked person, reusing the track's cached identity
+        while it is still fresh.
+
+        Args:
+            frame (numpy.ndarray): The current frame.
+            bbox (tuple): The track box (x, y, w, h).
+            track_id (int): The track ID.
+
+        Returns:
+            tuple: The recognized name and face bounding box, as returned by recognize_face.
+        """
+        cached = self.identity_cache.lookup(track_id, bbox)
+        if cached is not None:
+            return cached.name, cached.face_bbox_at(bbox)
+        with metrics.time('recognition', self._metrics_feed):
+            return self._recognize_uncached(frame, bbox, track_id)
+
+    def _recognize_uncached(self, frame, bbox, track_id):
+        tracked_bbox_xyxy = (max(0, int(bbox[0])), max(0, int(bbox[1])),
+                             int(bbox[0] + bbox[2]), int(bbox[1] + bbox[3]))
+        if self.face_encoding_service is not None:
+            # Recognize in the background and show the last known identity meanwhile.
+            track_bbox = tuple(bbox)
+
+            def _on_recognized(tid, name, face_bbox, distance):
+                if name:
+                    self.identity_cache.store(tid, track_bbox, name, distance, face_bbox)
+
+            self.facial_recognition_module.recognize_face_async(frame, tracked_bbox_xyxy, track_id, _on_recognized)
+            stale = self.identity_cache.peek(track_id)
+            if stale is None:
+                return None, None
+            return stale.name, stale.face_bbox_at(bbox)
+
+        name, face_bbox, distance = self.facial_recognition_module.recognize_face_with_distance(
+            frame, tracked_bbox_xyxy, track_id=track_id)
+        if name:
+            self.identity_cache.store(track_id, bbox, name, distance, face_bbox)
+        return name, face_bbox
+
+    def _record_identification(self, track_id, name, distance, face_bbox, timestamp):
+        self.event_store.record_identification(track_id, name, distance, face_bbox, timestamp, feed=self.feed_name)
+
+    def _prune_track_state(self, active_track_ids):
+        """
+        Drops per-track recognition state of tracks that are no longer active.
+        """
+        self.identity_cache.prune(active_track_ids)
+        if self.facial_recognition_module.quality_gate is not None:
+            self.facial_recognition_module.quality_gate.prune(active_track_ids)
+
+    def _process_pipeline_frame(self):
+        """
+        Fetches the newest completed frame from the perception pipeline.
+        """
+        self.pipeline.start()
+        packet = self.pipeline.get_result(timeout=1.0)
+        if packet is None:
+            return True, None, "Status: Waiting for frames", None
+        if not packet.status:
+            return False, None, "Failed to read frame", None
+
+        self.is_tracking = packet.bbox is not None
+        self.active_tracks = packet.tracks or []
+        self._draw_tracks(packet.frame, self.active_tracks)
+        if packet.bbox is not None:
+            self._draw_annotations(packet.frame, packet.bbox, packet.name, packet.face_bbox)
+        if packet.name:
+            self.identified_person = packet.name
+        # Capture to display, including time spent waiting in the stage queues.
+        metrics.observe('end_to_end', (time.time() - packet.timestamp) * 1000.0, self._metrics_feed)
+        self._update_fps()
+        return True, packet.frame, packet.message, packet.name
+
+    def reload_watchlist(self):
+        """
+        Picks up faces added to or removed from the database since startup.
+
+        Only the changed rows are read; cached identities are dropped so that every
+        track is matched against the updated watchlist.
+
+        Returns:
+            tuple: (added, removed) the number of faces added and removed.
+        """
+        added, removed = self.facial_recognition_module.refresh_known_faces()
+        if added or removed:
+            self.identity_cache.prune([])
+        return added, removed
+
+    def _collect_metrics(self):
+        """
+        Exports get_stats() and the FPS as gauges labelled with the feed.
+        """
+        labels = (('feed', self._metrics_feed),)
+        gauges = flatten_stats(self.get_stats(), labels=labels)
+        gauges[('arc_fps', labels)] = self.fps
+        return gauges
+
+    def get_stats(self):
+        """
+        Returns runtime statistics of the engine.
+
+        Returns:
+            dict: Detection cadence and time saved, video stream counters, identity
+                  cache hit rate and encodes saved, face quality gate counters and
+                  per-track quality and, in pipeline mode, per-stage throughput and
+                  queue statistics.
+        """
+        stats = {
+            'detection': self.detection_scheduler.stats(),
+            'video': self.video_stream_processor.stats(),
+            'identity_cache': self.identity_cache.stats(),
+        }
+        quality_gate = self.facial_recognition_module.quality_gate
+        if quality_gate is not None:
+            stats['face_quality'] = quality_gate.stats()
+            stats['face_quality']['tracks'] = {
+                track_id: quality_gate.get_track_quality(track_id) for track_id in list(quality_gate.track_quality)
+            }
+        if self.pipeline is not None:
+            stats['pipeline'] = self.pipeline.stats()
+        if isinstance(self.human_detection_module, DetectionClient):
+            stats['detection_server'] = self.human_detection_module.stats()
+        stats.update(self.shared.stats())
+        return stats
+
+    def _draw_annotations(self, frame, bbox, name, face_bbox):
+        """
+        Draws the tracking box and, if available, the recognized face onto the frame.
+
+        Args:
+            frame (numpy.ndarray): The frame to draw on.
+            bbox (tuple): The tracked bounding box (x, y, w, h).
+            name (str or None): The recognized name.
+            face_bbox (tuple or None): The face bounding box (x1, y1, x2, y2).
+        """
+        p1 = (int(bbox[0]), int(bbox[1]))
+        p2 = (int(bbox[0] + bbox[2]), int(bbox[1] + bbox[3]))
+        cv2.rectangle(frame, p1, p2, (255, 0, 0), 2, 1)
+        if name and face_bbox:
+            cv2.rectangle(frame, (face_bbox[0], face_bbox[1]), (face_bbox[2], face_bbox[3]), (0, 255, 0), 2)
+            cv2.putText(frame, name, (face_bbox[0], face_bbox[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+    def _draw_tracks(self, frame, tracks):
+        """
+        Draws every active track with its track ID onto the frame.
+
+        Args:
+            frame (numpy.ndarray): The frame to draw on.
+            tracks (list): Tracks as returned by TargetTrackingModule.update_tracks.
+        """
+        for track in tracks:
+            x1, y1, x2, y2 = (int(v) for v in track['box'])
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 255, 0), 1)
+            cv2.putText(frame, f"ID {track['track_id']}", (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 0), 1)
+
+    def run(self, max_frames=None, on_frame=None):
+        """
+        Processes frames headlessly until the video stream ends.
+
+        Args:
+            max_frames (int or None): Stop after this many processed frames.
+            on_frame (callable or None): Called with (frame, message, name) for every processed frame.
+
+        Returns:
+            int: The number of frames processed.
+        """
+        frames = 0
+        while max_frames is None or frames < max_frames:
+            status, frame, message, name = self.process_frame()
+            if not status:
+                break
+            if frame is None:
+                continue
+            frames += 1
+            if on_frame is not None:
+                on_frame(frame, message, name)
+        return frames
 
     def shutdown(self):
         """
         Gracefully shuts down the ARC engine, releasing resources.
         """
         self.logger.info("Shutting down ARCEngineCore.")
+        metrics.remove_collector(self._collect_metrics)
+        if self.pipeline is not None:
+            self.pipeline.stop()
         self.video_stream_processor.release()
-        self.db_manager.close_connection()
+        if isinstance(self.human_detection_module, DetectionClient):
+            self.human_detection_module.close()
+        if self._owns_shared:
+            self.shared.shutdown()
         # cv2.destroyAllWindows() is removed as GUI handles windows
         self.logger.info("ARCEngineCore shutdown complete.")
 
 if __name__ == '__main__':
     # This is for testing purposes.
-    # It allows running this module directly to test the core engine.
-    engine = ARCEngineCore(video_source=0)
-    engine.run()
\ No newline at end of file
+    # It allows running this module directly to test the core engine, headless:
+    #     python -m arc_engine.arc_engine_core [video_source]
+    # For fast processing of recorded footage, see arc_engine.offline_processor.
+    import json
+    import sys
+    source = sys.argv[1] if len(sys.argv) > 1 else 0
+    engine = ARCEngineCore(video_source=int(source) if str(source).isdigit() else source)
+    try:
+        frames = engine.run()
+        print(f"Processed {frames} frames.")
+        print(json.dumps(engine.get_stats(), indent=2, default=str))
+    finally:
+        engine.shutdown()
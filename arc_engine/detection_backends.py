@@ -0,0 +1,72 @@
+import os
+from ultralytics import YOLO
+from utils.logger import logger
+
+# Inference backends for person detection. 'pytorch' runs the original weights
+# eagerly; the others run a model exported once by ultralytics and cached next
+# to the source weights.
+DETECTION_BACKENDS = {
+    'pytorch': None,
+    'onnx': {'format': 'onnx', 'suffix': '.onnx'},
+    'openvino': {'format': 'openvino', 'suffix': '_openvino_model'},
+}
+
+
+def is_exported_backend(backend):
+    """
+    Returns True if the backend runs an exported (fixed input size) model.
+    """
+    return DETECTION_BACKENDS[backend] is not None
+
+
+def prepare_weights(model_path, backend='pytorch', imgsz=640, int8=False, batch=1):
+    """
+    Returns the path of the weights to load for a backend, exporting them if needed.
+
+    Args:
+        model_path (str): The path to the PyTorch YOLOv8 weights.
+        backend (str): One of the keys of DETECTION_BACKENDS.
+        imgsz (int): The fixed square input size of the exported model.
+        int8 (bool): Whether to use INT8 quantized weights.
+        batch (int): The fixed batch size of the exported model.
+
+    Returns:
+        str: The path to pass to YOLO().
+    """
+    if backend not in DETECTION_BACKENDS:
+        raise ValueError(f"Unknown detection backend '{backend}'. Expected one of {list(DETECTION_BACKENDS)}.")
+    if not is_exported_backend(backend):
+        return model_path
+
+    spec = DETECTION_BACKENDS[backend]
+    stem = os.path.splitext(model_path)[0]
+    tag = f"_{imgsz}_b{batch}" + ("_int8" if int8 else "")
+    target = f"{stem}{tag}{spec['suffix']}"
+    if os.path.exists(target):
+        return target
+
+    logger.info(f"Exporting {model_path} to {backend} (imgsz={imgsz}, batch={batch}, int8={int8})...")
+    if backend == 'onnx':
+        exported = YOLO(model_path).export(format='onnx', imgsz=imgsz, batch=batch, dynamic=False)
+        if int8:
+            _quantize_onnx(exported, target)
+        else:
+            os.replace(exported, target)
+    else:
+        # OpenVINO export runs NNCF post-training quantization when int8 is set.
+        exported = YOLO(model_path).export(format=spec['format'], imgsz=imgsz, batch=batch, int8=int8)
+        os.replace(exported, target)
+    logger.info(f"Exported {backend} model to {target}")
+    return target
+
+
+def _quantize_onnx(source, target):
+    """
+    Writes a dynamically INT8-quantized copy of an ONNX model.
+    """
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise ImportError("INT8 ONNX models require the 'onnxruntime' package.") from e
+    quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+    os.remove(source)
@@ -0,0 +1,126 @@
+import math
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class DetectionScheduler:
+    """
+    Decides on which frames the (expensive) person detector runs.
+
+    Detection runs every `interval` frames, or immediately when the tracker's
+    confidence drops below a threshold; the frames in between are handled by
+    cheap tracker updates or motion propagation. When a per-frame latency budget
+    is configured, the interval is adapted so that the average frame cost, with
+    detection amortized over the interval, stays within the budget.
+    """
+    def __init__(self, interval=1, latency_budget_ms=None, min_confidence=0.3,
+                 min_interval=1, max_interval=30, smoothing=0.1):
+        """
+        Initializes the DetectionScheduler.
+
+        Args:
+            interval (int or None): Run detection every `interval` frames. None disables
+                periodic detection, so it only runs when confidence drops.
+            latency_budget_ms (float or None): Target average per-frame cost. If set,
+                the interval is adapted to it and `interval` is only the starting value.
+            min_confidence (float): Detection is forced when the tracker confidence falls below this.
+            min_interval (int): Lower bound for the adapted interval.
+            max_interval (int): Upper bound for the adapted interval.
+            smoothing (float): Weight of the newest sample in the frame cost moving averages.
+        """
+        self.interval = interval
+        self.latency_budget_ms = latency_budget_ms
+        self.min_confidence = min_confidence
+        self.min_interval = max(1, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.smoothing = smoothing
+        if latency_budget_ms is not None and interval is None:
+            self.interval = self.min_interval
+
+        self.frames_since_detection = 0
+        self.detection_frames = 0
+        self.propagation_frames = 0
+        self.forced_detections = 0
+        self.time_saved_ms = 0.0
+        # Moving averages of the whole-frame cost with and without detection.
+        self.detection_cost_ms = None
+        self.propagation_cost_ms = None
+
+    def should_detect(self, tracker_confidence=None):
+        """
+        Returns True if detection should run on the current frame.
+
+        Args:
+            tracker_confidence (float or None): The tracker's current confidence in [0, 1].
+        """
+        if tracker_confidence is not None and tracker_confidence < self.min_confidence:
+            self.forced_detections += 1
+            return True
+        if self.interval is None:
+            return False
+        return self.frames_since_detection + 1 >= self.interval
+
+    def record(self, detected, elapsed_ms):
+        """
+        Records the cost of a processed frame and adapts the interval.
+
+        Args:
+            detected (bool): Whether detection ran on the frame.
+            elapsed_ms (float): The total processing time of the frame.
+        """
+        if detected:
+            self.detection_frames += 1
+            self.frames_since_detection = 0
+            self.detection_cost_ms = self._smooth(self.detection_cost_ms, elapsed_ms)
+        else:
+            self.propagation_frames += 1
+            self.frames_since_detection += 1
+            self.propagation_cost_ms = self._smooth(self.propagation_cost_ms, elapsed_ms)
+            if self.detection_cost_ms is not None:
+                self.time_saved_ms += max(0.0, self.detection_cost_ms - elapsed_ms)
+
+        if self.latency_budget_ms is not None:
+            self._adapt_interval()
+
+    def stats(self):
+        """
+        Returns the chosen cadence and the estimated time saved by skipping detection.
+        """
+        frames = self.detection_frames + self.propagation_frames
+        return {
+            'detection_interval': self.interval,
+            'latency_budget_ms': self.latency_budget_ms,
+            'detection_frames': self.detection_frames,
+            'propagation_frames': self.propagation_frames,
+            'forced_detections': self.forced_detections,
+            'detection_ratio': self.detection_frames / frames if frames else 0.0,
+            'detection_cost_ms': self.detection_cost_ms,
+            'propagation_cost_ms': self.propagation_cost_ms,
+            'time_saved_ms': self.time_saved_ms,
+        }
+
+    def _smooth(self, average, sample):
+        if average is None:
+            return sample
+        return (1.0 - self.smoothing) * average + self.smoothing * sample
+
+    def _adapt_interval(self):
+        """
+        Picks the smallest interval N whose amortized cost,
+        (detection + (N - 1) * propagation) / N, fits in the latency budget.
+        """
+        if self.detection_cost_ms is None:
+            return
+        budget = self.latency_budget_ms
+        propagation = self.propagation_cost_ms or 0.0
+        if self.detection_cost_ms <= budget:
+            interval = self.min_interval
+        elif propagation >= budget:
+            interval = self.max_interval
+        else:
+            interval = math.ceil((self.detection_cost_ms - propagation) / (budget - propagation))
+        interval = min(self.max_interval, max(self.min_interval, interval))
+        if interval != self.interval:
+            logger.debug(f"Detection interval adapted from {self.interval} to {interval} frames.")
+            self.interval = interval
@@ -0,0 +1,583 @@
+"""
+A local person detection server shared by several engines or processes.
+
+The server process owns the detection model. Each DetectionClient allocates
+two shared memory rings, one of frame slots and one of result slots, and
+registers them with the server; afterwards only small (request, slot, size)
+tuples cross the connection, never the pixels or the boxes. The server
+batches requests from all clients, waiting at most max_wait_ms for a batch
+to fill, so several feeds share one model call per batch.
+
+DetectionClient has the detect_humans / detect_humans_batch interface of
+HumanDetectionModule and can replace it in ARCEngineCore.
+
+A DetectionServer started by the engine uses a random authentication key.
+A standalone server and the clients connecting to it take theirs from
+--authkey or the ARC_DETECTION_AUTHKEY environment variable; the server
+refuses to listen on a non-loopback address without one.
+
+Usage (standalone server):
+    python -m arc_engine.detection_server --port 7400 --max-batch 8 --max-wait-ms 4
+"""
+import argparse
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import AuthenticationError, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+import cv2
+import numpy as np
+from utils.authkeys import authkey_from_env, is_loopback, new_authkey, server_authkey
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+AUTHKEY_ENV = 'ARC_DETECTION_AUTHKEY'
+PERSON_CLASS_ID = 0
+_RESULT_FIELDS = 5  # x1, y1, x2, y2, score
+
+
+def _open_shared_memory(name):
+    """
+    Opens a client's shared memory block without letting this process's
+    resource tracker unlink it when the server exits; the client owns it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class _AttachedClient:
+    """
+    The server's view of one client: its connection and shared memory rings.
+    """
+    def __init__(self, conn, frames_name, frame_bytes, results_name, num_slots, max_detections):
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.frame_bytes = frame_bytes
+        self.num_slots = num_slots
+        self.max_detections = max_detections
+        self.frames = _open_shared_memory(frames_name)
+        if self.frames.size < num_slots * frame_bytes:
+            self.frames.close()
+            raise ValueError("The frame ring is smaller than its slots.")
+        self.results_shm = _open_shared_memory(results_name)
+        self.results = np.ndarray((num_slots, max_detections, _RESULT_FIELDS), dtype=np.float32,
+                                  buffer=self.results_shm.buf)
+        self.closed = False
+
+    def valid_request(self, slot, height, width):
+        """
+        Returns whether a frame of this size fits into the given slot.
+        """
+        if not all(isinstance(v, int) and not isinstance(v, bool) for v in (slot, height, width)):
+            return False
+        return 0 <= slot < self.num_slots and height > 0 and width > 0 and height * width * 3 <= self.frame_bytes
+
+    def frame(self, slot, height, width):
+        return np.ndarray((height, width, 3), dtype=np.uint8, buffer=self.frames.buf,
+                          offset=slot * self.frame_bytes)
+
+    def send(self, message):
+        if self.closed:
+            return
+        try:
+            with self.send_lock:
+                self.conn.send(message)
+        except (OSError, EOFError):
+            self.closed = True
+
+    def release(self):
+        del self.results
+        self.results_shm.close()
+        self.frames.close()
+
+
+def _serve_detection(listener, detector, max_batch, max_wait):
+    """
+    Serves detection requests from every client that connects to `listener`
+    until a client sends 'shutdown'.
+    """
+    pending = queue.Queue()
+    stats = {'clients': 0, 'batches': 0, 'frames': 0, 'inference_ms': 0.0}
+
+    def _client_loop(conn):
+        client = None
+        try:
+            while True:
+                message = conn.recv()
+                if message is None:
+                    break
+                command = message[0]
+                if command == 'detect':
+                    if client is None:
+                        logger.warning("Closing a detection connection that sent frames before attaching.")
+                        break
+                    # Checked here, so that a bad request closes only this client's
+                    # connection instead of failing in the batching loop shared by all.
+                    _, request_id, slot, height, width = message
+                    if not client.valid_request(slot, height, width):
+                        logger.warning(f"Closing a detection connection that sent an invalid frame "
+                                       f"(slot {slot!r}, {width!r}x{height!r}).")
+                        break
+                    pending.put((client, request_id, slot, height, width))
+                elif command == 'attach':
+                    client = _AttachedClient(conn, *message[1:])
+                    stats['clients'] += 1
+                    client.send(('attached',))
+                elif command == 'stats':
+                    snapshot = dict(stats)
+                    snapshot['mean_batch_size'] = stats['frames'] / stats['batches'] if stats['batches'] else 0.0
+                    snapshot['mean_inference_ms'] = (stats['inference_ms'] / stats['batches']
+                                                     if stats['batches'] else 0.0)
+                    reply = ('stats', message[1], snapshot)
+                    if client is not None:
+                        client.send(reply)
+                    else:
+                        conn.send(reply)
+                elif command == 'shutdown':
+                    pending.put(None)
+                    break
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            # A malformed message; drop the client rather than leave its connection open.
+            logger.warning(f"Closing a detection connection after a bad message: {e!r}")
+        if client is not None:
+            client.closed = True
+            # The batcher may still hold views of the client's frames; it releases them.
+            pending.put(('detach', client))
+            stats['clients'] -= 1
+        conn.close()
+
+    def _accept_loop():
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError as e:
+                logger.warning(f"Rejected a detection client: {e}")
+                continue
+            except OSError:
+                return
+            threading.Thread(target=_client_loop, args=(conn,), name="arc-detection-client", daemon=True).start()
+
+    threading.Thread(target=_accept_loop, name="arc-detection-accept", daemon=True).start()
+
+    while True:
+        request = pending.get()
+        if request is None:
+            return
+        batch = [request]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                pending.put(None)
+                break
+            batch.append(request)
+
+        detaches = [request[1] for request in batch if request[0] == 'detach']
+        batch = [request for request in batch if request[0] != 'detach' and not request[0].closed]
+        if batch:
+            frames = [client.frame(slot, height, width) for client, _, slot, height, width in batch]
+            start = time.perf_counter()
+            try:
+                results = detector.detect_humans_batch(frames)
+                error = None
+            except Exception as e:
+                results, error = None, e
+            del frames
+            stats['inference_ms'] += (time.perf_counter() - start) * 1000.0
+            stats['batches'] += 1
+            stats['frames'] += len(batch)
+
+            for i, (client, request_id, slot, _, _) in enumerate(batch):
+                if error is not None:
+                    client.send(('error', request_id, repr(error)))
+                    continue
+                boxes, scores = results[i]
+                count = min(len(scores), client.max_detections)
+                client.results[slot, :count, :4] = boxes[:count]
+                client.results[slot, :count, 4] = scores[:count]
+                client.send(('done', request_id, count, len(batch)))
+        for client in detaches:
+            client.release()
+
+
+def _create_detector(detector_factory, detector_kwargs):
+    if detector_factory is not None:
+        return detector_factory(**detector_kwargs)
+    from arc_engine.human_detection_module import HumanDetectionModule
+    return HumanDetectionModule(**detector_kwargs)
+
+
+def _server_process(bootstrap, address, authkey, max_batch, max_wait, detector_factory, detector_kwargs):
+    """
+    Entry point of a locally spawned server: loads the model, then reports the
+    listening address over the bootstrap pipe.
+    """
+    detector = _create_detector(detector_factory, detector_kwargs)
+    with Listener(address, authkey=authkey) as listener:
+        bootstrap.send(listener.address)
+        bootstrap.close()
+        _serve_detection(listener, detector, max_batch, max_wait)
+
+
+class DetectionServer:
+    """
+    Starts a detection server in a separate process and hands out clients.
+
+    The model is loaded in the server process, so the engines' processes
+    never import the inference framework and its thread pools do not compete
+    with tracking, recognition and the GUI.
+    """
+    def __init__(self, max_batch=8, max_wait_ms=4.0, address=('127.0.0.1', 0), authkey=None,
+                 detector_factory=None, startup_timeout=300.0, **detector_kwargs):
+        """
+        Starts the server process and waits until its model is loaded.
+
+        Args:
+            max_batch (int): The maximum number of frames per model call.
+            max_wait_ms (float): How long the server waits for a batch to fill once
+                the first frame of a batch has arrived.
+            address (tuple): The (host, port) to listen on; port 0 picks a free one.
+            authkey (bytes or None): The authentication key of client connections. By
+                default a random key, which connect() hands to the clients; listening
+                on a non-loopback address requires an explicit key.
+            detector_factory (callable or None): Creates the detector in the server
+                process from detector_kwargs. Defaults to HumanDetectionModule.
+            startup_timeout (float): Seconds to wait for the model to load.
+            **detector_kwargs: Arguments of the detector, e.g. model_path and backend.
+        """
+        if authkey is None:
+            if not is_loopback(address[0]):
+                raise ValueError(f"Listening on {address[0]} requires an explicit authkey.")
+            authkey = new_authkey()
+        self.authkey = authkey
+        self.max_batch = max(1, max_batch)
+        if detector_factory is None:
+            # Exported backends have a fixed batch size; make it the server's batch.
+            detector_kwargs.setdefault('batch_size', self.max_batch)
+        context = mp.get_context('spawn')
+        parent, child = context.Pipe()
+        self._process = context.Process(target=_server_process, name="arc-detection-server", daemon=True,
+                                        args=(child, address, authkey, self.max_batch, max_wait_ms / 1000.0,
+                                              detector_factory, detector_kwargs))
+        self._process.start()
+        child.close()
+        if not parent.poll(startup_timeout):
+            self._process.terminate()
+            raise TimeoutError("The detection server did not start in time.")
+        try:
+            self.address = parent.recv()
+        except EOFError:
+            raise RuntimeError("The detection server exited during startup.") from None
+        parent.close()
+        logger.info(f"Detection server listening on {self.address} (batch {self.max_batch}, "
+                    f"wait {max_wait_ms} ms).")
+
+    def connect(self, **kwargs):
+        """
+        Returns a new DetectionClient of this server.
+
+        Args:
+            **kwargs: DetectionClient arguments (num_slots, max_frame_size, ...).
+        """
+        return DetectionClient(self.address, authkey=self.authkey, **kwargs)
+
+    def shutdown(self, timeout=2.0):
+        """
+        Stops the server process.
+        """
+        if not self._process.is_alive():
+            return
+        try:
+            with Client(self.address, authkey=self.authkey) as conn:
+                conn.send(('shutdown',))
+        except OSError:
+            pass
+        self._process.join(timeout=timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+        logger.info("Detection server shut down.")
+
+
+class DetectionClient:
+    """
+    Sends frames to a detection server through shared memory.
+
+    Frames are copied (and downscaled if larger than max_frame_size) into one
+    of `num_slots` frame slots; the server writes the boxes into the matching
+    result slot. A slot is reused only after the server has answered, so up to
+    `num_slots` frames can be in flight. The client is thread-safe.
+    """
+    def __init__(self, address, authkey=None, num_slots=4, max_frame_size=(1920, 1080),
+                 max_detections=300, timeout=1.0):
+        """
+        Allocates the shared memory rings and registers them with the server.
+
+        Args:
+            address (tuple): The server's (host, port).
+            authkey (bytes or None): The authentication key of the server; by default the
+                key set in ARC_DETECTION_AUTHKEY.
+            num_slots (int): The number of frames that can be in flight at once.
+            max_frame_size (tuple): (width, height) of a frame slot. Larger frames are
+                downscaled into the slot and their boxes scaled back.
+            max_detections (int): The maximum number of boxes returned per frame.
+            timeout (float): Seconds to wait for a free slot and for the server's answer.
+        """
+        if authkey is None:
+            authkey = authkey_from_env(AUTHKEY_ENV)
+            if authkey is None:
+                raise ValueError(f"Connecting to a detection server requires an authkey or {AUTHKEY_ENV}.")
+        self.num_slots = num_slots
+        self.max_width, self.max_height = max_frame_size
+        self.max_detections = max_detections
+        self.timeout = timeout
+        self._frame_bytes = self.max_width * self.max_height * 3
+        self._frames = shared_memory.SharedMemory(create=True, size=num_slots * self._frame_bytes)
+        self._results_shm = shared_memory.SharedMemory(
+            create=True, size=num_slots * max_detections * _RESULT_FIELDS * 4)
+        self._results = np.ndarray((num_slots, max_detections, _RESULT_FIELDS), dtype=np.float32,
+                                   buffer=self._results_shm.buf)
+        self._free_slots = queue.Queue()
+        for slot in range(num_slots):
+            self._free_slots.put(slot)
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._closed = False
+
+        self.requests = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._round_trip_ms = 0.0
+        self._completed = 0
+        self._batched_with = 0
+
+        self._conn = Client(tuple(address), authkey=authkey)
+        self._conn.send(('attach', self._frames.name, self._frame_bytes, self._results_shm.name,
+                         num_slots, max_detections))
+        if self._conn.recv() != ('attached',):
+            raise ConnectionError("The detection server refused the client.")
+        self._receiver = threading.Thread(target=self._receive_loop, name="arc-detection-receiver", daemon=True)
+        self._receiver.start()
+
+    def submit(self, frame):
+        """
+        Sends a frame to the server without waiting for the result.
+
+        Args:
+            frame (numpy.ndarray): The BGR frame. It is copied before this call returns.
+
+        Returns:
+            Future or None: A future resolving to (boxes, scores) as returned by
+                            HumanDetectionModule.detect_humans_batch, or None if no
+                            slot became free within the timeout.
+        """
+        if self._closed:
+            return None
+        try:
+            slot = self._free_slots.get(timeout=self.timeout)
+        except queue.Empty:
+            self.rejected += 1
+            return None
+
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.max_width / width, self.max_height / height)
+        if scale < 1.0:
+            width, height = max(1, int(width * scale)), max(1, int(height * scale))
+        target = np.ndarray((height, width, 3), dtype=np.uint8, buffer=self._frames.buf,
+                            offset=slot * self._frame_bytes)
+        if scale < 1.0:
+            cv2.resize(frame, (width, height), dst=target, interpolation=cv2.INTER_AREA)
+        else:
+            target[...] = frame
+        del target
+
+        future = Future()
+        request_id = next(self._request_ids)
+        with self._lock:
+            self._futures[request_id] = (future, slot, scale, time.perf_counter())
+        self.requests += 1
+        try:
+            self._send(('detect', request_id, slot, height, width))
+        except (OSError, EOFError) as e:
+            self._fail(request_id, ConnectionError(f"Detection server connection lost: {e}"))
+        return future
+
+    def detect_humans_batch(self, frames):
+        """
+        Detects humans in several frames; see HumanDetectionModule.detect_humans_batch.
+
+        Frames whose result does not arrive within the timeout get no detections.
+        """
+        futures = [self.submit(frame) for frame in frames]
+        batch = []
+        for future in futures:
+            try:
+                if future is None:
+                    raise FutureTimeout()
+                batch.append(future.result(timeout=self.timeout))
+            except FutureTimeout:
+                self.timeouts += 1
+                batch.append(_empty_detections())
+            except Exception as e:
+                logger.error(f"Remote detection failed: {e}")
+                batch.append(_empty_detections())
+        return batch
+
+    def detect_humans(self, frame):
+        """
+        Detects humans in a single frame; see HumanDetectionModule.detect_humans.
+        """
+        boxes, scores = self.detect_humans_batch([frame])[0]
+        return [
+            {'box': box, 'confidence': confidence, 'class_id': PERSON_CLASS_ID}
+            for box, confidence in zip(boxes.tolist(), scores.tolist())
+        ]
+
+    def stats(self):
+        """
+        Returns the client's counters and the server's batching statistics.
+        """
+        stats = {
+            'requests': self.requests,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'in_flight': self.num_slots - self._free_slots.qsize(),
+            'mean_round_trip_ms': self._round_trip_ms / self._completed if self._completed else 0.0,
+            'mean_batch_size': self._batched_with / self._completed if self._completed else 0.0,
+        }
+        future = Future()
+        request_id = next(self._request_ids)
+        with self._lock:
+            self._futures[request_id] = (future, None, None, None)
+        try:
+            self._send(('stats', request_id))
+            stats['server'] = future.result(timeout=self.timeout)
+        except Exception:
+            with self._lock:
+                self._futures.pop(request_id, None)
+        return stats
+
+    def close(self):
+        """
+        Disconnects from the server and releases the shared memory.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._send(None)
+        except (OSError, EOFError):
+            pass
+        self._receiver.join(timeout=self.timeout)
+        self._conn.close()
+        del self._results
+        self._results_shm.close()
+        self._results_shm.unlink()
+        self._frames.close()
+        self._frames.unlink()
+
+    def _send(self, message):
+        with self._send_lock:
+            self._conn.send(message)
+
+    def _fail(self, request_id, error):
+        with self._lock:
+            entry = self._futures.pop(request_id, None)
+        if entry is None:
+            return
+        future, slot = entry[0], entry[1]
+        if slot is not None:
+            self._free_slots.put(slot)
+        if future.set_running_or_notify_cancel():
+            future.set_exception(error)
+
+    def _receive_loop(self):
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            kind, request_id = message[0], message[1]
+            if kind == 'stats':
+                with self._lock:
+                    entry = self._futures.pop(request_id, None)
+                if entry is not None and entry[0].set_running_or_notify_cancel():
+                    entry[0].set_result(message[2])
+                continue
+            if kind == 'error':
+                self._fail(request_id, RuntimeError(message[2]))
+                continue
+
+            _, _, count, batch_size = message
+            with self._lock:
+                entry = self._futures.pop(request_id, None)
+            if entry is None:
+                continue
+            future, slot, scale, sent = entry
+            rows = self._results[slot, :count]
+            boxes = rows[:, :4].copy()
+            scores = rows[:, 4].copy()
+            self._free_slots.put(slot)
+            if scale < 1.0:
+                boxes /= scale
+            self._round_trip_ms += (time.perf_counter() - sent) * 1000.0
+            self._batched_with += batch_size
+            self._completed += 1
+            if future.set_running_or_notify_cancel():
+                future.set_result((boxes, scores))
+
+        with self._lock:
+            pending = list(self._futures)
+        for request_id in pending:
+            self._fail(request_id, ConnectionError("Detection server connection closed."))
+
+
+def _empty_detections():
+    return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--authkey', help=f"Key clients authenticate with (default: ${AUTHKEY_ENV}).")
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=4.0)
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--backend', default='pytorch', choices=['pytorch', 'onnx', 'openvino'])
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--int8', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        authkey, generated = server_authkey(args.host, args.authkey, AUTHKEY_ENV)
+    except ValueError as e:
+        parser.error(str(e))
+    if generated:
+        print(f"{AUTHKEY_ENV}={authkey.decode()}", flush=True)
+    detector = _create_detector(None, {'model_path': args.model, 'backend': args.backend, 'imgsz': args.imgsz,
+                                       'int8': args.int8, 'batch_size': args.max_batch})
+    with Listener((args.host, args.port), authkey=authkey) as listener:
+        logger.info(f"Detection server listening on {listener.address}.")
+        _serve_detection(listener, detector, max(1, args.max_batch), args.max_wait_ms / 1000.0)
+
+
+if __name__ == '__main__':
+    main()
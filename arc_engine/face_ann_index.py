@@ -0,0 +1,375 @@
+import json
+import os
+import threading
+import numpy as np
+from scipy import sparse
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class IVFFaceIndex:
+    """
+    An approximate nearest-neighbour index (IVF, inverted file) for very large
+    galleries of face encodings, with the same interface as FaceGalleryIndex.
+
+    The encodings are clustered with k-means into `nlist` cells and stored
+    contiguously cell by cell. A query is compared with the cell centroids and
+    only the encodings in its `nprobe` nearest cells are scanned; those
+    candidates are re-ranked with exact Euclidean distances, so the results are
+    exact whenever the true neighbours fall in the probed cells. Raising nprobe
+    trades speed for recall.
+
+    Entries added after the index was built go to an unclustered tail that is
+    always scanned in full, and removed entries are masked out; `compact`
+    reassigns both into the cells. On disk the index is a directory of .npy
+    files that are memory-mapped on load.
+    """
+    train_points_per_cell = 32
+    train_iterations = 10
+
+    def __init__(self, dim=128, nlist=None, nprobe=16, max_tail=50000):
+        """
+        Initializes an empty IVFFaceIndex. Call `build` or `load` before searching.
+
+        Args:
+            dim (int): The dimensionality of the face encodings.
+            nlist (int or None): The number of cells. Defaults to about 4 * sqrt(N) at build time.
+            nprobe (int): The number of cells scanned per query.
+            max_tail (int): The number of entries added since the last build after which
+                the tail is folded into the cells.
+        """
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.max_tail = max_tail
+        self._lock = threading.RLock()
+        self._centroids = np.empty((0, dim), dtype=np.float32)
+        self._reset(np.empty((0, dim), dtype=np.float32), np.empty((0,), dtype=np.int64), [], [])
+        self.queries = 0
+        self.candidates_scanned = 0
+
+    def __len__(self):
+        return len(self.names) - self._num_deleted
+
+    @property
+    def indexed_size(self):
+        return len(self._vectors)
+
+    def build(self, names, encodings, entry_ids=None, seed=0):
+        """
+        Clusters the encodings and (re)builds the index from scratch.
+
+        Args:
+            names (list): The name of each entry.
+            encodings (numpy.ndarray): An (N, dim) array of encodings.
+            entry_ids (list or None): Stable IDs for the entries. Defaults to 0..N-1.
+            seed (int): The k-means random seed.
+        """
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if entry_ids is None:
+            entry_ids = np.arange(len(encodings))
+        entry_ids = np.asarray(entry_ids, dtype=np.int64)
+        if len(names) != len(encodings) or len(entry_ids) != len(encodings):
+            raise ValueError(f"Got {len(names)} names and {len(entry_ids)} IDs for {len(encodings)} encodings.")
+
+        nlist = self.nlist or int(4 * np.sqrt(len(encodings)))
+        nlist = max(1, min(nlist, len(encodings)))
+        if len(encodings) == 0:
+            centroids = np.empty((0, self.dim), dtype=np.float32)
+        else:
+            # A few dozen points per cell are enough to place the centroids.
+            rng = np.random.default_rng(seed)
+            sample_size = min(len(encodings), self.train_points_per_cell * nlist)
+            sample = encodings[rng.choice(len(encodings), sample_size, replace=False)] \
+                if sample_size < len(encodings) else encodings
+            centroids = _kmeans(sample, nlist, self.train_iterations, rng)
+        with self._lock:
+            self._centroids = centroids
+            self._centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+            self._index(names, encodings, entry_ids)
+        logger.info(f"Built IVF index with {len(encodings)} entries in {len(centroids)} cells.")
+
+    def add(self, names, encodings, entry_ids=None):
+        """
+        Adds entries to the unclustered tail of the index.
+
+        Args:
+            names (str or list): The name of each entry.
+            encodings (numpy.ndarray): A (dim,) or (N, dim) array of encodings.
+            entry_ids (list or None): Stable IDs for the entries. If None, IDs are
+                assigned sequentially.
+
+        Returns:
+            list: The IDs of the added entries.
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if isinstance(names, str):
+            names = [names]
+        if len(names) != len(encodings):
+            raise ValueError(f"Got {len(names)} names for {len(encodings)} encodings.")
+        with self._lock:
+            if entry_ids is None:
+                start = max(self._row_of, default=-1) + 1
+                entry_ids = list(range(start, start + len(encodings)))
+            entry_ids = [int(entry_id) for entry_id in entry_ids]
+            duplicates = [entry_id for entry_id in entry_ids if entry_id in self._row_of]
+            if duplicates:
+                raise ValueError(f"Index already contains entries {duplicates[:5]}.")
+            if not entry_ids:
+                return []
+
+            for offset, entry_id in enumerate(entry_ids):
+                self._row_of[entry_id] = len(self.names) + offset
+            self._tail = np.concatenate([self._tail, encodings])
+            self._tail_sq = np.concatenate([self._tail_sq, np.einsum('ij,ij->i', encodings, encodings)])
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(encodings), dtype=bool)])
+            self.names.extend(names)
+            self.entry_ids.extend(entry_ids)
+            if len(self._tail) > self.max_tail and len(self._centroids):
+                self.compact()
+        return entry_ids
+
+    def remove(self, entry_id):
+        """
+        Masks an entry out of the search results.
+
+        Returns:
+            bool: True if the entry existed.
+        """
+        with self._lock:
+            row = self._row_of.pop(int(entry_id), None)
+            if row is None:
+                return False
+            self._deleted[row] = True
+            self._num_deleted += 1
+            return True
+
+    def clear(self):
+        """
+        Removes all entries, keeping the trained centroids.
+        """
+        with self._lock:
+            self._reset(np.empty((0, self.dim), dtype=np.float32),
+                        np.zeros(len(self._centroids) + 1, dtype=np.int64), [], [])
+
+    def compact(self):
+        """
+        Moves the tail into the cells and drops removed entries, keeping the centroids.
+        """
+        with self._lock:
+            live = ~self._deleted
+            encodings = np.concatenate([np.asarray(self._vectors), self._tail])[live]
+            names = [name for name, keep in zip(self.names, live) if keep]
+            entry_ids = np.asarray(self.entry_ids, dtype=np.int64)[live]
+            self._index(names, encodings, entry_ids)
+
+    def search(self, queries, k=1):
+        """
+        Finds the approximate k nearest entries for each query.
+
+        Args:
+            queries (numpy.ndarray): A (dim,) or (M, dim) array of encodings.
+            k (int): The number of neighbours to return per query.
+
+        Returns:
+            tuple: (distances, rows), both (M, k') arrays sorted by increasing
+                   distance, where k' = min(k, len(self)). Rows index `names`
+                   and `entry_ids`.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            k = min(k, len(self))
+            out_dist = np.full((len(queries), k), np.inf, dtype=np.float32)
+            out_rows = np.zeros((len(queries), k), dtype=np.int64)
+            if k == 0:
+                return out_dist, out_rows
+
+            nprobe = min(self.nprobe, len(self._centroids))
+            cells = None
+            if nprobe:
+                centroid_dist = self._centroid_sq_norms[None, :] - 2.0 * (queries @ self._centroids.T)
+                cells = np.argpartition(centroid_dist, nprobe - 1, axis=1)[:, :nprobe]
+
+            tail_rows = np.arange(self.indexed_size, len(self.names))
+            for i, query in enumerate(queries):
+                if cells is not None:
+                    starts, ends = self._offsets[cells[i]], self._offsets[cells[i] + 1]
+                    rows = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)] + [tail_rows])
+                else:
+                    rows = tail_rows
+                live = np.count_nonzero(~self._deleted[rows])
+                if live < k:
+                    # Too few candidates in the probed cells; scan everything instead.
+                    rows = np.arange(len(self.names))
+                dist = self._squared_distances(query, rows)
+                dist[self._deleted[rows]] = np.inf
+                self.candidates_scanned += len(rows)
+
+                top = np.argpartition(dist, k - 1)[:k] if k < len(dist) else np.arange(len(dist))
+                top = top[np.argsort(dist[top])]
+                out_dist[i] = np.sqrt(np.maximum(dist[top], 0.0))
+                out_rows[i] = rows[top]
+            self.queries += len(queries)
+        return out_dist, out_rows
+
+    def match(self, queries, threshold):
+        """
+        Returns the best match for each query if it is within the threshold.
+
+        Args:
+            queries (numpy.ndarray): A (dim,) or (M, dim) array of encodings.
+            threshold (float): The maximum distance for a match.
+
+        Returns:
+            list: One (name, distance) tuple per query; name is None when the
+                  nearest entry is farther than the threshold.
+        """
+        with self._lock:
+            distances, rows = self.search(queries, k=1)
+            names = self.names
+        results = []
+        for dist, row in zip(distances, rows):
+            if len(row) and dist[0] <= threshold:
+                results.append((names[row[0]], float(dist[0])))
+            else:
+                results.append((None, float(dist[0]) if len(row) else None))
+        return results
+
+    def stats(self):
+        """
+        Returns the index size and the mean number of candidates scanned per query.
+        """
+        return {
+            'entries': len(self),
+            'cells': len(self._centroids),
+            'nprobe': self.nprobe,
+            'tail': len(self._tail),
+            'deleted': self._num_deleted,
+            'queries': self.queries,
+            'mean_candidates': self.candidates_scanned / self.queries if self.queries else 0.0,
+        }
+
+    def save(self, path):
+        """
+        Writes the index to a directory, compacting it first.
+        """
+        with self._lock:
+            if len(self._tail) or self._num_deleted:
+                self.compact()
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, 'centroids.npy'), self._centroids)
+            np.save(os.path.join(path, 'offsets.npy'), self._offsets)
+            np.save(os.path.join(path, 'vectors.npy'), np.asarray(self._vectors))
+            np.save(os.path.join(path, 'sq_norms.npy'), np.asarray(self._sq_norms))
+            np.save(os.path.join(path, 'entry_ids.npy'), np.asarray(self.entry_ids, dtype=np.int64))
+            with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'dim': self.dim, 'nprobe': self.nprobe, 'names': self.names}, f)
+        logger.info(f"Saved IVF index with {len(self)} entries to {path}.")
+
+    @classmethod
+    def load(cls, path, nprobe=None, max_tail=50000):
+        """
+        Loads an index written by `save`; the encodings are memory-mapped.
+        """
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(dim=meta['dim'], nprobe=nprobe or meta['nprobe'], max_tail=max_tail)
+        index._centroids = np.load(os.path.join(path, 'centroids.npy'))
+        index.nlist = len(index._centroids)
+        index._reset(
+            np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'offsets.npy')),
+            meta['names'],
+            np.load(os.path.join(path, 'entry_ids.npy')),
+            sq_norms=np.load(os.path.join(path, 'sq_norms.npy'), mmap_mode='r'),
+        )
+        return index
+
+    @classmethod
+    def load_or_build(cls, path, db_manager, nlist=None, nprobe=16):
+        """
+        Loads the index from `path` or, if it does not exist yet, builds it from the
+        known_faces table and saves it there. Rows added to the database later are
+        picked up by FacialRecognitionModule.refresh_known_faces.
+        """
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            try:
+                return cls.load(path, nprobe=nprobe)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not load IVF index from {path}, rebuilding it: {e}")
+        rowids, names, encodings = db_manager.sync_gallery_snapshot()
+        index = cls(dim=encodings.shape[1] if len(encodings) else 128, nlist=nlist, nprobe=nprobe)
+        index.build(names, encodings, entry_ids=rowids)
+        if len(index):
+            index.save(path)
+        return index
+
+    def _index(self, names, encodings, entry_ids):
+        if len(self._centroids):
+            assignment = self._assign(encodings)
+            order = np.argsort(assignment, kind='stable')
+            counts = np.bincount(assignment, minlength=len(self._centroids))
+        else:
+            order = np.arange(len(encodings))
+            counts = np.zeros(0, dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._reset(np.ascontiguousarray(encodings[order]), offsets, [names[i] for i in order], entry_ids[order])
+
+    def _reset(self, vectors, offsets, names, entry_ids, sq_norms=None):
+        self._centroid_sq_norms = np.einsum('ij,ij->i', self._centroids, self._centroids)
+        self._vectors = vectors
+        self._sq_norms = np.einsum('ij,ij->i', vectors, vectors) if sq_norms is None else sq_norms
+        self._offsets = np.asarray(offsets, dtype=np.int64) if len(offsets) else np.zeros(1, dtype=np.int64)
+        self._tail = np.empty((0, self.dim), dtype=np.float32)
+        self._tail_sq = np.empty((0,), dtype=np.float32)
+        self._deleted = np.zeros(len(names), dtype=bool)
+        self._num_deleted = 0
+        self.names = list(names)
+        self.entry_ids = [int(entry_id) for entry_id in entry_ids]
+        self._row_of = {entry_id: row for row, entry_id in enumerate(self.entry_ids)}
+
+    def _assign(self, encodings):
+        return _nearest_centroid(encodings, self._centroids, self._centroid_sq_norms)
+
+    def _squared_distances(self, query, rows):
+        q_sq = float(query @ query)
+        indexed = rows[rows < self.indexed_size]
+        tail = rows[rows >= self.indexed_size] - self.indexed_size
+        parts = []
+        if len(indexed):
+            parts.append(self._sq_norms[indexed] - 2.0 * (self._vectors[indexed] @ query) + q_sq)
+        if len(tail):
+            parts.append(self._tail_sq[tail] - 2.0 * (self._tail[tail] @ query) + q_sq)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+
+
+def _nearest_centroid(points, centroids, centroid_sq_norms, chunk=16384):
+    assignment = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), chunk):
+        block = points[start:start + chunk]
+        dist = centroid_sq_norms[None, :] - 2.0 * (block @ centroids.T)
+        assignment[start:start + chunk] = np.argmin(dist, axis=1)
+    return assignment
+
+
+def _kmeans(points, k, iterations, rng):
+    """
+    Lloyd's k-means with BLAS-based assignment. Empty clusters are reseeded with
+    random points.
+    """
+    centroids = points[rng.choice(len(points), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroid(points, centroids, np.einsum('ij,ij->i', centroids, centroids))
+        membership = sparse.csr_matrix(
+            (np.ones(len(points), dtype=np.float32), (assignment, np.arange(len(points)))),
+            shape=(k, len(points)),
+        )
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.asarray(membership @ points)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = points[rng.choice(len(points), len(empty), replace=False)]
+    return centroids.astype(np.float32)
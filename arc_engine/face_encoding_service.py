@@ -0,0 +1,270 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Crops are resized to this size before encoding, as in FacialRecognitionModule.
+CROP_SIZE = (200, 200)
+_SLOT_SHAPE = (CROP_SIZE[1], CROP_SIZE[0], 3)
+# Seconds between checks for worker processes that have died.
+_WORKER_CHECK_INTERVAL = 0.5
+
+
+def _encoding_worker(shm_name, num_slots, task_queue, result_queue, index, claims):
+    """
+    Worker process: runs face detection and encoding on crops read from shared memory.
+
+    The ID of the batch being processed is kept in claims[index], so that the
+    service can fail that batch if the process dies.
+    """
+    import face_recognition
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray((num_slots,) + _SLOT_SHAPE, dtype=np.uint8, buffer=shm.buf)
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            batch_id, slot_ids = task
+            claims[index] = batch_id
+            results = []
+            for slot in slot_ids:
+                try:
+                    # Slots hold BGR crops; dlib, like enrollment, expects RGB.
+                    image = cv2.cvtColor(slots[slot], cv2.COLOR_BGR2RGB)
+                    locations = face_recognition.face_locations(image)
+                    if not locations:
+                        results.append((slot, None, None))
+                        continue
+                    # Only the first face is used, so only it is encoded.
+                    encodings = face_recognition.face_encodings(image, locations[:1])
+                    results.append((slot, locations[0], encodings[0] if encodings else None))
+                except Exception as e:
+                    logger.error(f"Face encoding failed: {e}")
+                    results.append((slot, None, None))
+            result_queue.put((batch_id, results))
+    finally:
+        del slots
+        shm.close()
+
+
+class FaceEncodingService:
+    """
+    Runs face detection and encoding in a pool of worker processes, so that the
+    CPU-bound dlib work scales across cores instead of competing for the GIL.
+
+    Crops from any number of tracks and feeds are resized straight into slots of
+    a shared memory block; only slot indices travel through the task queue. A
+    batcher thread groups pending crops into batches of up to `max_batch`, waiting
+    at most `max_wait_ms` for a batch to fill. Each submission returns a Future
+    that resolves to (face_location, face_encoding) in CROP_SIZE coordinates, or
+    (None, None) if no face was found.
+    """
+    def __init__(self, num_workers=None, max_batch=8, max_wait_ms=5.0, num_slots=None):
+        """
+        Initializes the FaceEncodingService and starts its worker processes.
+
+        Args:
+            num_workers (int or None): The number of worker processes. Defaults to
+                one less than the number of CPUs.
+            max_batch (int): The maximum number of crops sent to a worker at once.
+            max_wait_ms (float): How long the batcher waits for a batch to fill.
+            num_slots (int or None): The number of shared memory crop slots, which
+                bounds the number of crops in flight. Defaults to two full batches
+                per worker.
+        """
+        self.num_workers = num_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.num_slots = num_slots or 2 * self.num_workers * self.max_batch
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.num_slots * int(np.prod(_SLOT_SHAPE)))
+        self._slots = np.ndarray((self.num_slots,) + _SLOT_SHAPE, dtype=np.uint8, buffer=self._shm.buf)
+        self._free_slots = queue.Queue()
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+
+        self._pending = queue.Queue()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._batch_ids = itertools.count()
+        self._running = True
+
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.batches = 0
+
+        self.restarts = 0
+
+        self._context = mp.get_context('spawn')
+        self._task_queue = self._context.Queue()
+        self._result_queue = self._context.Queue()
+        # The batch each worker is processing (-1 before its first one).
+        self._claims = self._context.Array('q', [-1] * self.num_workers, lock=False)
+        self._workers = [self._start_worker(i) for i in range(self.num_workers)]
+
+        self._batcher = threading.Thread(target=self._batch_loop, name="arc-face-batcher", daemon=True)
+        self._collector = threading.Thread(target=self._collect_loop, name="arc-face-collector", daemon=True)
+        self._batcher.start()
+        self._collector.start()
+        logger.info(f"FaceEncodingService started with {self.num_workers} workers and {self.num_slots} slots.")
+
+    def submit(self, track_id, crop):
+        """
+        Queues a crop for face detection and encoding.
+
+        Args:
+            track_id (int or None): The track the crop belongs to; set as `future.track_id`.
+            crop (numpy.ndarray): The BGR person crop. It is copied (resized) into
+                shared memory before this call returns.
+
+        Returns:
+            Future or None: A future resolving to (face_location, face_encoding), or
+                            None if all slots are in use.
+        """
+        if not self._running:
+            return None
+        try:
+            slot = self._free_slots.get_nowait()
+        except queue.Empty:
+            self.rejected += 1
+            return None
+
+        cv2.resize(crop, CROP_SIZE, dst=self._slots[slot], interpolation=cv2.INTER_AREA)
+        future = Future()
+        future.track_id = track_id
+        self.submitted += 1
+        self._pending.put((slot, future))
+        return future
+
+    def stats(self):
+        """
+        Returns submission, completion and batching counters.
+        """
+        return {
+            'workers': self.num_workers,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'in_flight': self.num_slots - self._free_slots.qsize(),
+            'batches': self.batches,
+            'restarts': self.restarts,
+            'mean_batch_size': self.completed / self.batches if self.batches else 0.0,
+        }
+
+    def shutdown(self, timeout=2.0):
+        """
+        Stops the workers and releases the shared memory. Unfinished futures are cancelled.
+        """
+        if not self._running:
+            return
+        self._running = False
+        self._batcher.join(timeout=timeout)
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._collector.join(timeout=timeout)
+
+        with self._lock:
+            leftovers = [future for batch in self._in_flight.values() for _, future in batch]
+            self._in_flight = {}
+        while True:
+            try:
+                leftovers.append(self._pending.get_nowait()[1])
+            except queue.Empty:
+                break
+        for future in leftovers:
+            future.cancel()
+
+        del self._slots
+        self._shm.close()
+        self._shm.unlink()
+        logger.info("FaceEncodingService shut down.")
+
+    def _batch_loop(self):
+        while self._running:
+            try:
+                batch = [self._pending.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            batch_id = next(self._batch_ids)
+            with self._lock:
+                self._in_flight[batch_id] = batch
+            self._task_queue.put((batch_id, [slot for slot, _ in batch]))
+            self.batches += 1
+
+    def _start_worker(self, index):
+        worker = self._context.Process(target=_encoding_worker, name=f"arc-face-encoder-{index}", daemon=True,
+                                       args=(self._shm.name, self.num_slots, self._task_queue, self._result_queue,
+                                             index, self._claims))
+        worker.start()
+        return worker
+
+    def _replace_dead_workers(self):
+        """
+        Fails the batch each dead worker was processing and starts a replacement.
+        """
+        for index, worker in enumerate(self._workers):
+            if worker.is_alive() or not self._running:
+                continue
+            batch_id = self._claims[index]
+            self._claims[index] = -1
+            with self._lock:
+                batch = self._in_flight.pop(batch_id, None)
+            logger.error(f"Face encoding worker {index} exited with code {worker.exitcode}; restarting it.")
+            if batch is not None:
+                error = RuntimeError("The face encoding worker processing this crop exited.")
+                for slot, future in batch:
+                    self._free_slots.put(slot)
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(error)
+            self._workers[index] = self._start_worker(index)
+            self.restarts += 1
+
+    def _collect_loop(self):
+        next_check = time.monotonic() + _WORKER_CHECK_INTERVAL
+        while self._running or self._in_flight:
+            if self._running and time.monotonic() >= next_check:
+                self._replace_dead_workers()
+                next_check = time.monotonic() + _WORKER_CHECK_INTERVAL
+            try:
+                batch_id, results = self._result_queue.get(timeout=0.1)
+            except queue.Empty:
+                if not self._running and not any(worker.is_alive() for worker in self._workers):
+                    return
+                continue
+            with self._lock:
+                batch = self._in_flight.pop(batch_id, None)
+            if batch is None:
+                continue
+            futures = dict(batch)
+            for slot, location, encoding in results:
+                future = futures[slot]
+                self._free_slots.put(slot)
+                self.completed += 1
+                if future.set_running_or_notify_cancel():
+                    future.set_result((location, encoding))
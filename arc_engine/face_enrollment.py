@@ -0,0 +1,213 @@
+"""
+Bulk enrollment of reference photos into the known_faces database.
+
+Images are given either as a directory, where each subdirectory is one person
+(dir/<name>/*.jpg) and loose images are named after their file stem, or as a
+CSV manifest with `name,path` rows (paths relative to the manifest). Photos are
+hashed and de-duplicated first, face detection and encoding run in a pool of
+worker processes, and all embeddings are inserted in one transaction.
+
+Usage:
+    python -m arc_engine.face_enrollment photos/ --db data/known_faces.db --workers 8
+    python -m arc_engine.face_enrollment watchlist.csv --dedupe both
+"""
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from communication.database_manager import DatabaseManager
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+DEDUPE_MODES = ('hash', 'name', 'both', 'none')
+
+
+def collect_images(source):
+    """
+    Lists the images to enroll.
+
+    Args:
+        source (str): A directory of images or a CSV manifest with name and path columns.
+
+    Returns:
+        list: (name, path) tuples.
+    """
+    if os.path.isdir(source):
+        entries = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for filename in sorted(files):
+                if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if os.path.normpath(root) == os.path.normpath(source):
+                    name = os.path.splitext(filename)[0]
+                else:
+                    name = os.path.relpath(root, source).split(os.sep)[0]
+                entries.append((name, os.path.join(root, filename)))
+        return entries
+
+    base = os.path.dirname(os.path.abspath(source))
+    entries = []
+    with open(source, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or row[0].strip().lower() == 'name':
+                continue
+            name, path = row[0].strip(), row[1].strip()
+            entries.append((name, path if os.path.isabs(path) else os.path.join(base, path)))
+    return entries
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-1 hex digest of a file's contents.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _encode_image(task):
+    """
+    Worker process: finds the largest face in an image and encodes it.
+
+    Returns:
+        tuple: (index, encoding or None, status) where status is 'ok', 'multiple_faces',
+               'no_face' or 'error: ...'.
+    """
+    import face_recognition
+
+    index, path, model = task
+    try:
+        image = face_recognition.load_image_file(path)
+        locations = face_recognition.face_locations(image, model=model)
+        if not locations:
+            return index, None, 'no_face'
+        # Reference photos may contain bystanders; the largest face is the subject.
+        largest = max(locations, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))
+        encodings = face_recognition.face_encodings(image, [largest])
+        if not encodings:
+            return index, None, 'no_face'
+        return index, encodings[0], 'multiple_faces' if len(locations) > 1 else 'ok'
+    except Exception as e:
+        return index, None, f"error: {e}"
+
+
+def enroll(db_manager, entries, workers=None, dedupe='hash', model='hog', progress_every=100):
+    """
+    Encodes and stores a list of reference photos.
+
+    Args:
+        db_manager (DatabaseManager): The database to enroll into.
+        entries (list): (name, path) tuples as returned by collect_images.
+        workers (int or None): The number of encoding processes. Defaults to the CPU count.
+        dedupe (str): 'hash' skips images whose contents are already enrolled, 'name'
+            skips people who already have a face in the database, 'both' applies
+            both checks, 'none' enrolls everything.
+        model (str): The face_recognition detection model, 'hog' or 'cnn'.
+        progress_every (int): Log progress after this many encoded images.
+
+    Returns:
+        dict: Counts of enrolled, skipped and failed images, and the throughput.
+    """
+    if dedupe not in DEDUPE_MODES:
+        raise ValueError(f"Unknown dedupe mode '{dedupe}'. Expected one of {DEDUPE_MODES}.")
+    start = time.perf_counter()
+    report = {'images': len(entries), 'enrolled': 0, 'duplicates': 0, 'existing_names': 0,
+              'no_face': 0, 'multiple_faces': 0, 'errors': 0}
+
+    known_hashes = db_manager.get_known_hashes() if dedupe in ('hash', 'both') else set()
+    known_names = db_manager.get_known_names() if dedupe in ('name', 'both') else set()
+
+    pending = []
+    for name, path in entries:
+        if name in known_names:
+            report['existing_names'] += 1
+            continue
+        try:
+            source_hash = hash_file(path)
+        except OSError as e:
+            logger.warning(f"Cannot read {path}: {e}")
+            report['errors'] += 1
+            continue
+        if dedupe != 'none' and source_hash in known_hashes:
+            report['duplicates'] += 1
+            continue
+        if dedupe != 'none':
+            # Also drops copies of the same photo within this run.
+            known_hashes.add(source_hash)
+        pending.append((name, path, source_hash))
+
+    faces = []
+    workers = workers or os.cpu_count() or 1
+    encode_start = time.perf_counter()
+    if pending:
+        tasks = [(i, path, model) for i, (_, path, _) in enumerate(pending)]
+        chunksize = max(1, min(16, len(tasks) // (4 * workers)))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) as pool:
+            for done, (index, encoding, status) in enumerate(pool.map(_encode_image, tasks, chunksize=chunksize), 1):
+                name, path, source_hash = pending[index]
+                if encoding is None:
+                    if status == 'no_face':
+                        report['no_face'] += 1
+                    else:
+                        report['errors'] += 1
+                        logger.warning(f"Failed to encode {path}: {status}")
+                else:
+                    if status == 'multiple_faces':
+                        report['multiple_faces'] += 1
+                    faces.append((name, encoding, source_hash))
+                if done % progress_every == 0 or done == len(tasks):
+                    rate = done / max(time.perf_counter() - encode_start, 1e-9)
+                    logger.info(f"Encoded {done}/{len(tasks)} images ({rate:.1f} images/s).")
+    encode_seconds = time.perf_counter() - encode_start
+
+    insert_start = time.perf_counter()
+    report['enrolled'] = db_manager.add_faces(faces) if faces else 0
+    insert_seconds = time.perf_counter() - insert_start
+    if faces:
+        db_manager.sync_gallery_snapshot()
+
+    elapsed = time.perf_counter() - start
+    report.update({
+        'people': len({name for name, _, _ in faces}),
+        'workers': workers,
+        'encode_seconds': encode_seconds,
+        'insert_seconds': insert_seconds,
+        'total_seconds': elapsed,
+        'images_per_second': len(pending) / encode_seconds if pending and encode_seconds > 0 else 0.0,
+    })
+    logger.info(f"Enrolled {report['enrolled']} faces of {report['people']} people in {elapsed:.1f}s.")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help="Directory of images or CSV manifest (name,path).")
+    parser.add_argument('--db', default='data/known_faces.db')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dedupe', choices=DEDUPE_MODES, default='hash')
+    parser.add_argument('--model', choices=('hog', 'cnn'), default='hog')
+    args = parser.parse_args()
+
+    entries = collect_images(args.source)
+    if not entries:
+        raise SystemExit(f"No images found in {args.source}")
+
+    db_manager = DatabaseManager(args.db)
+    try:
+        report = enroll(db_manager, entries, workers=args.workers, dedupe=args.dedupe, model=args.model)
+    finally:
+        db_manager.close_connection()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
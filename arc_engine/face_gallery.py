@@ -0,0 +1,303 @@
+import threading
+import numpy as np
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PRECISIONS = ('float32', 'float16', 'int8')
+
+
+class FaceGalleryIndex:
+    """
+    An in-memory index of known face encodings for nearest-neighbour matching.
+
+    All encodings live in one contiguous float32 matrix together with their
+    precomputed squared norms, so the Euclidean distances from a batch of
+    queries to the whole gallery are a single matrix product:
+    |q - g|^2 = |q|^2 + |g|^2 - 2 q.g
+
+    Entries can be added and removed without rebuilding the matrix: storage
+    grows geometrically, and a removed row is filled with the last row. All
+    operations hold a lock, so the gallery can be updated while another thread
+    searches it.
+
+    With `precision` 'float16' or 'int8' (with a per-row scale) the scanned
+    matrix is 2x or 4x smaller. It is converted to float32 in cache-sized blocks
+    for the matrix product, so a scan reads far less memory. The `rerank`
+    nearest candidates of each query are then re-scored against a float32
+    copy of their rows, so the returned distances are exact. With rerank=0 no
+    float32 copy is kept and the distances are approximate.
+    """
+    def __init__(self, dim=128, initial_capacity=1024, precision='float32', rerank=16):
+        """
+        Initializes an empty FaceGalleryIndex.
+
+        Args:
+            dim (int): The dimensionality of the face encodings.
+            initial_capacity (int): The number of rows allocated up front.
+            precision (str): 'float32', 'float16' or 'int8', the precision of the scanned matrix.
+                int8 is smaller and faster to scan than float32; float16 only saves memory,
+                as NumPy's half-precision conversion is slow.
+            rerank (int): With a reduced precision, the number of candidates per query
+                re-scored in float32. 0 disables re-ranking and the float32 copy.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}'. Expected one of {PRECISIONS}.")
+        self.dim = dim
+        self.precision = precision
+        self.rerank = rerank if precision != 'float32' else 0
+        capacity = max(1, initial_capacity)
+        self._codes = None
+        self._scales = None
+        self._encodings = None
+        if precision == 'int8':
+            self._codes = np.empty((capacity, dim), dtype=np.int8)
+            self._scales = np.empty((capacity,), dtype=np.float32)
+        elif precision == 'float16':
+            self._codes = np.empty((capacity, dim), dtype=np.float16)
+        if precision == 'float32' or self.rerank > 0:
+            self._encodings = np.empty((capacity, dim), dtype=np.float32)
+        self._sq_norms = np.empty((capacity,), dtype=np.float32)
+        self._size = 0
+        self.names = []
+        self.entry_ids = []
+        self._row_of = {}
+        self._next_entry_id = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def encodings(self):
+        """
+        The stored encodings, one row per entry. Without a float32 copy they are
+        dequantized.
+        """
+        if self._encodings is not None:
+            return self._encodings[:self._size]
+        return self._dequantize(slice(0, self._size))
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes of the matrix scanned per search (excluding the float32
+        re-ranking copy of reduced-precision galleries).
+        """
+        scanned = self._codes if self._codes is not None else self._encodings
+        total = scanned[:self._size].nbytes + self._sq_norms[:self._size].nbytes
+        if self._scales is not None:
+            total += self._scales[:self._size].nbytes
+        return total
+
+    def add(self, names, encodings, entry_ids=None):
+        """
+        Adds one or more entries to the gallery.
+
+        Args:
+            names (str or list): The name of each entry.
+            encodings (numpy.ndarray): A (dim,) or (N, dim) array of encodings.
+            entry_ids (list or None): Stable IDs for the entries (e.g. database row IDs).
+                If None, IDs are assigned sequentially.
+
+        Returns:
+            list: The IDs of the added entries.
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if isinstance(names, str):
+            names = [names]
+        count = len(encodings)
+        if len(names) != count:
+            raise ValueError(f"Got {len(names)} names for {count} encodings.")
+        with self._lock:
+            return self._add(names, encodings, entry_ids)
+
+    def _add(self, names, encodings, entry_ids):
+        count = len(encodings)
+        if entry_ids is None:
+            entry_ids = list(range(self._next_entry_id, self._next_entry_id + count))
+        entry_ids = [int(entry_id) for entry_id in entry_ids]
+        duplicates = [entry_id for entry_id in entry_ids if entry_id in self._row_of]
+        if duplicates:
+            raise ValueError(f"Gallery already contains entries {duplicates[:5]}.")
+        if count == 0:
+            return []
+
+        self._reserve(self._size + count)
+        rows = slice(self._size, self._size + count)
+        if self._encodings is not None:
+            self._encodings[rows] = encodings
+        if self.precision == 'int8':
+            scales = np.maximum(np.abs(encodings).max(axis=1), 1e-12) / 127.0
+            self._scales[rows] = scales
+            self._codes[rows] = np.clip(np.rint(encodings / scales[:, None]), -127, 127)
+        elif self.precision == 'float16':
+            self._codes[rows] = encodings
+        # Norms of the stored (possibly quantized) rows, so approximate distances are consistent.
+        stored = encodings if self._codes is None else self._dequantize(rows)
+        self._sq_norms[rows] = np.einsum('ij,ij->i', stored, stored)
+        for offset, entry_id in enumerate(entry_ids):
+            self._row_of[entry_id] = self._size + offset
+        self.names.extend(names)
+        self.entry_ids.extend(entry_ids)
+        self._size += count
+        self._next_entry_id = max(self._next_entry_id, max(entry_ids) + 1)
+        return entry_ids
+
+    def remove(self, entry_id):
+        """
+        Removes an entry by moving the last row into its place.
+
+        Args:
+            entry_id (int): The ID of the entry to remove.
+
+        Returns:
+            bool: True if the entry existed.
+        """
+        with self._lock:
+            row = self._row_of.pop(int(entry_id), None)
+            if row is None:
+                return False
+            last = self._size - 1
+            if row != last:
+                for array in self._row_arrays():
+                    array[row] = array[last]
+                self.names[row] = self.names[last]
+                self.entry_ids[row] = self.entry_ids[last]
+                self._row_of[self.entry_ids[row]] = row
+            self.names.pop()
+            self.entry_ids.pop()
+            self._size = last
+            return True
+
+    def clear(self):
+        """
+        Removes all entries, keeping the allocated storage.
+        """
+        with self._lock:
+            self._size = 0
+            self.names = []
+            self.entry_ids = []
+            self._row_of = {}
+
+    def distances(self, queries):
+        """
+        Computes the Euclidean distances from each query to every gallery entry.
+
+        Args:
+            queries (numpy.ndarray): A (dim,) or (M, dim) array of encodings.
+
+        Returns:
+            numpy.ndarray: An (M, len(self)) float32 array of distances.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        with self._lock:
+            sq = q_sq[:, None] + self._sq_norms[None, :self._size] - 2.0 * self._dot(queries)
+        return np.sqrt(np.maximum(sq, 0.0, out=sq), out=sq)
+
+    def search(self, queries, k=1):
+        """
+        Finds the k nearest gallery entries for each query.
+
+        Args:
+            queries (numpy.ndarray): A (dim,) or (M, dim) array of encodings.
+            k (int): The number of neighbours to return per query.
+
+        Returns:
+            tuple: (distances, rows), both (M, k') arrays sorted by increasing
+                   distance, where k' = min(k, len(self)). Rows index `names`
+                   and `entry_ids`.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            dist = self.distances(queries)
+            size = dist.shape[1]
+            k = min(k, size)
+            if k == 0:
+                empty = np.empty((len(queries), 0))
+                return empty.astype(np.float32), empty.astype(np.int64)
+
+            if self.rerank > 0:
+                # Shortlist by approximate distance, then re-score the shortlist exactly.
+                shortlist = min(max(k, self.rerank), size)
+                rows = np.argpartition(dist, shortlist - 1, axis=1)[:, :shortlist] if shortlist < size \
+                    else np.broadcast_to(np.arange(size), dist.shape)
+                candidates = self._encodings[rows]
+                diff = candidates - queries[:, None, :]
+                dist = np.sqrt(np.einsum('mkd,mkd->mk', diff, diff))
+                size = shortlist
+            else:
+                rows = None
+
+        if k < size:
+            top_rows = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            top_rows = np.broadcast_to(np.arange(size), dist.shape)
+        top = np.take_along_axis(dist, top_rows, axis=1)
+        if rows is not None:
+            top_rows = np.take_along_axis(rows, top_rows, axis=1)
+        order = np.argsort(top, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_rows, order, axis=1)
+
+    def match(self, queries, threshold):
+        """
+        Returns the best match for each query if it is within the threshold.
+
+        Args:
+            queries (numpy.ndarray): A (dim,) or (M, dim) array of encodings.
+            threshold (float): The maximum distance for a match.
+
+        Returns:
+            list: One (name, distance) tuple per query; name is None when the
+                  nearest entry is farther than the threshold.
+        """
+        results = []
+        with self._lock:
+            # Names are resolved under the lock; remove() reorders the rows in place.
+            distances, rows = self.search(queries, k=1)
+            for dist, row in zip(distances, rows):
+                if len(row) and dist[0] <= threshold:
+                    results.append((self.names[row[0]], float(dist[0])))
+                else:
+                    results.append((None, float(dist[0]) if len(row) else None))
+        return results
+
+    def _row_arrays(self):
+        return [array for array in (self._encodings, self._codes, self._scales, self._sq_norms) if array is not None]
+
+    def _reserve(self, capacity):
+        if capacity <= len(self._sq_norms):
+            return
+        new_capacity = max(capacity, 2 * len(self._sq_norms))
+        for attr in ('_encodings', '_codes', '_scales', '_sq_norms'):
+            old = getattr(self, attr)
+            if old is None:
+                continue
+            grown = np.empty((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:self._size] = old[:self._size]
+            setattr(self, attr, grown)
+
+    def _dequantize(self, rows):
+        decoded = self._codes[rows].astype(np.float32)
+        if self._scales is not None:
+            decoded *= self._scales[rows][:, None]
+        return decoded
+
+    def _dot(self, queries, block=1024):
+        """
+        Returns queries @ stored_rows.T. Reduced-precision rows are converted to
+        float32 one cache-sized block at a time.
+        """
+        if self._codes is None:
+            return queries @ self._encodings[:self._size].T
+        out = np.empty((len(queries), self._size), dtype=np.float32)
+        buffer = np.empty((block, self.dim), dtype=np.float32)
+        for start in range(0, self._size, block):
+            stop = min(start + block, self._size)
+            chunk = buffer[:stop - start]
+            chunk[...] = self._codes[start:stop]
+            np.matmul(queries, chunk.T, out=out[:, start:stop])
+            if self._scales is not None:
+                out[:, start:stop] *= self._scales[start:stop]
+        return out
@@ -0,0 +1,206 @@
+import os
+import threading
+import cv2
+import numpy as np
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class FaceQuality:
+    """
+    Cheap quality measurements of a person crop, taken before face encoding.
+    """
+    __slots__ = ('sharpness', 'head_size', 'pose', 'score', 'reason')
+
+    def __init__(self, sharpness, head_size, pose, score, reason=None):
+        # Variance of the Laplacian over the head region (higher is sharper).
+        self.sharpness = sharpness
+        # Height in pixels of the head region.
+        self.head_size = head_size
+        # 1.0 for a frontal face, 0.5 for a profile, 0.0 if no face was found.
+        self.pose = pose
+        # Combined score in [0, 1].
+        self.score = score
+        # Why the crop was rejected, or None if it passed.
+        self.reason = reason
+
+    @property
+    def acceptable(self):
+        return self.reason is None
+
+    def as_dict(self):
+        return {
+            'sharpness': self.sharpness,
+            'head_size': self.head_size,
+            'pose': self.pose,
+            'score': self.score,
+            'reason': self.reason,
+        }
+
+
+class FaceQualityGate:
+    """
+    A cheap pre-filter that decides whether a tracked person crop is worth the
+    expensive face detection and encoding.
+
+    It scores the head region of the crop (the top `head_fraction` of it) for
+    size, sharpness (variance of the Laplacian) and rough pose (OpenCV Haar
+    cascades for frontal and profile faces), rejects crops that fail any hard
+    limit, and per track only lets through crops that are close to the best
+    quality already encoded for that track.
+    """
+    def __init__(self, head_fraction=0.35, min_head_size=40, min_sharpness=30.0, sharpness_scale=150.0,
+                 min_score=0.2, relative_quality=0.8, use_pose=True):
+        """
+        Initializes the FaceQualityGate.
+
+        Args:
+            head_fraction (float): The fraction of the crop, from the top, assumed to
+                contain the head. Use 1.0 for crops that are already face crops.
+            min_head_size (int): The minimum head region height in pixels.
+            min_sharpness (float): The minimum variance of the Laplacian.
+            sharpness_scale (float): The Laplacian variance that scores 0.5 sharpness.
+            min_score (float): The minimum combined score.
+            relative_quality (float): A crop is only encoded if its score is at least
+                this fraction of the best score already encoded for the same track.
+            use_pose (bool): Whether to check for a frontal or profile face with Haar cascades.
+        """
+        self.head_fraction = head_fraction
+        self.min_head_size = min_head_size
+        self.min_sharpness = min_sharpness
+        self.sharpness_scale = sharpness_scale
+        self.min_score = min_score
+        self.relative_quality = relative_quality
+
+        self._frontal = None
+        self._profile = None
+        if use_pose:
+            self._frontal = _load_cascade('haarcascade_frontalface_default.xml')
+            self._profile = _load_cascade('haarcascade_profileface.xml')
+            if self._frontal is None:
+                logger.warning("Haar cascades not available; face pose will not be checked.")
+
+        self._lock = threading.Lock()
+        # track_id -> {'last': score, 'best': score, 'best_encoded': score, 'last_quality': dict}
+        self.track_quality = {}
+        self.assessed = 0
+        self.rejected = 0
+        self.skipped = 0
+
+    def assess(self, crop):
+        """
+        Scores a person crop.
+
+        Args:
+            crop (numpy.ndarray): The BGR person crop.
+
+        Returns:
+            FaceQuality: The quality measurements and combined score.
+        """
+        height = crop.shape[0]
+        head = crop[:max(1, int(round(height * self.head_fraction)))]
+        head_size = head.shape[0]
+        gray = cv2.cvtColor(head, cv2.COLOR_BGR2GRAY) if head.ndim == 3 else head
+
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+        size_score = min(1.0, head_size / (2.0 * self.min_head_size))
+        sharpness_score = sharpness / (sharpness + self.sharpness_scale)
+        pose = self._pose(gray) if head_size >= self.min_head_size else 0.0
+        score = size_score * sharpness_score * pose
+
+        reason = None
+        if head_size < self.min_head_size:
+            reason = 'too_small'
+        elif sharpness < self.min_sharpness:
+            reason = 'blurred'
+        elif pose == 0.0:
+            reason = 'no_face'
+        elif score < self.min_score:
+            reason = 'low_score'
+        return FaceQuality(sharpness, head_size, pose, score, reason)
+
+    def should_encode(self, track_id, crop):
+        """
+        Assesses a crop and decides whether it is worth encoding for the given track.
+
+        Args:
+            track_id (int or None): The track the crop belongs to. Without a track ID
+                only the absolute quality limits apply.
+            crop (numpy.ndarray): The BGR person crop.
+
+        Returns:
+            tuple: (bool, FaceQuality) whether to encode, and the measured quality.
+        """
+        quality = self.assess(crop)
+        with self._lock:
+            self.assessed += 1
+            record = None
+            if track_id is not None:
+                record = self.track_quality.setdefault(track_id, {'last': 0.0, 'best': 0.0, 'best_encoded': 0.0})
+                record['last'] = quality.score
+                record['best'] = max(record['best'], quality.score)
+                record['last_quality'] = quality.as_dict()
+
+            if not quality.acceptable:
+                self.rejected += 1
+                return False, quality
+            if record is not None and quality.score < self.relative_quality * record['best_encoded']:
+                self.skipped += 1
+                return False, quality
+            if record is not None:
+                record['best_encoded'] = max(record['best_encoded'], quality.score)
+            return True, quality
+
+    def get_track_quality(self, track_id):
+        """
+        Returns the last and best quality seen for a track, or None if it is unknown.
+        """
+        with self._lock:
+            record = self.track_quality.get(track_id)
+            return dict(record) if record is not None else None
+
+    def prune(self, active_track_ids):
+        """
+        Forgets the quality records of tracks that are no longer active.
+        """
+        active_track_ids = set(active_track_ids)
+        with self._lock:
+            self.track_quality = {k: v for k, v in self.track_quality.items() if k in active_track_ids}
+
+    def stats(self):
+        """
+        Returns how many crops were assessed, rejected by the quality limits, and
+        skipped because a better crop of the same track was already encoded.
+        """
+        passed = self.assessed - self.rejected - self.skipped
+        return {
+            'assessed': self.assessed,
+            'rejected': self.rejected,
+            'skipped': self.skipped,
+            'passed': passed,
+            'pass_rate': passed / self.assessed if self.assessed else 0.0,
+        }
+
+    def _pose(self, gray):
+        if self._frontal is None:
+            return 1.0
+        # Haar detection is cheap at this size and still finds faces of about 24px.
+        scale = min(1.0, 96.0 / max(gray.shape[1], 1))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+        if len(self._frontal.detectMultiScale(small, scaleFactor=1.2, minNeighbors=3)):
+            return 1.0
+        if self._profile is not None:
+            if len(self._profile.detectMultiScale(small, scaleFactor=1.2, minNeighbors=3)):
+                return 0.5
+            if len(self._profile.detectMultiScale(cv2.flip(small, 1), scaleFactor=1.2, minNeighbors=3)):
+                return 0.5
+        return 0.0
+
+
+def _load_cascade(filename):
+    path = os.path.join(getattr(getattr(cv2, 'data', None), 'haarcascades', ''), filename)
+    if not os.path.exists(path):
+        return None
+    cascade = cv2.CascadeClassifier(path)
+    return None if cascade.empty() else cascade
@@ -1,49 +1,134 @@
+import copy
+import threading
 import face_recognition
 import cv2
 import numpy as np
 from utils.logger import logger
 from communication.database_manager import DatabaseManager
+from arc_engine.face_gallery import FaceGalleryIndex
+from arc_engine.face_quality import FaceQualityGate
 
 class FacialRecognitionModule:
     """
     Handles face detection and recognition within a given bounding box.
     """
-    def __init__(self, db_manager: DatabaseManager, similarity_threshold=0.6):
+    def __init__(self, db_manager: DatabaseManager, similarity_threshold=0.6, quality_gate=True,
+                 encoding_service=None, gallery=None, sync_snapshot=True):
         """
         Initializes the FacialRecognitionModule.
 
         Args:
             db_manager (DatabaseManager): The database manager to access known faces.
             similarity_threshold (float): The threshold for face similarity.
+            quality_gate (bool or FaceQualityGate): The pre-filter that skips crops not
+                worth encoding. True uses a default FaceQualityGate, False disables it.
+            encoding_service (FaceEncodingService or None): If set, recognize_face_async
+                runs face detection and encoding in this process pool.
+            gallery (FaceGalleryIndex, IVFFaceIndex or None): The index known faces are
+                matched against. Defaults to an exact FaceGalleryIndex. An index that
+                already holds entries (e.g. loaded from disk) is only brought up to date.
+            sync_snapshot (bool): Bring the gallery snapshot up to date with the database
+                before loading it. False only reads the snapshot, for processes that
+                rely on another one having synced it.
         """
         self.db_manager = db_manager
         self.similarity_threshold = similarity_threshold
-        self.known_face_encodings = []
-        self.known_face_names = []
+        if quality_gate is True:
+            quality_gate = FaceQualityGate()
+        self.quality_gate = quality_gate or None
+        self.encoding_service = encoding_service
+        self._pending_tracks = set()
+        self._pending_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._owner = self
+        self.sync_snapshot = sync_snapshot
+        self.gallery = gallery if gallery is not None else FaceGalleryIndex()
         self._load_known_faces()
         logger.info("FacialRecognitionModule initialized.")
 
     def _load_known_faces(self):
         """
-        Loads known faces from the database into memory.
+        Loads known faces into memory from the gallery snapshot, after bringing the
+        snapshot up to date with the database.
         """
+        self._watermark = 0
+        if len(self.gallery):
+            self._watermark = max(self.gallery.entry_ids)
+            self.refresh_known_faces()
+            logger.info(f"Loaded {len(self.gallery)} known faces from the prebuilt index.")
+            return
         try:
-            known_faces = self.db_manager.get_all_known_faces()
-            if not known_faces:
+            if self.sync_snapshot:
+                rowids, names, encodings = self.db_manager.sync_gallery_snapshot()
+            else:
+                rowids, names, encodings = self.db_manager.snapshot.load()
+            if len(rowids) == 0:
                 logger.warning("No known faces found in the database.")
                 return
 
-            for face in known_faces:
-                # Assuming the embedding is stored as a blob/bytes that can be converted to a numpy array
-                encoding = np.frombuffer(face.embedding, dtype=np.float64)
-                self.known_face_encodings.append(encoding)
-                self.known_face_names.append(face.name)
+            self.gallery.add(names, encodings, entry_ids=rowids)
+            self._watermark = int(rowids[-1])
             
-            logger.info(f"Loaded {len(self.known_face_names)} known faces from the database.")
+            logger.info(f"Loaded {len(self.gallery)} known faces from the database.")
 
         except Exception as e:
             logger.error(f"Error loading known faces from database: {e}")
 
+    def for_feed(self, quality_gate=True):
+        """
+        Returns a recognition module for another video feed that shares this
+        module's gallery, database and encoding service but keeps its own
+        per-track state, so track IDs of different feeds may overlap.
+
+        Args:
+            quality_gate (bool or FaceQualityGate): The feed's quality gate, as in __init__.
+
+        Returns:
+            FacialRecognitionModule: The per-feed module. Refreshing it refreshes this one.
+        """
+        view = copy.copy(self)
+        if quality_gate is True:
+            quality_gate = FaceQualityGate()
+        view.quality_gate = quality_gate or None
+        view._pending_tracks = set()
+        view._pending_lock = threading.Lock()
+        return view
+
+    def refresh_known_faces(self):
+        """
+        Applies database changes made since the faces were loaded to the gallery,
+        without reloading it. Recognition can continue while this runs.
+
+        Returns:
+            tuple: (added, removed) the number of gallery entries added and removed.
+        """
+        if self._owner is not self:
+            return self._owner.refresh_known_faces()
+        with self._refresh_lock:
+            return self._refresh_known_faces()
+
+    def _refresh_known_faces(self):
+        try:
+            removed = 0
+            if self.db_manager.count_faces(self._watermark) != len(self.gallery):
+                current = set(self.db_manager.get_face_rowids(self._watermark).tolist())
+                for entry_id in [e for e in self.gallery.entry_ids if e not in current]:
+                    removed += self.gallery.remove(entry_id)
+
+            rowids, names, encodings = self.db_manager.get_faces_since(self._watermark)
+            if len(rowids):
+                self.gallery.add(names, encodings, entry_ids=rowids)
+                self._watermark = int(rowids[-1])
+
+            if len(rowids) or removed:
+                self.db_manager.sync_gallery_snapshot()
+                logger.info(f"Watchlist refreshed: {len(rowids)} faces added, {removed} removed.")
+            return len(rowids), removed
+
+        except Exception as e:
+            logger.error(f"Error refreshing known faces: {e}")
+            return 0, 0
+
     def recognize_face(self, frame, tracked_bbox):
         """
         Recognizes a face within the tracked bounding box.
@@ -57,42 +142,146 @@ class FacialRecognitionModule:
                    Returns (None, None) if no face is detected.
                    Returns ("Unknown", face_bbox) if the face is not recognized.
         """
-        x1, y1, x2, y2 = tracked_bbox
-        cropped_frame = frame[y1:y2, x1:x2]
+        name, face_bbox, _ = self.recognize_face_with_distance(frame, tracked_bbox)
+        return name, face_bbox
 
-        if cropped_frame.size == 0:
-            logger.warning("Tracked bounding box resulted in an empty frame crop.")
-            return None, None
+    def recognize_face_with_distance(self, frame, tracked_bbox, track_id=None):
+        """
+        Like recognize_face, but also returns the distance of the best gallery match.
+
+        Args:
+            frame (numpy.ndarray): The full video frame.
+            tracked_bbox (tuple): The bounding box of the tracked person (x1, y1, x2, y2).
+            track_id (int or None): The track the person belongs to, used by the quality
+                gate to only encode the best crops of each track.
 
-        # Resize for consistency
+        Returns:
+            tuple: (name, face_bbox, distance). The distance is None if no face was
+                   detected or the gallery is empty.
+        """
+        x1, y1, x2, y2 = tracked_bbox
+        cropped_frame = self._crop_for_encoding(frame, tracked_bbox, track_id)
+        if cropped_frame is None:
+            return None, None, None
+
+        # Resize for consistency, and convert to RGB like the enrolled images
         resized_frame = cv2.resize(cropped_frame, (200, 200), interpolation=cv2.INTER_AREA)
+        resized_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
 
         # Find all face locations and encodings in the resized frame
         face_locations = face_recognition.face_locations(resized_frame)
         face_encodings = face_recognition.face_encodings(resized_frame, face_locations)
 
         if not face_encodings:
-            return None, None
+            return None, None, None
 
         # For simplicity, we process only the first detected face.
         face_encoding = face_encodings[0]
-        top, right, bottom, left = face_locations[0]
-
-        # The face bounding box is relative to the cropped frame, so we adjust it to the full frame.
-        face_bbox = (left + x1, top + y1, right + x1, bottom + y1)
-
-        if not self.known_face_encodings:
-            return "Unknown", face_bbox
-
-        # Compare the detected face with known faces
-        matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=self.similarity_threshold)
-        face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-        
-        name = "Unknown"
-        if True in matches:
-            best_match_index = np.argmin(face_distances)
-            if matches[best_match_index]:
-                name = self.known_face_names[best_match_index]
-                logger.info(f"Face recognized: {name} with distance {face_distances[best_match_index]}")
-
-        return name, face_bbox
\ No newline at end of file
+        face_bbox = self._to_frame_bbox(face_locations[0], cropped_frame.shape, x1, y1)
+
+        name, distance = self.identify(face_encoding)[0]
+        return name, face_bbox, distance
+
+    def recognize_face_async(self, frame, tracked_bbox, track_id, callback):
+        """
+        Recognizes a face in the encoding service's process pool without blocking.
+
+        At most one request per track is in flight; further calls for the same track
+        return False until it completes. The crop is copied into shared memory
+        before this method returns, so the frame may be modified afterwards.
+
+        Args:
+            frame (numpy.ndarray): The full video frame.
+            tracked_bbox (tuple): The bounding box of the tracked person (x1, y1, x2, y2).
+            track_id (int): The track the person belongs to.
+            callback (callable): Called from a service thread as
+                callback(track_id, name, face_bbox, distance) once the face is recognized.
+
+        Returns:
+            bool: True if a request was submitted.
+        """
+        with self._pending_lock:
+            if track_id in self._pending_tracks:
+                return False
+            self._pending_tracks.add(track_id)
+
+        future = None
+        cropped_frame = self._crop_for_encoding(frame, tracked_bbox, track_id)
+        if cropped_frame is not None:
+            future = self.encoding_service.submit(track_id, cropped_frame)
+        if future is None:
+            with self._pending_lock:
+                self._pending_tracks.discard(track_id)
+            return False
+
+        x1, y1 = tracked_bbox[0], tracked_bbox[1]
+        crop_shape = cropped_frame.shape
+
+        def _on_encoded(done):
+            with self._pending_lock:
+                self._pending_tracks.discard(track_id)
+            if done.cancelled() or done.exception() is not None:
+                return
+            location, encoding = done.result()
+            if encoding is None:
+                callback(track_id, None, None, None)
+                return
+            name, distance = self.identify(encoding)[0]
+            callback(track_id, name, self._to_frame_bbox(location, crop_shape, x1, y1), distance)
+
+        future.add_done_callback(_on_encoded)
+        return True
+
+    def _crop_for_encoding(self, frame, tracked_bbox, track_id):
+        """
+        Crops the tracked person and applies the quality gate.
+
+        Returns:
+            numpy.ndarray or None: The crop, or None if it is empty or not worth encoding.
+        """
+        x1, y1, x2, y2 = tracked_bbox
+        cropped_frame = frame[y1:y2, x1:x2]
+
+        if cropped_frame.size == 0:
+            logger.warning("Tracked bounding box resulted in an empty frame crop.")
+            return None
+
+        # Skip face detection and encoding for crops that cannot give a good match.
+        if self.quality_gate is not None:
+            worth_encoding, _ = self.quality_gate.should_encode(track_id, cropped_frame)
+            if not worth_encoding:
+                return None
+        return cropped_frame
+
+    @staticmethod
+    def _to_frame_bbox(face_location, crop_shape, x1, y1):
+        """
+        Converts a (top, right, bottom, left) face location in the 200x200 resized crop
+        to an (x1, y1, x2, y2) box in frame coordinates.
+        """
+        top, right, bottom, left = face_location
+        scale_x = crop_shape[1] / 200.0
+        scale_y = crop_shape[0] / 200.0
+        return (int(left * scale_x) + x1, int(top * scale_y) + y1,
+                int(right * scale_x) + x1, int(bottom * scale_y) + y1)
+
+    def identify(self, face_encodings):
+        """
+        Matches one or more face encodings against the gallery in a single query.
+
+        Args:
+            face_encodings (numpy.ndarray): A (128,) or (N, 128) array of face encodings.
+
+        Returns:
+            list: One (name, distance) tuple per encoding. The name is "Unknown" when
+                  no known face is within the similarity threshold, and the distance
+                  is None when the gallery is empty.
+        """
+        results = []
+        for name, distance in self.gallery.match(face_encodings, self.similarity_threshold):
+            if name is None:
+                results.append(("Unknown", distance))
+            else:
+                logger.info(f"Face recognized: {name} with distance {distance}")
+                results.append((name, distance))
+        return results
\ No newline at end of file
@@ -1,22 +1,45 @@
+import threading
+import numpy as np
 from ultralytics import YOLO
 from utils.logger import logger
+from arc_engine.detection_backends import is_exported_backend, prepare_weights
+
+# Class ID 0 corresponds to 'person' in the COCO dataset
+PERSON_CLASS_ID = 0
 
 class HumanDetectionModule:
     """
     A module for detecting humans in video frames using a YOLOv8 model.
     """
-    def __init__(self, model_path='yolov8n.pt'):
+    def __init__(self, model_path='yolov8n.pt', confidence_threshold=0.25, backend='pytorch',
+                 imgsz=640, int8=False, batch_size=1, warmup=True):
         """
         Initializes the HumanDetectionModule.
 
         Args:
             model_path (str): The path to the YOLOv8 model file.
+            confidence_threshold (float): Minimum confidence for a detection to be kept.
+            backend (str): The inference backend: 'pytorch', 'onnx' or 'openvino'.
+                Exported backends are created from model_path on first use.
+            imgsz (int): The fixed inference input size.
+            int8 (bool): Whether exported backends use INT8 quantized weights.
+            batch_size (int): The fixed batch size of exported backends.
+            warmup (bool): Whether to run a dummy inference at load time.
         """
+        self.confidence_threshold = confidence_threshold
+        self.backend = backend
+        self.imgsz = imgsz
+        self.int8 = int8
+        self.batch_size = max(1, batch_size)
+        # One module may serve several feeds' threads; model calls are not re-entrant.
+        self._lock = threading.Lock()
         self.model = self._load_model(model_path)
+        if self.model is not None and warmup:
+            self._warmup()
 
     def _load_model(self, model_path):
         """
-        Loads the YOLOv8 model.
+        Loads the YOLOv8 model for the configured backend.
 
         Args:
             model_path (str): The path to the model file.
@@ -25,13 +48,27 @@ class HumanDetectionModule:
             YOLO: The loaded YOLO model object, or None if loading fails.
         """
         try:
-            model = YOLO(model_path)
-            logger.info(f"Successfully loaded YOLO model from {model_path}")
+            weights = prepare_weights(model_path, self.backend, imgsz=self.imgsz, int8=self.int8,
+                                      batch=self.batch_size)
+            model = YOLO(weights, task='detect')
+            logger.info(f"Successfully loaded YOLO model from {weights} ({self.backend} backend)")
             return model
         except Exception as e:
-            logger.error(f"Failed to load YOLO model from {model_path}: {e}")
+            logger.error(f"Failed to load YOLO model from {model_path} ({self.backend} backend): {e}")
             return None
 
+    def _warmup(self):
+        """
+        Runs a dummy inference so that lazy initialization and graph optimization
+        happen at load time rather than on the first real frame.
+        """
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        try:
+            self.detect_humans_batch([dummy] * self.batch_size)
+            logger.info(f"Warmed up {self.backend} detection backend.")
+        except Exception as e:
+            logger.warning(f"Detection backend warm-up failed: {e}")
+
     def detect_humans(self, frame):
         """
         Detects humans in a single video frame.
@@ -47,24 +84,66 @@ class HumanDetectionModule:
             logger.warning("YOLO model is not loaded. Cannot perform detection.")
             return []
 
-        results = self.model(frame, verbose=False)
-        
-        detected_humans = []
-        
-        # The result object contains detections for the frame
-        # We iterate through each detection in the result
-        for detection in results[0].boxes:
-            class_id = int(detection.cls)
-            
-            # Class ID 0 corresponds to 'person' in the COCO dataset
-            if class_id == 0:
-                confidence = float(detection.conf)
-                box = detection.xyxy[0].cpu().numpy().tolist() # Bounding box in xyxy format
-                
-                detected_humans.append({
-                    'box': box,
-                    'confidence': confidence,
-                    'class_id': class_id
-                })
-                
-        return detected_humans
\ No newline at end of file
+        boxes, scores = self.detect_humans_batch([frame])[0]
+        return [
+            {'box': box, 'confidence': confidence, 'class_id': PERSON_CLASS_ID}
+            for box, confidence in zip(boxes.tolist(), scores.tolist())
+        ]
+
+    def detect_humans_batch(self, frames):
+        """
+        Detects humans in several frames, e.g. from different feeds, with a single model call.
+
+        Class filtering and confidence thresholding are done inside the model call,
+        so only person detections are ever transferred back from the device.
+
+        Args:
+            frames (list): A list of video frames (numpy.ndarray) to process.
+
+        Returns:
+            list: One (boxes, scores) tuple per input frame, where boxes is an
+                  (N, 4) float32 array in xyxy format and scores is an (N,)
+                  float32 array of confidences.
+        """
+        if self.model is None:
+            logger.warning("YOLO model is not loaded. Cannot perform detection.")
+            return [_empty_detections() for _ in frames]
+        if len(frames) == 0:
+            return []
+
+        frames = list(frames)
+        with self._lock:
+            if is_exported_backend(self.backend):
+                results = self._run_fixed_batches(frames)
+            else:
+                results = self._predict(frames)
+
+        batch = []
+        for result in results:
+            boxes = result.boxes
+            batch.append((
+                boxes.xyxy.cpu().numpy().astype(np.float32, copy=False),
+                boxes.conf.cpu().numpy().astype(np.float32, copy=False),
+            ))
+        return batch
+
+    def _predict(self, frames):
+        return self.model(frames, classes=[PERSON_CLASS_ID], conf=self.confidence_threshold,
+                          imgsz=self.imgsz, verbose=False)
+
+    def _run_fixed_batches(self, frames):
+        """
+        Runs an exported model, whose batch size is fixed, over any number of frames
+        by splitting them into chunks and padding the last one.
+        """
+        results = []
+        for start in range(0, len(frames), self.batch_size):
+            chunk = frames[start:start + self.batch_size]
+            count = len(chunk)
+            chunk += [chunk[-1]] * (self.batch_size - count)
+            results.extend(self._predict(chunk)[:count])
+        return results
+
+
+def _empty_detections():
+    return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
@@ -0,0 +1,157 @@
+import threading
+import time
+
+
+class CachedIdentity:
+    """
+    The last recognition result for a track.
+    """
+    __slots__ = ('name', 'distance', 'face_offset', 'bbox', 'timestamp')
+
+    def __init__(self, name, distance, face_offset, bbox, timestamp):
+        self.name = name
+        self.distance = distance
+        # Face box relative to the track box's top-left corner, or None.
+        self.face_offset = face_offset
+        # Track box (x, y, w, h) at the time of recognition.
+        self.bbox = bbox
+        self.timestamp = timestamp
+
+    def face_bbox_at(self, bbox):
+        """
+        Projects the cached face box onto the track's current position.
+
+        Args:
+            bbox (tuple): The current track box (x, y, w, h).
+
+        Returns:
+            tuple or None: The face box (x1, y1, x2, y2) in frame coordinates.
+        """
+        if self.face_offset is None:
+            return None
+        x, y = max(0, int(bbox[0])), max(0, int(bbox[1]))
+        x1, y1, x2, y2 = self.face_offset
+        return (x1 + x, y1 + y, x2 + x, y2 + y)
+
+
+class IdentityCache:
+    """
+    Caches recognition results per track ID so a tracked person is not
+    re-encoded on every frame.
+
+    A cached identity is reused while it is fresh: a confident match (distance
+    at most `confident_distance`) stays valid for `ttl` seconds, while weak
+    matches and "Unknown" results are re-verified after `recheck_ttl` seconds.
+    Any entry is also re-verified as soon as the track box changes scale or
+    aspect ratio by more than `max_shape_change`, which usually means the
+    tracker has jumped to someone else or the person turned or moved closer.
+    """
+    def __init__(self, ttl=5.0, recheck_ttl=1.0, confident_distance=0.45, max_shape_change=0.5, on_store=None):
+        """
+        Initializes the IdentityCache.
+
+        Args:
+            ttl (float): Lifetime in seconds of a confident match.
+            recheck_ttl (float): Lifetime in seconds of weak matches and "Unknown" results.
+            confident_distance (float): Maximum face distance of a confident match.
+            max_shape_change (float): Maximum relative change of the track box area or
+                aspect ratio before the identity is re-verified.
+            on_store (callable or None): Called as on_store(track_id, name, distance,
+                face_bbox, timestamp) for every stored recognition result.
+        """
+        self.ttl = ttl
+        self.recheck_ttl = recheck_ttl
+        self.confident_distance = confident_distance
+        self.max_shape_change = max_shape_change
+        self.on_store = on_store
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, track_id, bbox, now=None):
+        """
+        Returns the cached identity of a track if it can be reused for this frame.
+
+        Args:
+            track_id (int): The track ID.
+            bbox (tuple): The current track box (x, y, w, h).
+            now (float or None): The current time, defaults to time.time().
+
+        Returns:
+            CachedIdentity or None: The identity, or None if recognition should run.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(track_id)
+            if entry is not None and self._is_fresh(entry, bbox, now):
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def peek(self, track_id):
+        """
+        Returns the cached identity of a track regardless of its freshness.
+        """
+        with self._lock:
+            return self._entries.get(track_id)
+
+    def store(self, track_id, bbox, name, distance, face_bbox, now=None):
+        """
+        Stores a recognition result for a track.
+
+        Args:
+            track_id (int): The track ID.
+            bbox (tuple): The track box (x, y, w, h) recognition ran on.
+            name (str): The recognized name or "Unknown".
+            distance (float or None): The face distance of the best match.
+            face_bbox (tuple or None): The face box (x1, y1, x2, y2) in frame coordinates.
+            now (float or None): The current time, defaults to time.time().
+        """
+        now = time.time() if now is None else now
+        face_offset = None
+        if face_bbox is not None:
+            x, y = max(0, int(bbox[0])), max(0, int(bbox[1]))
+            face_offset = (face_bbox[0] - x, face_bbox[1] - y, face_bbox[2] - x, face_bbox[3] - y)
+        with self._lock:
+            self._entries[track_id] = CachedIdentity(name, distance, face_offset, tuple(bbox), now)
+        if self.on_store is not None:
+            self.on_store(track_id, name, distance, face_bbox, now)
+
+    def prune(self, active_track_ids):
+        """
+        Forgets the identities of tracks that are no longer active.
+        """
+        active_track_ids = set(active_track_ids)
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if k in active_track_ids}
+
+    def stats(self):
+        """
+        Returns the cache hit rate and the number of face encodings it saved.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'encodes_saved': self.hits,
+        }
+
+    def _is_fresh(self, entry, bbox, now):
+        confident = entry.name != "Unknown" and entry.distance is not None \
+            and entry.distance <= self.confident_distance
+        ttl = self.ttl if confident else self.recheck_ttl
+        if now - entry.timestamp > ttl:
+            return False
+        return self._shape_change(entry.bbox, bbox) <= self.max_shape_change
+
+    @staticmethod
+    def _shape_change(old, new):
+        old_area = max(old[2] * old[3], 1e-9)
+        new_area = max(new[2] * new[3], 1e-9)
+        old_aspect = old[2] / max(old[3], 1e-9)
+        new_aspect = new[2] / max(new[3], 1e-9)
+        return max(abs(new_area / old_area - 1.0), abs(new_aspect / max(old_aspect, 1e-9) - 1.0))
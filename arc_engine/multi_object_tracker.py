@@ -0,0 +1,247 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Constant-velocity Kalman model over [cx, cy, area, aspect, vcx, vcy, varea], as in SORT.
+_F = np.eye(7)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_H = np.eye(4, 7)
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 1e-4])
+_R = np.diag([1.0, 1.0, 10.0, 10.0])
+_P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    Computes the pairwise IoU between two sets of boxes.
+
+    Args:
+        boxes_a (numpy.ndarray): An (N, 4) array of boxes in xyxy format.
+        boxes_b (numpy.ndarray): An (M, 4) array of boxes in xyxy format.
+
+    Returns:
+        numpy.ndarray: An (N, M) array of IoU values.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+def _xyxy_to_z(boxes):
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    return np.stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w * h, w / np.maximum(h, 1e-9)], axis=1)
+
+
+def _x_to_xyxy(states):
+    w = np.sqrt(np.clip(states[:, 2] * states[:, 3], 0, None))
+    h = states[:, 2] / np.maximum(w, 1e-9)
+    cx, cy = states[:, 0], states[:, 1]
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+
+class MultiObjectTracker:
+    """
+    A SORT/ByteTrack-style multi-object tracker.
+
+    All track states are kept in stacked NumPy arrays so that Kalman prediction,
+    correction and the IoU cost matrix are computed for every track at once, and
+    detections are assigned to tracks with the Hungarian algorithm. Detections
+    are associated in two rounds, high-confidence first and low-confidence
+    second, so that briefly occluded people keep their track IDs.
+    """
+    def __init__(self, iou_threshold=0.3, max_age=30, min_hits=3, high_threshold=0.5, low_threshold=0.1,
+                 confidence_decay=0.95):
+        """
+        Initializes the MultiObjectTracker.
+
+        Args:
+            iou_threshold (float): Minimum IoU for a detection to be assigned to a track.
+            max_age (int): Number of consecutive detection frames a track may go
+                unmatched before it is deleted.
+            min_hits (int): Number of matched detections before a track is reported.
+            high_threshold (float): Detections at or above this confidence are
+                associated first and may start new tracks.
+            low_threshold (float): Detections below this confidence are ignored.
+            confidence_decay (float): Per-frame decay of a track's confidence while it
+                is propagated by the motion model without a detection.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.high_threshold = high_threshold
+        self.low_threshold = low_threshold
+        self.confidence_decay = confidence_decay
+        self.reset()
+
+    def reset(self):
+        """
+        Removes all tracks.
+        """
+        self.states = np.empty((0, 7))
+        self.covariances = np.empty((0, 7, 7))
+        self.track_ids = np.empty((0,), dtype=np.int64)
+        self.hits = np.empty((0,), dtype=np.int64)
+        self.misses = np.empty((0,), dtype=np.int64)
+        self.scores = np.empty((0,))
+        self.coasting = np.empty((0,), dtype=np.int64)
+        self.frame_count = 0
+        # Detection runs, which the warm-up counts; propagated frames add no hits.
+        self.detection_count = 0
+        self._next_id = 1
+
+    def update(self, boxes=None, scores=None):
+        """
+        Advances all tracks by one frame and, if given, associates new detections.
+
+        Passing no detections propagates the tracks with the motion model only,
+        which is how frames between two detection runs are handled.
+
+        Args:
+            boxes (numpy.ndarray): An (N, 4) array of detected boxes in xyxy format.
+            scores (numpy.ndarray): An (N,) array of detection confidences.
+
+        Returns:
+            list: The active tracks, as returned by get_active_tracks.
+        """
+        self.frame_count += 1
+        self._predict()
+        if boxes is not None:
+            self.detection_count += 1
+            boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+            scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+            self._associate(boxes, scores)
+        return self.get_active_tracks()
+
+    def get_active_tracks(self):
+        """
+        Returns the confirmed tracks that were matched on the last detection frame.
+
+        Returns:
+            list: A list of dictionaries with 'track_id', 'box' (xyxy) and 'confidence'.
+        """
+        confirmed = (self.hits >= self.min_hits) | (self.detection_count <= self.min_hits)
+        active = np.flatnonzero(confirmed & (self.misses == 0))
+        boxes = _x_to_xyxy(self.states[active])
+        return [
+            {'track_id': int(track_id), 'box': box, 'confidence': float(score)}
+            for track_id, box, score in zip(self.track_ids[active].tolist(), boxes.tolist(),
+                                            self.scores[active].tolist())
+        ]
+
+    def confidence(self):
+        """
+        Returns the mean confidence of the active tracks, decayed by the number of
+        frames each has been propagated without a detection, or 0.0 if there are none.
+        """
+        active = self.misses == 0
+        if not active.any():
+            return 0.0
+        decayed = self.scores[active] * self.confidence_decay ** self.coasting[active]
+        return float(decayed.mean())
+
+    def _predict(self):
+        if len(self.states) == 0:
+            return
+        self.coasting += 1
+        # Keep the predicted area positive.
+        shrinking = self.states[:, 2] + self.states[:, 6] <= 0
+        self.states[shrinking, 6] = 0.0
+        self.states = self.states @ _F.T
+        self.covariances = _F @ self.covariances @ _F.T + _Q
+
+    def _associate(self, boxes, scores):
+        keep = scores >= self.low_threshold
+        boxes, scores = boxes[keep], scores[keep]
+        high = scores >= self.high_threshold
+
+        unmatched_tracks = np.arange(len(self.states))
+        matched_tracks, matched_dets = [], []
+
+        # First round: all tracks against high-confidence detections.
+        high_idx = np.flatnonzero(high)
+        rows, cols = self._match(unmatched_tracks, boxes[high_idx])
+        matched_tracks.append(unmatched_tracks[rows])
+        matched_dets.append(high_idx[cols])
+        unmatched_tracks = np.delete(unmatched_tracks, rows)
+        unmatched_high = np.delete(high_idx, cols)
+
+        # Second round: leftover tracks against low-confidence detections.
+        low_idx = np.flatnonzero(~high)
+        rows, cols = self._match(unmatched_tracks, boxes[low_idx])
+        matched_tracks.append(unmatched_tracks[rows])
+        matched_dets.append(low_idx[cols])
+        unmatched_tracks = np.delete(unmatched_tracks, rows)
+
+        matched_tracks = np.concatenate(matched_tracks)
+        matched_dets = np.concatenate(matched_dets)
+        self._correct(matched_tracks, _xyxy_to_z(boxes[matched_dets]))
+        self.hits[matched_tracks] += 1
+        self.misses[matched_tracks] = 0
+        self.coasting[matched_tracks] = 0
+        self.scores[matched_tracks] = scores[matched_dets]
+        self.misses[unmatched_tracks] += 1
+
+        alive = self.misses <= self.max_age
+        self._keep(alive)
+        self._spawn(boxes[unmatched_high], scores[unmatched_high])
+
+    def _match(self, track_idx, det_boxes):
+        """
+        Hungarian assignment on the IoU between predicted track boxes and detections.
+
+        Returns:
+            tuple: Matched positions within track_idx and within det_boxes.
+        """
+        empty = np.empty((0,), dtype=np.int64)
+        if len(track_idx) == 0 or len(det_boxes) == 0:
+            return empty, empty
+        iou = iou_matrix(_x_to_xyxy(self.states[track_idx]), det_boxes)
+        rows, cols = linear_sum_assignment(-iou)
+        valid = iou[rows, cols] >= self.iou_threshold
+        return rows[valid], cols[valid]
+
+    def _correct(self, idx, measurements):
+        if len(idx) == 0:
+            return
+        x = self.states[idx]
+        p = self.covariances[idx]
+        innovation = measurements - x @ _H.T
+        s = _H @ p @ _H.T + _R
+        gain = p @ _H.T @ np.linalg.inv(s)
+        self.states[idx] = x + np.einsum('nij,nj->ni', gain, innovation)
+        self.covariances[idx] = (np.eye(7) - gain @ _H) @ p
+
+    def _keep(self, mask):
+        self.states = self.states[mask]
+        self.covariances = self.covariances[mask]
+        self.track_ids = self.track_ids[mask]
+        self.hits = self.hits[mask]
+        self.misses = self.misses[mask]
+        self.scores = self.scores[mask]
+        self.coasting = self.coasting[mask]
+
+    def _spawn(self, boxes, scores):
+        count = len(boxes)
+        if count == 0:
+            return
+        states = np.zeros((count, 7))
+        states[:, :4] = _xyxy_to_z(boxes)
+        new_ids = np.arange(self._next_id, self._next_id + count)
+        self._next_id += count
+        self.states = np.concatenate([self.states, states])
+        self.covariances = np.concatenate([self.covariances, np.broadcast_to(_P0, (count, 7, 7))])
+        self.track_ids = np.concatenate([self.track_ids, new_ids])
+        self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int64)])
+        self.misses = np.concatenate([self.misses, np.zeros(count, dtype=np.int64)])
+        self.scores = np.concatenate([self.scores, scores])
+        self.coasting = np.concatenate([self.coasting, np.zeros(count, dtype=np.int64)])
+        logger.debug(f"Started {count} new track(s): {new_ids.tolist()}")
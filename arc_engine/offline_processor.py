@@ -0,0 +1,462 @@
+"""
+Headless, parallel processing of recorded footage.
+
+The video is split into chunks starting at keyframes, and the chunks are
+processed in parallel worker processes, each with its own detector, tracker
+and recognition state. Every chunk also processes the first `overlap`
+frames of the next chunk; tracks of neighbouring chunks that cover the same
+person in those frames are stitched into one track. The tracks, the
+identifications and a per-track summary are written as JSONL or Parquet.
+
+Usage:
+    python -m arc_engine.offline_processor incident.mp4 --output-dir out/ --workers 8
+    python -m arc_engine.offline_processor incident.mp4 --output-dir out/ --format parquet --stride 2
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TRACK_FIELDS = ('track_id', 'frame', 'timestamp', 'x1', 'y1', 'x2', 'y2', 'confidence')
+IDENTIFICATION_FIELDS = ('track_id', 'frame', 'timestamp', 'name', 'distance', 'fx1', 'fy1', 'fx2', 'fy2')
+
+_resources = None  # SharedResources of a worker process
+
+
+def video_info(path):
+    """
+    Returns the frame count, frame rate, width and height of a video file.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video {path}.")
+    info = {
+        'frames': int(capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+        'fps': capture.get(cv2.CAP_PROP_FPS) or 30.0,
+        'width': int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+    capture.release()
+    return info
+
+
+def keyframe_indices(path, fps):
+    """
+    Returns the frame indices of the video's keyframes, read with ffprobe.
+
+    Returns:
+        list or None: Sorted keyframe indices, or None if ffprobe is unavailable.
+    """
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return None
+    command = [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey',
+               '-show_entries', 'frame=pts_time', '-of', 'csv=p=0', path]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True, timeout=600).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not read keyframes with ffprobe: {e}")
+        return None
+    times = [float(line.strip().rstrip(',')) for line in output.splitlines() if line.strip().rstrip(',')]
+    return sorted({int(round(t * fps)) for t in times})
+
+
+def plan_chunks(frame_count, workers, keyframes=None, chunk_frames=None, min_chunk_frames=300):
+    """
+    Splits [0, frame_count) into chunks, starting each chunk at a keyframe if known.
+
+    Args:
+        frame_count (int): The number of frames in the video.
+        workers (int): The number of worker processes; about four chunks are
+            planned per worker so that uneven chunks balance out.
+        keyframes (list or None): Keyframe indices to start chunks at. Without
+            them chunks start anywhere and each seek decodes from the preceding keyframe.
+        chunk_frames (int or None): The target chunk length, overriding the default.
+        min_chunk_frames (int): The shortest chunk worth a separate task.
+
+    Returns:
+        list: (start, end) frame ranges covering the video.
+    """
+    if frame_count <= 0:
+        return []
+    target = chunk_frames or max(min_chunk_frames, math.ceil(frame_count / (4 * max(1, workers))))
+    starts = [0]
+    for ideal in range(target, frame_count, target):
+        start = ideal
+        if keyframes:
+            # The keyframe closest to the ideal boundary.
+            i = int(np.searchsorted(keyframes, ideal))
+            nearby = [keyframes[j] for j in (i - 1, i) if 0 <= j < len(keyframes)]
+            start = min(nearby, key=lambda k: abs(k - ideal))
+        if start > starts[-1] and start < frame_count:
+            starts.append(start)
+    return list(zip(starts, starts[1:] + [frame_count]))
+
+
+def _init_worker(db_path, recognize, threads):
+    global _resources
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from arc_engine.shared_resources import SharedResources
+    # The parent has synced the gallery snapshot; workers only read it.
+    _resources = SharedResources(db_path=db_path, recognition=recognize, sync_snapshot=False)
+
+
+def _process_chunk(task):
+    """
+    Worker: detects, tracks and recognizes the people in one chunk (plus the overlap).
+
+    Returns:
+        dict: The task, the track rows and identification rows (with chunk-local
+              track IDs) and the number of frames processed.
+    """
+    from arc_engine.identity_cache import IdentityCache
+    from arc_engine.target_tracking_module import TargetTrackingModule
+
+    started = time.perf_counter()
+    detector = _resources.human_detection_module
+    recognizer = None
+    if _resources.facial_recognition_module is not None:
+        recognizer = _resources.facial_recognition_module.for_feed()
+    tracking = TargetTrackingModule(mode='multi')
+    identity_cache = IdentityCache()
+    fps = task['fps']
+    stride = task['stride']
+
+    capture = cv2.VideoCapture(task['path'])
+    capture.set(cv2.CAP_PROP_POS_FRAMES, task['start'])
+    tracks, identifications = [], []
+    processed = 0
+    index = task['start']
+    while index < task['read_end']:
+        frames, indices = [], []
+        while len(frames) < task['batch'] and index < task['read_end']:
+            # Frames are picked by their global index, so that neighbouring chunks
+            # process the same frames of their overlap whatever their lengths.
+            if index % stride == 0:
+                status, frame = capture.read()
+                if status:
+                    frames.append(frame)
+                    indices.append(index)
+            else:
+                # grab() skips the colour conversion of frames that are not processed.
+                status = capture.grab()
+            if not status:
+                index = task['read_end']
+                break
+            index += 1
+        if not frames:
+            break
+
+        for frame, frame_index, (boxes, scores) in zip(frames, indices, detector.detect_humans_batch(frames)):
+            timestamp = frame_index / fps
+            active = tracking.update_tracks(boxes, scores)
+            active_ids = {track['track_id'] for track in active}
+            identity_cache.prune(active_ids)
+            for track in active:
+                x1, y1, x2, y2 = (float(v) for v in track['box'])
+                tracks.append((track['track_id'], frame_index, x1, y1, x2, y2, track['confidence']))
+                if recognizer is None:
+                    continue
+                bbox = (x1, y1, x2 - x1, y2 - y1)
+                if identity_cache.lookup(track['track_id'], bbox, now=timestamp) is not None:
+                    continue
+                xyxy = (max(0, int(x1)), max(0, int(y1)), int(x2), int(y2))
+                name, face_bbox, distance = recognizer.recognize_face_with_distance(frame, xyxy,
+                                                                                    track_id=track['track_id'])
+                if name:
+                    identity_cache.store(track['track_id'], bbox, name, distance, face_bbox, now=timestamp)
+                    identifications.append((track['track_id'], frame_index, name, distance, face_bbox))
+            if recognizer is not None and recognizer.quality_gate is not None:
+                recognizer.quality_gate.prune(active_ids)
+            processed += 1
+    capture.release()
+    return {'task': task, 'tracks': tracks, 'identifications': identifications, 'frames': processed,
+            'seconds': time.perf_counter() - started}
+
+
+class TrackStitcher:
+    """
+    Assigns global track IDs to the chunk-local tracks, in chunk order.
+
+    A track of chunk k continues a track of chunk k-1 when the two overlap by
+    at least `iou_threshold` on average over at least `min_common_frames` of
+    the frames both chunks processed.
+    """
+
+    def __init__(self, iou_threshold=0.3, min_common_frames=3):
+        self.iou_threshold = iou_threshold
+        self.min_common_frames = min_common_frames
+        self._ids = itertools.count(1)
+        self._previous = None  # (global ID map, overlap rows by frame) of the last chunk
+        self.stitched = 0
+
+    def add(self, result):
+        """
+        Maps a chunk's local track IDs to global ones.
+
+        Returns:
+            dict: local track ID -> global track ID, for tracks with rows in the
+                  frames the chunk owns.
+        """
+        from arc_engine.multi_object_tracker import iou_matrix
+
+        task = result['task']
+        owned = {}
+        if self._previous is not None:
+            previous_ids, previous_rows = self._previous
+            current_rows = _rows_by_frame(result['tracks'], task['start'], task['end'])
+            totals = {}
+            for frame, (prev_ids, prev_boxes) in previous_rows.items():
+                if frame not in current_rows:
+                    continue
+                cur_ids, cur_boxes = current_rows[frame]
+                iou = iou_matrix(prev_boxes, cur_boxes)
+                for i, j in zip(*np.nonzero(iou > 0)):
+                    total = totals.setdefault((prev_ids[i], cur_ids[j]), [0.0, 0])
+                    total[0] += iou[i, j]
+                    total[1] += 1
+            pairs = sorted(((s / n, p, c) for (p, c), (s, n) in totals.items() if n >= self.min_common_frames),
+                           reverse=True)
+            used_prev, used_cur = set(), set()
+            for mean_iou, prev_id, cur_id in pairs:
+                if mean_iou < self.iou_threshold:
+                    break
+                if prev_id in used_prev or cur_id in used_cur:
+                    continue
+                used_prev.add(prev_id)
+                used_cur.add(cur_id)
+                if prev_id not in previous_ids:
+                    previous_ids[prev_id] = next(self._ids)
+                owned[cur_id] = previous_ids[prev_id]
+                self.stitched += 1
+
+        for track_id, frame, *_ in result['tracks']:
+            if task['start'] <= frame < task['end'] and track_id not in owned:
+                owned[track_id] = next(self._ids)
+        # Tracks first seen in the overlap get their global ID when the next chunk claims them.
+        self._previous = (owned, _rows_by_frame(result['tracks'], task['end'], task['read_end']))
+        return owned
+
+
+def _rows_by_frame(rows, start, end):
+    by_frame = {}
+    for track_id, frame, x1, y1, x2, y2, _ in rows:
+        if start <= frame < end:
+            by_frame.setdefault(frame, ([], []))
+            by_frame[frame][0].append(track_id)
+            by_frame[frame][1].append((x1, y1, x2, y2))
+    return {frame: (ids, np.array(boxes, dtype=np.float32)) for frame, (ids, boxes) in by_frame.items()}
+
+
+class ResultWriter:
+    """
+    Writes tracks and identifications as JSONL files, or collects them for Parquet.
+    """
+
+    def __init__(self, output_dir, output_format='jsonl'):
+        if output_format not in ('jsonl', 'parquet'):
+            raise ValueError(f"Unknown output format '{output_format}'.")
+        if output_format == 'parquet':
+            import pandas  # noqa: F401 (fail before processing, not after)
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self._rows = {'tracks': [], 'identifications': []}
+        self._files = {}
+        if output_format == 'jsonl':
+            for table in self._rows:
+                self._files[table] = open(os.path.join(output_dir, f'{table}.jsonl'), 'w')
+
+    def write(self, table, rows):
+        if self.output_format == 'parquet':
+            self._rows[table].extend(rows)
+            return
+        fields = TRACK_FIELDS if table == 'tracks' else IDENTIFICATION_FIELDS
+        out = self._files[table]
+        for row in rows:
+            out.write(json.dumps(dict(zip(fields, row))) + "\n")
+
+    def close(self):
+        if self.output_format == 'parquet':
+            import pandas as pd
+            for table, fields in (('tracks', TRACK_FIELDS), ('identifications', IDENTIFICATION_FIELDS)):
+                frame = pd.DataFrame(self._rows[table], columns=list(fields))
+                frame.to_parquet(os.path.join(self.output_dir, f'{table}.parquet'), index=False)
+        for out in self._files.values():
+            out.close()
+
+
+def process_video(path, output_dir, workers=None, output_format='jsonl', db_path='data/known_faces.db',
+                  recognize=True, stride=1, batch=8, overlap=30, chunk_frames=None):
+    """
+    Processes a video file with parallel workers and writes the results.
+
+    Args:
+        path (str): The video file.
+        output_dir (str): Where tracks, identifications and summary.json are written.
+        workers (int or None): Worker processes, defaults to the number of CPUs.
+        output_format (str): 'jsonl' or 'parquet' (needs pandas and pyarrow).
+        db_path (str): The known faces database.
+        recognize (bool): Whether to run face recognition on the tracks.
+        stride (int): Process every stride-th frame.
+        batch (int): Frames per detector call.
+        overlap (int): Frames of the next chunk each chunk also processes, for stitching.
+        chunk_frames (int or None): Chunk length in frames; see plan_chunks.
+
+    Returns:
+        dict: The run summary, also written to summary.json.
+    """
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    info = video_info(path)
+    keyframes = keyframe_indices(path, info['fps'])
+    chunks = plan_chunks(info['frames'], workers, keyframes, chunk_frames)
+    if not chunks:
+        raise ValueError(f"{path} has no frames.")
+    logger.info(f"Processing {info['frames']} frames of {path} in {len(chunks)} chunks with {workers} workers "
+                f"({'keyframe' if keyframes else 'even'} split).")
+
+    if recognize:
+        # Bring the gallery snapshot up to date once, so workers only read it.
+        from communication.database_manager import DatabaseManager
+        db_manager = DatabaseManager(db_path)
+        db_manager.sync_gallery_snapshot()
+        db_manager.close_connection()
+
+    tasks = [{'path': path, 'index': i, 'start': start, 'end': end,
+              'read_end': min(info['frames'], end + overlap * stride) if i + 1 < len(chunks) else end,
+              'fps': info['fps'], 'stride': max(1, stride), 'batch': max(1, batch)}
+             for i, (start, end) in enumerate(chunks)]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    stitcher = TrackStitcher()
+    writer = ResultWriter(output_dir, output_format)
+    summaries = {}
+    frames_processed = 0
+    pending = {}
+    next_chunk = 0
+    context = mp.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(db_path, recognize, threads)) as executor:
+            futures = [executor.submit(_process_chunk, task) for task in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                pending[result['task']['index']] = result
+                # Stitch and write in chunk order; later chunks wait for their predecessor.
+                while next_chunk in pending:
+                    result = pending.pop(next_chunk)
+                    frames_processed += result['frames']
+                    _write_chunk(result, stitcher.add(result), writer, summaries, info['fps'])
+                    next_chunk += 1
+                    logger.info(f"Chunk {next_chunk}/{len(tasks)} done ({result['frames']} frames in "
+                                f"{result['seconds']:.1f} s).")
+    finally:
+        writer.close()
+
+    wall_seconds = time.perf_counter() - started
+    duration = info['frames'] / info['fps']
+    summary = {
+        'video': path,
+        'frames': info['frames'],
+        'fps': info['fps'],
+        'duration_seconds': duration,
+        'frames_processed': frames_processed,
+        'chunks': len(chunks),
+        'keyframe_split': keyframes is not None,
+        'workers': workers,
+        'wall_seconds': wall_seconds,
+        'speed_vs_real_time': duration / wall_seconds if wall_seconds > 0 else None,
+        'tracks_stitched': stitcher.stitched,
+        'tracks': [_finish_track_summary(track_id, s) for track_id, s in sorted(summaries.items())],
+    }
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def _write_chunk(result, global_ids, writer, summaries, fps):
+    task = result['task']
+    tracks = []
+    for track_id, frame, x1, y1, x2, y2, confidence in result['tracks']:
+        if not task['start'] <= frame < task['end']:
+            continue
+        global_id = global_ids[track_id]
+        tracks.append((global_id, frame, frame / fps, x1, y1, x2, y2, confidence))
+        summary = summaries.setdefault(global_id, {'first_frame': frame, 'last_frame': frame, 'frames': 0,
+                                                   'names': {}})
+        summary['first_frame'] = min(summary['first_frame'], frame)
+        summary['last_frame'] = max(summary['last_frame'], frame)
+        summary['frames'] += 1
+    identifications = []
+    for track_id, frame, name, distance, face_bbox in result['identifications']:
+        if not task['start'] <= frame < task['end']:
+            continue
+        global_id = global_ids[track_id]
+        face = tuple(face_bbox) if face_bbox is not None else (None,) * 4
+        identifications.append((global_id, frame, frame / fps, name,
+                                None if distance is None else float(distance), *face))
+        names = summaries[global_id]['names']
+        count, best = names.get(name, (0, None))
+        if distance is not None and (best is None or distance < best):
+            best = float(distance)
+        names[name] = (count + 1, best)
+    writer.write('tracks', tracks)
+    writer.write('identifications', identifications)
+
+
+def _finish_track_summary(track_id, summary):
+    """
+    Picks the track's identity: the most frequent name other than "Unknown".
+    """
+    names = summary.pop('names')
+    known = {name: value for name, value in names.items() if name != "Unknown"}
+    name, best = None, None
+    if known:
+        name = max(known, key=lambda n: (known[n][0], -(known[n][1] if known[n][1] is not None else 1e9)))
+        best = known[name][1]
+    elif names:
+        name = "Unknown"
+    summary.update({'track_id': track_id, 'name': name, 'best_distance': best,
+                    'identifications': sum(count for count, _ in names.values())})
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', help="The recorded video file.")
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl')
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument('--db', default='data/known_faces.db', help="The known faces database.")
+    parser.add_argument('--no-recognition', action='store_true', help="Only detect and track.")
+    parser.add_argument('--stride', type=int, default=1, help="Process every N-th frame.")
+    parser.add_argument('--batch', type=int, default=8, help="Frames per detector call.")
+    parser.add_argument('--overlap', type=int, default=30, help="Frames shared by neighbouring chunks.")
+    parser.add_argument('--chunk-frames', type=int, default=None)
+    args = parser.parse_args()
+
+    summary = process_video(args.video, args.output_dir, workers=args.workers, output_format=args.format,
+                            db_path=args.db, recognize=not args.no_recognition, stride=args.stride,
+                            batch=args.batch, overlap=args.overlap, chunk_frames=args.chunk_frames)
+    summary.pop('tracks')
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
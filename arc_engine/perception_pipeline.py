@@ -0,0 +1,412 @@
+import queue
+import threading
+import time
+from utils.logger import get_logger
+from utils.metrics import metrics
+from arc_engine.identity_cache import IdentityCache
+
+logger = get_logger(__name__)
+
+# Overflow policies for the queues connecting pipeline stages.
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+BLOCK = 'block'
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class StageQueue:
+    """
+    A bounded queue connecting two pipeline stages.
+
+    When the queue is full, 'drop_oldest' discards the stalest queued item to
+    make room, 'drop_newest' discards the incoming item, and 'block' waits for
+    the consumer to catch up.
+    """
+    def __init__(self, name, maxsize=2, drop_policy=DROP_OLDEST):
+        """
+        Initializes the StageQueue.
+
+        Args:
+            name (str): A name used in statistics and log messages.
+            maxsize (int): The maximum number of queued items.
+            drop_policy (str): One of 'drop_oldest', 'drop_newest' or 'block'.
+        """
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}'. Expected one of {DROP_POLICIES}.")
+        self.name = name
+        self.drop_policy = drop_policy
+        self.queue = queue.Queue(maxsize=max(1, maxsize))
+        self.dropped = 0
+        self.closed = False
+        self._put_lock = threading.Lock()
+
+    def put(self, item):
+        """
+        Enqueues an item according to the queue's drop policy.
+
+        Args:
+            item: The item to enqueue.
+
+        Returns:
+            bool: True if the item was enqueued, False if it was dropped.
+        """
+        if self.drop_policy == BLOCK:
+            while not self.closed:
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        with self._put_lock:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                pass
+
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return False
+
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(item)
+            return True
+
+    def get(self, timeout=0.1):
+        """
+        Dequeues an item, waiting up to `timeout` seconds.
+
+        Returns:
+            The dequeued item, or None if the queue stayed empty.
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_latest(self, timeout=0.1):
+        """
+        Dequeues the newest available item, discarding any older ones.
+
+        Returns:
+            The newest item, or None if the queue stayed empty.
+        """
+        item = self.get(timeout=timeout)
+        while True:
+            try:
+                item = self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                return item
+
+    def close(self):
+        """
+        Releases any producer blocked on a full queue.
+        """
+        self.closed = True
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+class FramePacket:
+    """
+    A frame travelling through the pipeline together with the results each
+    stage has attached to it.
+    """
+    __slots__ = ('seq', 'frame', 'timestamp', 'status', 'detections', 'tracks', 'track_id',
+                 'bbox', 'name', 'face_bbox', 'message', 'processing_ms')
+
+    def __init__(self, seq, frame, timestamp, status=True):
+        self.seq = seq
+        self.frame = frame
+        self.timestamp = timestamp
+        self.status = status
+        self.detections = None
+        self.tracks = None
+        self.track_id = None
+        self.bbox = None
+        self.name = None
+        self.face_bbox = None
+        self.message = "Status: Idle"
+        self.processing_ms = 0.0
+
+
+class PerceptionPipeline:
+    """
+    Runs capture, detection, tracking and recognition as separate worker
+    threads connected by bounded queues, so that end-to-end throughput is
+    limited by the slowest stage rather than the sum of all stages.
+
+    In single-target mode detection only runs while the tracking stage has no
+    target; in multi-target mode it runs on every frame. Recognition
+    runs off the critical path: the tracking stage hands it a copy of the
+    tracked crop and keeps going, and the identity it produces is cached per
+    track and attached to every later frame of the same track.
+    """
+    def __init__(self, video_stream_processor, human_detection_module, target_tracking_module,
+                 facial_recognition_module, detection_scheduler=None, identity_cache=None, queue_size=2,
+                 drop_policy=DROP_OLDEST, recognition_drop_policy=DROP_OLDEST, event_store=None,
+                 feed_name=None):
+        """
+        Initializes the PerceptionPipeline.
+
+        Args:
+            video_stream_processor (VideoStreamProcessor): The frame source.
+            human_detection_module (HumanDetectionModule): The person detector.
+            target_tracking_module (TargetTrackingModule): The target tracker. It is
+                owned exclusively by the tracking stage while the pipeline runs.
+            facial_recognition_module (FacialRecognitionModule): The face recognizer.
+            detection_scheduler (DetectionScheduler): Decides on which frames detection
+                runs while tracking. If None, detection runs on every frame in multi mode
+                and only while no target is tracked in single mode.
+            identity_cache (IdentityCache): Per-track recognition results. Tracks whose
+                cached identity is fresh are not sent to recognition.
+            queue_size (int): The capacity of each inter-stage queue.
+            drop_policy (str): The overflow policy of the frame queues.
+            recognition_drop_policy (str): The overflow policy of the recognition queue.
+            event_store (EventStore or None): If set, the tracking stage records the
+                detections and tracks of every frame it processes.
+            feed_name (str or None): The feed name events are stored under.
+        """
+        self.video_stream_processor = video_stream_processor
+        self.human_detection_module = human_detection_module
+        self.target_tracking_module = target_tracking_module
+        self.facial_recognition_module = facial_recognition_module
+        self.detection_scheduler = detection_scheduler
+        self.event_store = event_store
+        self.feed_name = feed_name
+        self._metrics_feed = feed_name or 'default'
+
+        self.detection_queue = StageQueue('detection', queue_size, drop_policy)
+        self.tracking_queue = StageQueue('tracking', queue_size, drop_policy)
+        self.recognition_queue = StageQueue('recognition', queue_size, recognition_drop_policy)
+        self.output_queue = StageQueue('output', queue_size, DROP_OLDEST)
+
+        self._stop_event = threading.Event()
+        self._detection_requested = threading.Event()
+        self._detection_requested.set()
+        self.identity_cache = identity_cache if identity_cache is not None else IdentityCache()
+        self._threads = []
+        self.frames_processed = {'capture': 0, 'detection': 0, 'tracking': 0, 'recognition': 0}
+
+    def start(self):
+        """
+        Starts one worker thread per stage.
+        """
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for name, target in (('capture', self._capture_loop),
+                             ('detection', self._detection_loop),
+                             ('tracking', self._tracking_loop),
+                             ('recognition', self._recognition_loop)):
+            thread = threading.Thread(target=self._run_stage, args=(name, target),
+                                      name=f"arc-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Perception pipeline started.")
+
+    def stop(self, timeout=2.0):
+        """
+        Signals all stages to stop and waits for their threads to exit.
+        """
+        self._stop_event.set()
+        for stage_queue in (self.detection_queue, self.tracking_queue,
+                            self.recognition_queue, self.output_queue):
+            stage_queue.close()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        logger.info("Perception pipeline stopped.")
+
+    def get_result(self, timeout=1.0):
+        """
+        Returns the newest fully processed frame packet, skipping stale ones.
+
+        Returns:
+            FramePacket or None: The packet, or None if nothing arrived in time.
+        """
+        return self.output_queue.get_latest(timeout=timeout)
+
+    def stats(self):
+        """
+        Returns per-stage throughput counters and per-queue depth and drop counts.
+        """
+        queues = (self.detection_queue, self.tracking_queue, self.recognition_queue, self.output_queue)
+        return {
+            'frames_processed': dict(self.frames_processed),
+            'queue_depths': {q.name: q.qsize() for q in queues},
+            'dropped': {q.name: q.dropped for q in queues},
+        }
+
+    def _run_stage(self, name, target):
+        try:
+            target()
+        except Exception as e:
+            logger.error(f"Pipeline stage '{name}' crashed: {e}")
+            self.output_queue.put(FramePacket(-1, None, time.time(), status=False))
+
+    def _capture_loop(self):
+        processor = self.video_stream_processor
+        while not self._stop_event.is_set():
+            with metrics.time('capture', self._metrics_feed):
+                status, frame = processor.read_frame()
+            if not status:
+                logger.warning("Failed to read frame from video stream.")
+                self.output_queue.put(FramePacket(processor.last_seq, None, time.time(), status=False))
+                return
+            self.detection_queue.put(FramePacket(processor.last_seq, frame, processor.last_timestamp))
+            self.frames_processed['capture'] += 1
+
+    def _detection_loop(self):
+        while not self._stop_event.is_set():
+            packet = self.detection_queue.get()
+            if packet is None:
+                continue
+            start = time.perf_counter()
+            if self.target_tracking_module.mode == 'multi':
+                if self._should_detect():
+                    packet.detections = self.human_detection_module.detect_humans_batch([packet.frame])[0]
+                    self.frames_processed['detection'] += 1
+            elif self._detection_requested.is_set() or self._should_detect():
+                packet.detections = self.human_detection_module.detect_humans(packet.frame)
+                self.frames_processed['detection'] += 1
+            packet.processing_ms = (time.perf_counter() - start) * 1000.0
+            if packet.detections is not None:
+                metrics.observe('detection', packet.processing_ms, self._metrics_feed)
+            self.tracking_queue.put(packet)
+
+    def _should_detect(self):
+        if self.detection_scheduler is None:
+            return self.target_tracking_module.mode == 'multi'
+        return self.detection_scheduler.should_detect(self.target_tracking_module.tracking_confidence())
+
+    def _tracking_loop(self):
+        tracker = self.target_tracking_module
+        while not self._stop_event.is_set():
+            packet = self.tracking_queue.get()
+            if packet is None:
+                continue
+            start = time.perf_counter()
+
+            if tracker.mode == 'multi':
+                self._update_multi_target(packet)
+            elif tracker.tracker is None:
+                if packet.detections and tracker.select_target(packet.frame, packet.detections):
+                    self._detection_requested.clear()
+                    self._prune_track_state({tracker.track_id})
+                    packet.message = "Status: Target Acquired"
+                    logger.info("Target selected. Starting tracking.")
+            else:
+                if packet.detections is not None and tracker.correct_drift(packet.frame, packet.detections):
+                    success, bbox = True, tracker.tracked_bbox
+                else:
+                    success, bbox = tracker.update_tracker(packet.frame)
+                if success:
+                    packet.message = "Status: Tracking Target"
+                    packet.track_id = tracker.track_id
+                    packet.bbox = bbox
+                    self._submit_recognition(packet)
+                    self._attach_identity(packet)
+                else:
+                    logger.warning("Tracker update failed. Re-acquiring target.")
+                    self._detection_requested.set()
+                    packet.message = "Status: Target Lost, Re-acquiring"
+
+            tracking_ms = (time.perf_counter() - start) * 1000.0
+            metrics.observe('tracking', tracking_ms, self._metrics_feed)
+            packet.processing_ms += tracking_ms
+            if self.detection_scheduler is not None:
+                self.detection_scheduler.record(packet.detections is not None, packet.processing_ms)
+            if self.event_store is not None:
+                self.event_store.record_frame(packet.seq, packet.timestamp, packet.detections, tracker.current_tracks(),
+                                              feed=self.feed_name)
+            self.frames_processed['tracking'] += 1
+            self.output_queue.put(packet)
+
+    def _update_multi_target(self, packet):
+        tracker = self.target_tracking_module
+        if packet.detections is None:
+            packet.tracks = tracker.update_tracks()
+        else:
+            boxes, scores = packet.detections
+            packet.tracks = tracker.update_tracks(boxes, scores)
+        self._prune_track_state({track['track_id'] for track in packet.tracks})
+        if not packet.tracks:
+            return
+        packet.message = f"Status: Tracking {len(packet.tracks)} Targets"
+        packet.track_id = tracker.track_id
+        packet.bbox = tracker.tracked_bbox
+        self._submit_recognition(packet)
+        self._attach_identity(packet)
+
+    def _prune_track_state(self, active_track_ids):
+        self.identity_cache.prune(active_track_ids)
+        if self.facial_recognition_module.quality_gate is not None:
+            self.facial_recognition_module.quality_gate.prune(active_track_ids)
+
+    def _recognition_loop(self):
+        while not self._stop_event.is_set():
+            job = self.recognition_queue.get()
+            if job is None:
+                continue
+            seq, track_id, bbox, crop = job
+            h, w = crop.shape[:2]
+            with metrics.time('recognition', self._metrics_feed):
+                name, face_bbox, distance = self.facial_recognition_module.recognize_face_with_distance(
+                    crop, (0, 0, w, h), track_id=track_id)
+            self.frames_processed['recognition'] += 1
+            if not name:
+                continue
+            if face_bbox is not None:
+                x, y = max(0, int(bbox[0])), max(0, int(bbox[1]))
+                face_bbox = (face_bbox[0] + x, face_bbox[1] + y, face_bbox[2] + x, face_bbox[3] + y)
+            self._store_identity(seq, track_id, bbox, name, distance, face_bbox)
+
+    def _store_identity(self, seq, track_id, bbox, name, distance, face_bbox):
+        previous = self.identity_cache.peek(track_id)
+        self.identity_cache.store(track_id, bbox, name, distance, face_bbox)
+        if previous is None or previous.name != name:
+            logger.info(f"Recognized: {name} (track {track_id}, frame {seq})")
+
+    def _submit_recognition(self, packet):
+        """
+        Queues the tracked crop for recognition unless the track's cached identity is still fresh.
+        """
+        if self.identity_cache.lookup(packet.track_id, packet.bbox) is not None:
+            return
+        x, y, w, h = (int(v) for v in packet.bbox)
+        x1, y1 = max(0, x), max(0, y)
+        if self.facial_recognition_module.encoding_service is not None:
+            # The process pool replaces the recognition thread; results arrive via callback.
+            bbox = tuple(packet.bbox)
+            seq = packet.seq
+
+            def _on_recognized(track_id, name, face_bbox, distance):
+                self.frames_processed['recognition'] += 1
+                if name:
+                    self._store_identity(seq, track_id, bbox, name, distance, face_bbox)
+
+            self.facial_recognition_module.recognize_face_async(packet.frame, (x1, y1, x + w, y + h),
+                                                                packet.track_id, _on_recognized)
+            return
+        crop = packet.frame[y1:y + h, x1:x + w]
+        if crop.size == 0:
+            return
+        # Copy the crop so later drawing on the frame cannot race with recognition.
+        self.recognition_queue.put((packet.seq, packet.track_id, tuple(packet.bbox), crop.copy()))
+
+    def _attach_identity(self, packet):
+        identity = self.identity_cache.peek(packet.track_id)
+        if identity is None:
+            return
+        packet.name = identity.name
+        # Re-project the face box, found on an earlier frame, onto the current track position.
+        packet.face_bbox = identity.face_bbox_at(packet.bbox)
+        packet.message = f"Recognized: {identity.name}"
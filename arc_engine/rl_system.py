@@ -1,62 +1,278 @@
+"""
+Reinforcement learning environment for the ARC system's perception scheduling.
+
+An agent decides, frame by frame, whether the engine only propagates its
+tracks with the motion model, runs the person detector, or runs detection
+and face recognition; it is rewarded for keeping the people in view tracked
+and identified at a low processing cost.
+
+Running the detector on every step would limit training to the detector's
+frame rate, so the perception results are recorded from footage once: a
+ReplayTrace holds, for every frame, the detector's boxes and scores, the
+FaceQualityGate score of each box and the measured detection time. ARCEnv
+replays the trace through the engine's MultiObjectTracker, which costs well
+under a millisecond per step, and make_vec_env runs many environments in
+one process or across subprocesses.
+
+Usage:
+    python -m arc_engine.rl_system record footage.mp4 replays/footage.npz
+"""
+import argparse
+import functools
+import time
+import cv2
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 
 from utils.logger import logger
+from arc_engine.multi_object_tracker import MultiObjectTracker, iou_matrix
+
+PROPAGATE, DETECT, DETECT_AND_RECOGNIZE = 0, 1, 2
+OBSERVATION_FIELDS = ('tracker_confidence', 'fps', 'num_detections', 'face_quality', 'num_tracks',
+                      'frames_since_detection', 'detection_ms', 'identified_fraction',
+                      'frames_since_recognition', 'episode_progress')
+
+
+class ReplayTrace:
+    """
+    Per-frame perception results recorded from footage.
+
+    The detections of all frames are stored in flat arrays; frame i's
+    detections are rows offsets[i]:offsets[i + 1].
+    """
+
+    def __init__(self, offsets, boxes, scores, quality, acceptable, detection_ms, fps=30.0):
+        """
+        Args:
+            offsets (numpy.ndarray): (F + 1,) start row of every frame's detections.
+            boxes (numpy.ndarray): (M, 4) detected boxes in xyxy format.
+            scores (numpy.ndarray): (M,) detection confidences.
+            quality (numpy.ndarray): (M,) FaceQualityGate score of each box's crop.
+            acceptable (numpy.ndarray): (M,) whether the quality gate lets the crop through.
+            detection_ms (numpy.ndarray): (F,) measured detection time of every frame.
+            fps (float): The frame rate of the footage.
+        """
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.quality = np.asarray(quality, dtype=np.float32)
+        self.acceptable = np.asarray(acceptable, dtype=bool)
+        self.detection_ms = np.asarray(detection_ms, dtype=np.float32)
+        self.fps = float(fps)
+
+    @classmethod
+    def from_frames(cls, frames, detection_ms, fps=30.0):
+        """
+        Builds a trace from per-frame (boxes, scores, quality, acceptable) tuples.
+        """
+        counts = [len(frame[0]) for frame in frames]
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        def stack(i, shape):
+            parts = [np.asarray(frame[i]).reshape(shape) for frame in frames]
+            return np.concatenate(parts) if parts else np.empty(shape)
+
+        return cls(offsets, stack(0, (-1, 4)), stack(1, (-1,)), stack(2, (-1,)), stack(3, (-1,)),
+                   detection_ms, fps)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['offsets'], data['boxes'], data['scores'], data['quality'], data['acceptable'],
+                       data['detection_ms'], float(data['fps']))
+
+    def save(self, path):
+        np.savez_compressed(path, offsets=self.offsets, boxes=self.boxes, scores=self.scores,
+                            quality=self.quality, acceptable=self.acceptable,
+                            detection_ms=self.detection_ms, fps=self.fps)
+
+    def __len__(self):
+        return len(self.detection_ms)
+
+    def frame(self, index):
+        """
+        Returns the boxes, scores, quality scores and acceptable flags of a frame.
+        """
+        rows = slice(self.offsets[index], self.offsets[index + 1])
+        return self.boxes[rows], self.scores[rows], self.quality[rows], self.acceptable[rows]
+
+
+def record_replay(video_path, output_path=None, detector=None, quality_gate=None, batch=1, max_frames=None):
+    """
+    Runs footage through the person detector and the face quality gate and
+    records the results as a ReplayTrace.
+
+    Args:
+        video_path (str): The recorded footage.
+        output_path (str or None): If set, the trace is also saved here (.npz).
+        detector (HumanDetectionModule or None): Defaults to a new HumanDetectionModule.
+        quality_gate (FaceQualityGate or None): Defaults to a new FaceQualityGate.
+        batch (int): Frames per detector call. The recorded per-frame detection
+            time is the batch time divided by the batch size, so keep 1 to
+            record the latency the engine sees on a single feed.
+        max_frames (int or None): Stop after this many frames.
+
+    Returns:
+        ReplayTrace: The recorded trace.
+    """
+    if detector is None:
+        from arc_engine.human_detection_module import HumanDetectionModule
+        detector = HumanDetectionModule()
+    if quality_gate is None:
+        from arc_engine.face_quality import FaceQualityGate
+        quality_gate = FaceQualityGate()
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video {video_path}.")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames, detection_ms = [], []
+    done = False
+    while not done:
+        batch_frames = []
+        while len(batch_frames) < batch and (max_frames is None or len(frames) + len(batch_frames) < max_frames):
+            status, frame = capture.read()
+            if not status:
+                done = True
+                break
+            batch_frames.append(frame)
+        if not batch_frames:
+            break
+        start = time.perf_counter()
+        detections = detector.detect_humans_batch(batch_frames)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0 / len(batch_frames)
+        for frame, (boxes, scores) in zip(batch_frames, detections):
+            quality, acceptable = [], []
+            height, width = frame.shape[:2]
+            for x1, y1, x2, y2 in boxes.astype(int):
+                crop = frame[max(0, y1):min(height, y2), max(0, x1):min(width, x2)]
+                assessed = quality_gate.assess(crop) if crop.size else None
+                quality.append(assessed.score if assessed is not None else 0.0)
+                acceptable.append(assessed is not None and assessed.acceptable)
+            frames.append((boxes, scores, quality, acceptable))
+            detection_ms.append(elapsed_ms)
+        if max_frames is not None and len(frames) >= max_frames:
+            break
+    capture.release()
+
+    trace = ReplayTrace.from_frames(frames, detection_ms, fps)
+    logger.info(f"Recorded {len(trace)} frames ({len(trace.boxes)} detections) from {video_path}.")
+    if output_path is not None:
+        trace.save(output_path)
+    return trace
+
 
 class ARCEnv(gym.Env):
     """
     Custom Reinforcement Learning Environment for the ARC System.
+
+    Every step replays one recorded frame. The action chooses what the engine
+    does on it (PROPAGATE, DETECT or DETECT_AND_RECOGNIZE), the recorded
+    detections feed the MultiObjectTracker when detection runs, and the
+    reward is
+
+        coverage + identify_reward * new identities - cost_weight * cost_ms / frame_budget_ms
+
+    where coverage is the fraction of the frame's confident recorded
+    detections covered by an active track (IoU >= 0.5), and the cost adds the
+    recorded detection time and recognition_ms per face recognized. A track
+    is identified when it is recognized on a frame where its crop passes the
+    face quality gate; new track IDs have to be identified again.
     """
     metadata = {'render_modes': ['human']}
 
-    def __init__(self):
+    def __init__(self, replay, episode_length=300, frame_budget_ms=33.3, cost_weight=0.5, identify_reward=1.0,
+                 propagation_ms=1.0, recognition_ms=25.0, reference_confidence=0.5, random_start=True):
+        """
+        Args:
+            replay (ReplayTrace or str): The recorded trace, or the path of one.
+            episode_length (int): Steps per episode (fewer if the trace ends first).
+            frame_budget_ms (float): The processing time available per frame.
+            cost_weight (float): The reward penalty for spending the whole frame budget.
+            identify_reward (float): The reward for every newly identified track.
+            propagation_ms (float): The cost of a frame without detection.
+            recognition_ms (float): The cost of recognizing one face.
+            reference_confidence (float): Recorded detections at or above this score are
+                the people the agent is expected to track.
+            random_start (bool): Start episodes at random frames of the trace.
+        """
         super(ARCEnv, self).__init__()
-        logger.info("Initializing ARC Reinforcement Learning Environment...")
+        self.replay = ReplayTrace.load(replay) if isinstance(replay, str) else replay
+        if len(self.replay) < 2:
+            raise ValueError("The replay trace needs at least two frames.")
+        self.episode_length = min(episode_length, len(self.replay))
+        self.frame_budget_ms = frame_budget_ms
+        self.cost_weight = cost_weight
+        self.identify_reward = identify_reward
+        self.propagation_ms = propagation_ms
+        self.recognition_ms = recognition_ms
+        self.reference_confidence = reference_confidence
+        self.random_start = random_start
+        self.tracker = MultiObjectTracker()
 
-        # Define the state space (observation space)
-        # Represents continuous metrics: [tracker_confidence, fps, num_detections, ...]
-        # For now, a placeholder with a shape of (10,)
-        self.observation_space = spaces.Box(low=0, high=np.inf, shape=(10,), dtype=np.float32)
+        # The state space (observation space): see OBSERVATION_FIELDS.
+        self.observation_space = spaces.Box(low=0, high=np.inf, shape=(len(OBSERVATION_FIELDS),), dtype=np.float32)
 
-        # Define the action space
-        # Can be discrete (e.g., choosing a tracker) or continuous (e.g., confidence threshold)
-        # For now, a discrete placeholder with 3 actions
+        # The action space: PROPAGATE, DETECT or DETECT_AND_RECOGNIZE.
         self.action_space = spaces.Discrete(3)
 
-        logger.info("RL Environment Initialized.")
-        logger.info(f"Observation Space: {self.observation_space}")
-        logger.info(f"Action Space: {self.action_space}")
+        self._reset_state(0)
+        logger.debug(f"ARCEnv initialized on {len(self.replay)} recorded frames.")
 
     def step(self, action):
         """
         Apply an action, run a step of the perception pipeline, and return the results.
         """
-        # Placeholder implementation
-        # In a real implementation, this would:
-        # 1. Apply the action to the system (e.g., change a parameter).
-        # 2. Run the perception pipeline for one step.
-        # 3. Get the new observation.
-        # 4. Calculate the reward.
-        obs = self._get_obs()
-        reward = self._calculate_reward()
-        done = False  # Placeholder
-        truncated = False # Placeholder for gymnasium
-        info = {}     # Placeholder
+        boxes, scores, quality, acceptable = self.replay.frame(self._frame)
+        cost_ms = self.propagation_ms
+        identified = 0
+        if action == PROPAGATE:
+            tracks = self.tracker.update()
+            self._frames_since_detection += 1
+        else:
+            tracks = self.tracker.update(boxes, scores)
+            cost_ms += float(self.replay.detection_ms[self._frame])
+            self._detection_ms = float(self.replay.detection_ms[self._frame])
+            self._frames_since_detection = 0
+            self._num_detections = len(boxes)
+            self._face_quality = float(quality.mean()) if len(quality) else 0.0
+        track_boxes = np.array([track['box'] for track in tracks], dtype=np.float32).reshape(-1, 4)
+
+        if action == DETECT_AND_RECOGNIZE:
+            self._frames_since_recognition = 0
+            if len(tracks) and len(boxes):
+                iou = iou_matrix(track_boxes, boxes)
+                best = iou.argmax(axis=1)
+                for track, j, overlap in zip(tracks, best, iou[np.arange(len(tracks)), best]):
+                    if track['track_id'] in self._identified or overlap < 0.5 or not acceptable[j]:
+                        continue
+                    cost_ms += self.recognition_ms
+                    self._identified.add(track['track_id'])
+                    identified += 1
+        else:
+            self._frames_since_recognition += 1
 
-        return obs, reward, done, truncated, info
+        self._tracks = tracks
+        self._cost_ms += 0.1 * (cost_ms - self._cost_ms)
+        reward = self._calculate_reward(track_boxes, boxes[scores >= self.reference_confidence], cost_ms, identified)
+        self._frame += 1
+        self._steps += 1
+        terminated = False
+        truncated = self._steps >= self.episode_length or self._frame >= len(self.replay)
+        info = {'cost_ms': cost_ms, 'identified': identified, 'frame': self._frame}
+        return self._get_obs(), reward, terminated, truncated, info
 
     def reset(self, seed=None, options=None):
         """
         Reset the environment to an initial state.
         """
         super().reset(seed=seed)
-        # Placeholder implementation
-        # In a real implementation, this would reset the perception pipeline
-        # and return the initial observation.
-        initial_obs = self._get_obs()
-        info = {} # Placeholder
-        return initial_obs, info
+        start = 0
+        if self.random_start and len(self.replay) > self.episode_length:
+            start = int(self.np_random.integers(0, len(self.replay) - self.episode_length + 1))
+        self._reset_state(start)
+        return self._get_obs(), {'frame': start}
 
     def render(self, mode='human'):
         """
@@ -64,16 +280,109 @@ class ARCEnv(gym.Env):
         """
         pass
 
+    def _reset_state(self, start):
+        self.tracker.reset()
+        self._frame = start
+        self._steps = 0
+        self._tracks = []
+        self._identified = set()
+        self._frames_since_detection = 0
+        self._frames_since_recognition = 0
+        self._num_detections = 0
+        self._face_quality = 0.0
+        self._detection_ms = float(self.replay.detection_ms[start])
+        self._cost_ms = self.propagation_ms
+
     def _get_obs(self):
         """
         Helper method to gather the current state of the system.
         """
-        # Placeholder: return a zero vector of the correct shape
-        return np.zeros(self.observation_space.shape, dtype=self.observation_space.dtype)
+        num_tracks = len(self._tracks)
+        identified = sum(1 for track in self._tracks if track['track_id'] in self._identified)
+        return np.array([
+            self.tracker.confidence(),
+            1000.0 / max(self._cost_ms, 1e-3),
+            self._num_detections,
+            self._face_quality,
+            num_tracks,
+            self._frames_since_detection,
+            self._detection_ms,
+            identified / num_tracks if num_tracks else 0.0,
+            self._frames_since_recognition,
+            self._steps / self.episode_length,
+        ], dtype=np.float32)
 
-    def _calculate_reward(self):
+    def _calculate_reward(self, track_boxes, reference_boxes, cost_ms, identified):
         """
         Helper method to calculate the reward based on performance metrics.
         """
-        # Placeholder: return a fixed reward
-        return 1.0
\ No newline at end of file
+        if len(reference_boxes) == 0:
+            # Nobody to track: every remaining track is a false alarm.
+            coverage = 1.0 / (1 + len(track_boxes))
+        elif len(track_boxes) == 0:
+            coverage = 0.0
+        else:
+            coverage = float((iou_matrix(reference_boxes, track_boxes).max(axis=1) >= 0.5).mean())
+        return coverage + self.identify_reward * identified - self.cost_weight * cost_ms / self.frame_budget_ms
+
+
+gym.register(id='ARC-v0', entry_point='arc_engine.rl_system:ARCEnv')
+
+
+def make_vec_env(replay, num_envs=4, asynchronous=True, seed=None, **env_kwargs):
+    """
+    Creates a gymnasium vector environment of ARCEnvs on the same recorded trace.
+
+    Args:
+        replay (str or ReplayTrace): The trace; pass its path with asynchronous=True
+            so every subprocess loads it instead of receiving a pickled copy.
+        num_envs (int): The number of environments.
+        asynchronous (bool): Step the environments in subprocesses (AsyncVectorEnv)
+            rather than one after the other in this process (SyncVectorEnv).
+        seed (int or None): The base seed; environment i is seeded with seed + i.
+        **env_kwargs: ARCEnv arguments.
+
+    Returns:
+        gymnasium.vector.VectorEnv: The vector environment, already reset if seeded.
+    """
+    env_fns = [functools.partial(ARCEnv, replay, **env_kwargs) for _ in range(num_envs)]
+    if asynchronous:
+        env = gym.vector.AsyncVectorEnv(env_fns, context='spawn')
+    else:
+        env = gym.vector.SyncVectorEnv(env_fns)
+    if seed is not None:
+        env.reset(seed=[seed + i for i in range(num_envs)])
+    return env
+
+
+def make_sb3_vec_env(replay, num_envs=4, asynchronous=True, seed=None, **env_kwargs):
+    """
+    Creates the stable-baselines3 equivalent of make_vec_env (SubprocVecEnv or
+    DummyVecEnv), which stable-baselines3 algorithms accept directly.
+    """
+    from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+
+    env_fns = [functools.partial(ARCEnv, replay, **env_kwargs) for _ in range(num_envs)]
+    env = SubprocVecEnv(env_fns, start_method='spawn') if asynchronous else DummyVecEnv(env_fns)
+    if seed is not None:
+        env.seed(seed)
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help="Record a replay trace from footage.")
+    record.add_argument('video')
+    record.add_argument('output', help="The .npz trace to write.")
+    record.add_argument('--batch', type=int, default=1)
+    record.add_argument('--max-frames', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        trace = record_replay(args.video, args.output, batch=args.batch, max_frames=args.max_frames)
+        print(f"Recorded {len(trace)} frames ({len(trace.boxes)} detections) to {args.output}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,471 @@
+"""
+A face gallery split across several processes or hosts.
+
+Shards normally run as local processes started by ShardedGallery. To run a
+shard on another node, start a shard server there and pass its address to
+ShardedGallery(addresses=[...]); the snapshot path it is told to load must be
+readable on that node.
+
+Local shards share a random authentication key. Remote shard servers and
+the ShardedGallery connecting to them take theirs from --authkey or the
+ARC_GALLERY_AUTHKEY environment variable; a server listening on a
+non-loopback address refuses to start without one.
+
+Usage (standalone shard server):
+    ARC_GALLERY_AUTHKEY=... python -m arc_engine.sharded_gallery --host 0.0.0.0 --port 7301 --shard 0 --num-shards 4
+"""
+import argparse
+import itertools
+import multiprocessing as mp
+from multiprocessing import AuthenticationError
+import threading
+import time
+from multiprocessing.connection import Client, Listener, wait
+import numpy as np
+from arc_engine.face_gallery import PRECISIONS
+from utils.authkeys import authkey_from_env, new_authkey, server_authkey
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+AUTHKEY_ENV = 'ARC_GALLERY_AUTHKEY'
+
+
+def _serve(conn, shard_id, num_shards, dim, precision='float32', rerank=16):
+    """
+    Answers gallery requests on a connection until it is closed or told to stop.
+
+    Requests are (command, request_id, payload) tuples; every reply is
+    (request_id, result) or (request_id, exception).
+    """
+    from arc_engine.face_gallery import FaceGalleryIndex
+    from communication.embedding_snapshot import EmbeddingSnapshot
+
+    gallery = FaceGalleryIndex(dim=dim, precision=precision, rerank=rerank)
+    ids = None
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        command, request_id, payload = message
+        try:
+            if command == 'search':
+                queries, k = payload
+                distances, rows = gallery.search(queries, k)
+                if ids is None:
+                    ids = np.asarray(gallery.entry_ids, dtype=np.int64)
+                result = (distances, ids[rows])
+            elif command == 'load':
+                rowids, names, encodings = EmbeddingSnapshot(payload).load()
+                mask = rowids % num_shards == shard_id
+                gallery = FaceGalleryIndex(dim=dim, initial_capacity=max(1, int(np.count_nonzero(mask))),
+                                           precision=precision, rerank=rerank)
+                gallery.add([n for n, keep in zip(names, mask) if keep], encodings[mask], entry_ids=rowids[mask])
+                result = (list(gallery.entry_ids), list(gallery.names))
+            elif command == 'add':
+                names, encodings, entry_ids = payload
+                result = gallery.add(names, encodings, entry_ids=entry_ids)
+            elif command == 'remove':
+                result = sum(gallery.remove(entry_id) for entry_id in payload)
+            elif command == 'clear':
+                gallery.clear()
+                result = None
+            elif command == 'size':
+                result = len(gallery)
+            else:
+                raise ValueError(f"Unknown command '{command}'.")
+            if command != 'search':
+                ids = None
+        except Exception as e:
+            result = e
+        conn.send((request_id, result))
+
+
+def _shard_process(bootstrap, shard_id, num_shards, dim, transport, authkey, precision, rerank):
+    """
+    Entry point of a locally spawned shard. With the 'socket' transport the shard
+    listens on a local TCP port and reports its address over the bootstrap pipe.
+    """
+    if transport == 'pipe':
+        _serve(bootstrap, shard_id, num_shards, dim, precision, rerank)
+        return
+    with Listener(('127.0.0.1', 0), authkey=authkey) as listener:
+        bootstrap.send(listener.address)
+        with listener.accept() as conn:
+            _serve(conn, shard_id, num_shards, dim, precision, rerank)
+
+
+class ShardedGallery:
+    """
+    A face gallery partitioned by entry ID across `num_shards` worker processes
+    (or remote shard servers), with the FaceGalleryIndex interface, so it can be
+    passed to FacialRecognitionModule as its gallery.
+
+    Each shard holds the encodings of the entries with entry_id % num_shards ==
+    shard and loads them itself from the gallery snapshot, so the encodings
+    never pass through this process. Searches are scattered to all shards and
+    their local top-k lists merged into a global top-k. A shard that does not
+    answer within `timeout` is left out of that search (and counted), so one
+    slow or dead shard degrades recall instead of stalling recognition. Only
+    the names and entry IDs are mirrored here.
+    """
+    def __init__(self, num_shards=2, dim=128, snapshot_path=None, timeout=0.5, transport='pipe',
+                 addresses=None, authkey=None, precision='float32', rerank=16):
+        """
+        Initializes the ShardedGallery and starts or connects to its shards.
+
+        Args:
+            num_shards (int): The number of local shard processes to start.
+            dim (int): The dimensionality of the face encodings.
+            snapshot_path (str or None): The gallery snapshot (see EmbeddingSnapshot) the
+                shards load their entries from. If None the gallery starts empty.
+            timeout (float): Seconds to wait for a shard's search results.
+            transport (str): 'pipe' for multiprocessing pipes, or 'socket' for local TCP
+                servers that stand in for shard nodes.
+            addresses (list or None): (host, port) addresses of already running shard
+                servers; when given, no local processes are started.
+            authkey (bytes or None): The authentication key of the shard connections. By
+                default local shards get a random key and remote shards the key set in
+                ARC_GALLERY_AUTHKEY.
+            precision (str): The FaceGalleryIndex precision of locally started shards.
+            rerank (int): The FaceGalleryIndex re-ranking shortlist of locally started shards.
+        """
+        if transport not in ('pipe', 'socket'):
+            raise ValueError(f"Unknown transport '{transport}'.")
+        if authkey is None:
+            authkey = authkey_from_env(AUTHKEY_ENV) if addresses else new_authkey()
+            if authkey is None:
+                raise ValueError(f"Connecting to remote gallery shards requires an authkey or {AUTHKEY_ENV}.")
+        self.dim = dim
+        self.timeout = timeout
+        self.transport = transport
+        self.authkey = authkey
+        self.snapshot_path = snapshot_path
+        self.precision = precision
+        self.rerank = rerank
+        self.num_shards = len(addresses) if addresses else num_shards
+        self._addresses = list(addresses) if addresses else None
+        self._lock = threading.RLock()
+        self._request_ids = itertools.count()
+        self._processes = [None] * self.num_shards
+        self._connections = [None] * self.num_shards
+        # shard -> {entry_id: name}
+        self._shard_entries = [{} for _ in range(self.num_shards)]
+        self._mirror = None
+        self.searches = 0
+        self.shard_timeouts = [0] * self.num_shards
+
+        for shard in range(self.num_shards):
+            self._connect(shard)
+        if snapshot_path is not None:
+            self.load(snapshot_path)
+        logger.info(f"ShardedGallery started with {self.num_shards} shards ({transport}).")
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._shard_entries)
+
+    @property
+    def names(self):
+        return self._rows()[0]
+
+    @property
+    def entry_ids(self):
+        return self._rows()[1]
+
+    def load(self, snapshot_path, shards=None):
+        """
+        Makes shards (all by default) reload their entries from a gallery snapshot.
+
+        Args:
+            snapshot_path (str): The snapshot base path.
+            shards (list or None): The shards to reload; the others keep serving.
+        """
+        self.snapshot_path = snapshot_path
+        shards = range(self.num_shards) if shards is None else shards
+        with self._lock:
+            results = self._request({shard: ('load', snapshot_path) for shard in shards}, timeout=None)
+            for shard, (entry_ids, names) in results.items():
+                self._shard_entries[shard] = dict(zip(entry_ids, names))
+            self._mirror = None
+
+    def reload_shard(self, shard):
+        """
+        Reloads one shard from the snapshot, restarting its process if it died.
+        """
+        with self._lock:
+            if self._addresses is None and not self._processes[shard].is_alive():
+                logger.warning(f"Gallery shard {shard} is not running; restarting it.")
+                self._connect(shard)
+            self.load(self.snapshot_path, shards=[shard])
+
+    def add(self, names, encodings, entry_ids=None):
+        """
+        Adds entries to the shards that own their entry IDs.
+
+        Returns:
+            list: The IDs of the added entries.
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if isinstance(names, str):
+            names = [names]
+        if len(names) != len(encodings):
+            raise ValueError(f"Got {len(names)} names for {len(encodings)} encodings.")
+        with self._lock:
+            if entry_ids is None:
+                start = max((max(entries, default=-1) for entries in self._shard_entries), default=-1) + 1
+                entry_ids = range(start, start + len(encodings))
+            entry_ids = np.asarray(entry_ids, dtype=np.int64)
+            owners = entry_ids % self.num_shards
+            requests = {}
+            for shard in np.unique(owners):
+                mask = owners == shard
+                requests[int(shard)] = ('add', ([n for n, keep in zip(names, mask) if keep],
+                                                encodings[mask], entry_ids[mask].tolist()))
+            self._request(requests, timeout=None)
+            for entry_id, name, shard in zip(entry_ids.tolist(), names, owners.tolist()):
+                self._shard_entries[shard][entry_id] = name
+            self._mirror = None
+        return entry_ids.tolist()
+
+    def remove(self, entry_id):
+        """
+        Removes an entry from its shard.
+
+        Returns:
+            bool: True if the entry existed.
+        """
+        entry_id = int(entry_id)
+        shard = entry_id % self.num_shards
+        with self._lock:
+            if entry_id not in self._shard_entries[shard]:
+                return False
+            self._request({shard: ('remove', [entry_id])}, timeout=None)
+            del self._shard_entries[shard][entry_id]
+            self._mirror = None
+            return True
+
+    def clear(self):
+        """
+        Removes all entries from all shards.
+        """
+        with self._lock:
+            self._request({shard: ('clear', None) for shard in range(self.num_shards)}, timeout=None)
+            self._shard_entries = [{} for _ in range(self.num_shards)]
+            self._mirror = None
+
+    def search(self, queries, k=1):
+        """
+        Finds the k nearest entries for each query across all responding shards.
+
+        Returns:
+            tuple: (distances, rows), both (M, k') arrays sorted by increasing
+                   distance. Rows index `names` and `entry_ids`.
+        """
+        distances, rows, _ = self._search(queries, k)
+        return distances, rows
+
+    def _search(self, queries, k):
+        """
+        Like search, but also returns the names the rows index, taken together with
+        the shards' results so that a concurrent reload cannot change them in between.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            results = self._request({shard: ('search', (queries, k)) for shard in range(self.num_shards)},
+                                    timeout=self.timeout)
+            self.searches += 1
+            names, _, row_of = self._rows()
+
+        parts = [result for result in results.values() if result[0].shape[1]]
+        if not parts:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.float32), empty.astype(np.int64), names
+        distances = np.concatenate([d for d, _ in parts], axis=1)
+        ids = np.concatenate([i for _, i in parts], axis=1)
+        k = min(k, distances.shape[1])
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        top_ids = np.take_along_axis(ids, order, axis=1)
+        rows = np.vectorize(row_of.__getitem__, otypes=[np.int64])(top_ids) if top_ids.size \
+            else top_ids.astype(np.int64)
+        return np.take_along_axis(distances, order, axis=1), rows, names
+
+    def match(self, queries, threshold):
+        """
+        Returns the best match for each query if it is within the threshold.
+
+        Returns:
+            list: One (name, distance) tuple per query; name is None when the
+                  nearest entry is farther than the threshold.
+        """
+        distances, rows, names = self._search(queries, k=1)
+        results = []
+        for dist, row in zip(distances, rows):
+            if len(row) and dist[0] <= threshold:
+                results.append((names[row[0]], float(dist[0])))
+            else:
+                results.append((None, float(dist[0]) if len(row) else None))
+        return results
+
+    def stats(self):
+        """
+        Returns the number of entries per shard and how often each shard timed out.
+        """
+        return {
+            'shards': self.num_shards,
+            'entries_per_shard': [len(entries) for entries in self._shard_entries],
+            'searches': self.searches,
+            'shard_timeouts': list(self.shard_timeouts),
+        }
+
+    def shutdown(self, timeout=2.0):
+        """
+        Stops the local shard processes and closes all shard connections.
+        """
+        with self._lock:
+            for shard, conn in enumerate(self._connections):
+                if conn is None:
+                    continue
+                try:
+                    if self._addresses is None:
+                        conn.send(None)
+                    conn.close()
+                except OSError:
+                    pass
+                self._connections[shard] = None
+            for process in self._processes:
+                if process is not None:
+                    process.join(timeout=timeout)
+                    if process.is_alive():
+                        process.terminate()
+        logger.info("ShardedGallery shut down.")
+
+    def _connect(self, shard):
+        if self._connections[shard] is not None:
+            try:
+                self._connections[shard].close()
+            except OSError:
+                pass
+        if self._addresses is not None:
+            self._connections[shard] = Client(tuple(self._addresses[shard]), authkey=self.authkey)
+            return
+
+        context = mp.get_context('spawn')
+        parent, child = context.Pipe()
+        process = context.Process(target=_shard_process, name=f"arc-gallery-shard-{shard}", daemon=True,
+                                  args=(child, shard, self.num_shards, self.dim, self.transport, self.authkey,
+                                        self.precision, self.rerank))
+        process.start()
+        child.close()
+        if self.transport == 'socket':
+            address = parent.recv()
+            parent.close()
+            parent = Client(address, authkey=self.authkey)
+        self._processes[shard] = process
+        self._connections[shard] = parent
+
+    def _request(self, requests, timeout):
+        """
+        Sends one request per shard and gathers the replies.
+
+        Args:
+            requests (dict): shard -> (command, payload).
+            timeout (float or None): Seconds to wait for all replies; None waits
+                indefinitely and raises if a shard fails.
+
+        Returns:
+            dict: shard -> result for the shards that answered in time.
+        """
+        request_id = next(self._request_ids)
+        sent = []
+        for shard, (command, payload) in requests.items():
+            try:
+                self._connections[shard].send((command, request_id, payload))
+                sent.append(shard)
+            except (OSError, AttributeError) as e:
+                if timeout is None:
+                    raise ConnectionError(f"Gallery shard {shard} is unreachable.") from e
+                self.shard_timeouts[shard] += 1
+                logger.error(f"Gallery shard {shard} is unreachable: {e}")
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        results = {}
+        # Replies are read in whatever order they arrive, so a slow shard does not
+        # use up the time of the shards that answer after it.
+        waiting = {self._connections[shard]: shard for shard in sent}
+        while waiting:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            ready = wait(list(waiting), remaining)
+            if not ready:
+                break
+            for conn in ready:
+                shard = waiting[conn]
+                try:
+                    reply_id, result = conn.recv()
+                except (EOFError, OSError) as e:
+                    if timeout is None:
+                        raise ConnectionError(f"Gallery shard {shard} is unreachable.") from e
+                    del waiting[conn]
+                    self.shard_timeouts[shard] += 1
+                    logger.error(f"Gallery shard {shard} is unreachable: {e}")
+                    continue
+                # Late replies to earlier, timed-out requests are discarded.
+                if reply_id != request_id:
+                    continue
+                del waiting[conn]
+                if isinstance(result, Exception):
+                    if timeout is None:
+                        raise result
+                    logger.error(f"Gallery shard {shard} failed: {result}")
+                else:
+                    results[shard] = result
+        for shard in waiting.values():
+            self.shard_timeouts[shard] += 1
+            logger.warning(f"Gallery shard {shard} did not answer within {timeout}s.")
+        return results
+
+    def _rows(self):
+        with self._lock:
+            if self._mirror is None:
+                names, entry_ids = [], []
+                for entries in self._shard_entries:
+                    entry_ids.extend(entries.keys())
+                    names.extend(entries.values())
+                self._mirror = (names, entry_ids, {entry_id: row for row, entry_id in enumerate(entry_ids)})
+            return self._mirror
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--shard', type=int, required=True)
+    parser.add_argument('--num-shards', type=int, required=True)
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--authkey', help=f"Key clients authenticate with (default: ${AUTHKEY_ENV}).")
+    parser.add_argument('--precision', choices=PRECISIONS, default='float32')
+    parser.add_argument('--rerank', type=int, default=16)
+    args = parser.parse_args()
+
+    try:
+        authkey, generated = server_authkey(args.host, args.authkey, AUTHKEY_ENV)
+    except ValueError as e:
+        parser.error(str(e))
+    if generated:
+        print(f"{AUTHKEY_ENV}={authkey.decode()}", flush=True)
+    with Listener((args.host, args.port), authkey=authkey) as listener:
+        logger.info(f"Gallery shard {args.shard}/{args.num_shards} listening on {listener.address}.")
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError as e:
+                logger.warning(f"Rejected a gallery client: {e}")
+                continue
+            with conn:
+                _serve(conn, args.shard, args.num_shards, args.dim, args.precision, args.rerank)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import threading
+from utils.logger import get_logger
+from communication.database_manager import DatabaseManager
+from communication.event_store import EventStore
+from arc_engine.detection_server import DetectionClient, DetectionServer
+from arc_engine.face_encoding_service import FaceEncodingService
+from arc_engine.face_ann_index import IVFFaceIndex
+from arc_engine.face_gallery import FaceGalleryIndex
+from arc_engine.sharded_gallery import ShardedGallery
+
+logger = get_logger(__name__)
+
+_instance = None
+_instance_kwargs = None
+_instance_lock = threading.Lock()
+
+
+class SharedResources:
+    """
+    The expensive parts of the engine that several video feeds can share: the
+    known faces database, the person detector, the face gallery (with its
+    recognition module and encoding pool) and the event store.
+
+    Each ARCEngineCore keeps its own capture, tracking, scheduling and identity
+    cache state; engines given the same SharedResources load the models and
+    the watchlist only once. With a detection server, the detector lives in
+    the server process and every engine gets its own client of it.
+    """
+
+    def __init__(self, db_path='data/known_faces.db', recognition_workers=0, ann_index_path=None,
+                 ann_nprobe=16, gallery_shards=0, shard_timeout=0.5, gallery_precision='float32',
+                 gallery_rerank=16, event_store_path=None, detection_server=None, recognition=True,
+                 sync_snapshot=True):
+        """
+        Loads the shared models and the watchlist.
+
+        Args:
+            db_path (str): The known faces database.
+            recognition_workers (int): If greater than 0, face detection and encoding run
+                asynchronously in a pool of this many worker processes.
+            ann_index_path (str or None): If set, known faces are matched with an IVF
+                index stored in this directory (built on first use).
+            ann_nprobe (int): The number of IVF cells scanned per face.
+            gallery_shards (int): If greater than 0 (and ann_index_path is not set), the
+                known faces are split across this many gallery shard processes.
+            shard_timeout (float): Seconds a face search waits for each gallery shard.
+            gallery_precision (str): 'float32', 'float16' or 'int8'.
+            gallery_rerank (int): With a reduced gallery precision, the number of nearest
+                candidates re-scored in float32.
+            event_store_path (str or None): If set, events of every feed are persisted to
+                this SQLite database, tagged with the feed name.
+            detection_server (str, tuple or None): None runs the detector in this process.
+                'local' starts a DetectionServer process; a (host, port) tuple or
+                'host:port' string connects to a running one, with the key set in
+                ARC_DETECTION_AUTHKEY.
+            recognition (bool): Load the face recognition module and gallery. Without it
+                facial_recognition_module is None and dlib is never imported.
+            sync_snapshot (bool): Whether the recognition module brings the gallery
+                snapshot up to date or, if False, only reads it.
+        """
+        logger.info("Loading shared engine resources...")
+        self.db_manager = DatabaseManager(db_path)
+        self.human_detection_module = None
+        self.detection_server = None
+        self.detection_address = None
+        if detection_server is None:
+            # Imported here rather than at module level: it pulls in torch and ultralytics,
+            # which take seconds to import and which a detection server keeps out of this process.
+            from arc_engine.human_detection_module import HumanDetectionModule
+
+            self.human_detection_module = HumanDetectionModule()
+        elif detection_server == 'local':
+            self.detection_server = DetectionServer()
+            self.detection_address = self.detection_server.address
+        elif isinstance(detection_server, str):
+            host, port = detection_server.rsplit(':', 1)
+            self.detection_address = (host, int(port))
+        else:
+            self.detection_address = tuple(detection_server)
+        self.face_encoding_service = None
+        self.facial_recognition_module = None
+        if recognition:
+            self._load_recognition(recognition_workers, ann_index_path, ann_nprobe, gallery_shards, shard_timeout,
+                                   gallery_precision, gallery_rerank, sync_snapshot)
+        self.event_store = EventStore(event_store_path) if event_store_path is not None else None
+        self._closed = False
+        logger.info("Shared engine resources loaded.")
+
+    def _load_recognition(self, recognition_workers, ann_index_path, ann_nprobe, gallery_shards, shard_timeout,
+                          gallery_precision, gallery_rerank, sync_snapshot):
+        # Imported here rather than at module level: it pulls in dlib, which takes
+        # seconds to import and is only needed once loading.
+        from arc_engine.facial_recognition_module import FacialRecognitionModule
+
+        if recognition_workers > 0:
+            self.face_encoding_service = FaceEncodingService(num_workers=recognition_workers)
+        gallery = None
+        if ann_index_path is not None:
+            gallery = IVFFaceIndex.load_or_build(ann_index_path, self.db_manager, nprobe=ann_nprobe)
+        elif gallery_shards > 0:
+            self.db_manager.sync_gallery_snapshot()
+            gallery = ShardedGallery(num_shards=gallery_shards, snapshot_path=self.db_manager.snapshot.base_path,
+                                     timeout=shard_timeout, precision=gallery_precision, rerank=gallery_rerank)
+        elif gallery_precision != 'float32':
+            gallery = FaceGalleryIndex(precision=gallery_precision, rerank=gallery_rerank)
+        self.facial_recognition_module = FacialRecognitionModule(self.db_manager,
+                                                                 encoding_service=self.face_encoding_service,
+                                                                 gallery=gallery, sync_snapshot=sync_snapshot)
+
+    @property
+    def gallery(self):
+        if self.facial_recognition_module is None:
+            return None
+        return self.facial_recognition_module.gallery
+
+    def detector_for_feed(self):
+        """
+        Returns the person detector an engine should use: the shared in-process
+        HumanDetectionModule, or a new DetectionClient of the detection server.
+        The caller closes a DetectionClient when done with it.
+        """
+        if self.human_detection_module is not None:
+            return self.human_detection_module
+        if self.detection_server is not None:
+            return self.detection_server.connect()
+        return DetectionClient(self.detection_address)
+
+    def stats(self):
+        """
+        Returns statistics of the shared components.
+
+        Returns:
+            dict: Face encoding pool, event store and face index statistics, for
+                  those that are enabled.
+        """
+        stats = {}
+        if self.face_encoding_service is not None:
+            stats['face_encoding_service'] = self.face_encoding_service.stats()
+        if self.event_store is not None:
+            stats['events'] = self.event_store.stats()
+        if isinstance(self.gallery, (IVFFaceIndex, ShardedGallery)):
+            stats['face_index'] = self.gallery.stats()
+        return stats
+
+    def shutdown(self):
+        """
+        Releases the shared resources. Call once every engine using them has shut down.
+        """
+        global _instance
+        if self._closed:
+            return
+        self._closed = True
+        if self.face_encoding_service is not None:
+            self.face_encoding_service.shutdown()
+        if isinstance(self.gallery, ShardedGallery):
+            self.gallery.shutdown()
+        if self.event_store is not None:
+            self.event_store.close()
+        if self.detection_server is not None:
+            self.detection_server.shutdown()
+        self.db_manager.close_connection()
+        with _instance_lock:
+            if _instance is self:
+                _instance = None
+        logger.info("Shared engine resources released.")
+
+
+def get_shared_resources(**kwargs):
+    """
+    Returns the process-wide SharedResources, creating it on first use.
+
+    Args:
+        **kwargs: SharedResources arguments, used only by the call that creates it.
+
+    Returns:
+        SharedResources: The shared instance.
+    """
+    global _instance, _instance_kwargs
+    with _instance_lock:
+        if _instance is None:
+            _instance = SharedResources(**kwargs)
+            _instance_kwargs = kwargs
+        elif kwargs and kwargs != _instance_kwargs:
+            logger.warning("Shared engine resources already loaded; ignoring new settings.")
+        return _instance
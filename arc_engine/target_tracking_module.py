@@ -1,23 +1,56 @@
 import cv2
+import numpy as np
 from utils.logger import get_logger
+from arc_engine.multi_object_tracker import MultiObjectTracker, iou_matrix
 
 logger = get_logger(__name__)
 
 class TargetTrackingModule:
     """
     A module for tracking a selected target across video frames.
+
+    In 'single' mode one selected target is followed with an OpenCV tracker.
+    In 'multi' mode every detected person is tracked with a MultiObjectTracker
+    and the largest track is kept as the primary target.
     """
-    def __init__(self, tracker_type='CSRT'):
+    def __init__(self, tracker_type='CSRT', mode='single', iou_threshold=0.3, max_age=30, min_hits=3,
+                 confidence_decay=0.95, max_drift_misses=3):
         """
         Initializes the TargetTrackingModule.
 
         Args:
             tracker_type (str): The type of OpenCV tracker to use (e.g., 'CSRT', 'KCF').
+            mode (str): 'single' to follow one target, 'multi' to track everyone.
+            iou_threshold (float): Minimum IoU for detection-to-track assignment in multi mode.
+            max_age (int): Detection frames a track may go unmatched in multi mode.
+            min_hits (int): Matches before a track is reported in multi mode.
+            confidence_decay (float): Per-frame decay of the tracking confidence between detections.
+            max_drift_misses (int): Consecutive drift checks in single mode that find no
+                detection overlapping the target before the target is dropped.
         """
+        if mode not in ('single', 'multi'):
+            raise ValueError(f"Unknown tracking mode '{mode}'. Expected 'single' or 'multi'.")
+        self.mode = mode
         self.tracker_type = tracker_type
+        self.iou_threshold = iou_threshold
+        self.confidence_decay = confidence_decay
+        self.max_drift_misses = max_drift_misses
         self.tracker = None
         self.tracked_bbox = None
         self.tracker_initialization_frame = None
+        # Incremented every time a new target is selected so that results
+        # produced asynchronously (e.g. recognition) can be tied to a track.
+        self.track_id = 0
+        # Single mode: overlap with the detector at the last check, and frames since then.
+        self.detection_agreement = 0.0
+        self.frames_since_detection = 0
+        self.drift_misses = 0
+
+        self.multi_tracker = None
+        self.active_tracks = []
+        if mode == 'multi':
+            self.multi_tracker = MultiObjectTracker(iou_threshold=iou_threshold, max_age=max_age, min_hits=min_hits,
+                                                    confidence_decay=confidence_decay)
 
         # Mapping of tracker types to their constructors
         self.tracker_constructors = {
@@ -48,12 +81,10 @@ class TargetTrackingModule:
         # Convert from [x1, y1, x2, y2] to [x, y, w, h]]
         self.tracked_bbox = tuple(map(int, (bbox[0], bbox[1], bbox[2] - bbox[0], bbox[3] - bbox[1])))
         
-        # Initialize the tracker
-        self.tracker = self.tracker_constructors[self.tracker_type]()
-        self.tracker.init(frame, self.tracked_bbox)
-        self.tracker_initialization_frame = frame.copy()
+        self._init_tracker(frame)
+        self.track_id += 1
         
-        logger.info(f"Initialized {self.tracker_type} tracker for target at {self.tracked_bbox}")
+        logger.info(f"Initialized {self.tracker_type} tracker for target {self.track_id} at {self.tracked_bbox}")
         return True
 
     def update_tracker(self, frame):
@@ -70,6 +101,7 @@ class TargetTrackingModule:
             return False, None
 
         success, bbox = self.tracker.update(frame)
+        self.frames_since_detection += 1
         
         if success:
             self.tracked_bbox = bbox
@@ -79,6 +111,107 @@ class TargetTrackingModule:
             
         return success, self.tracked_bbox
 
+    def correct_drift(self, frame, detections):
+        """
+        Re-anchors the single-target tracker on the detection that best overlaps it.
+
+        Args:
+            frame (numpy.ndarray): The frame the detections were made on.
+            detections (list): A list of human detections.
+
+        Returns:
+            bool: True if the tracker was re-initialized on a matching detection.
+        """
+        if self.tracker is None:
+            return False
+        self.frames_since_detection = 0
+
+        x, y, w, h = self.tracked_bbox
+        overlaps = iou_matrix([(x, y, x + w, y + h)], np.array([d['box'] for d in detections]))[0]
+        best = int(np.argmax(overlaps)) if len(overlaps) else -1
+        if best < 0 or overlaps[best] < self.iou_threshold:
+            self.detection_agreement = float(overlaps[best]) if best >= 0 else 0.0
+            self.drift_misses += 1
+            if self.drift_misses >= self.max_drift_misses:
+                logger.warning(f"Target {self.track_id} no longer matches any detection. Dropping it.")
+                self.reacquire_target()
+            return False
+
+        bbox = detections[best]['box']
+        self.tracked_bbox = tuple(map(int, (bbox[0], bbox[1], bbox[2] - bbox[0], bbox[3] - bbox[1])))
+        self._init_tracker(frame)
+        return True
+
+    def tracking_confidence(self):
+        """
+        Returns a confidence in [0, 1] that the current tracking is still accurate.
+
+        In single mode this is the overlap with the detector at the last check, in
+        multi mode the mean detection score of the active tracks; both decay with
+        every frame tracked without a detection. It is 0.0 when nothing is tracked.
+        """
+        if self.mode == 'multi':
+            return self.multi_tracker.confidence()
+        if self.tracker is None:
+            return 0.0
+        return self.detection_agreement * self.confidence_decay ** self.frames_since_detection
+
+    def current_tracks(self):
+        """
+        Returns the tracks of the last update in the format of update_tracks. In
+        single mode this is the followed target, if any.
+        """
+        if self.mode == 'multi':
+            return self.active_tracks
+        if self.tracker is None or self.tracked_bbox is None:
+            return []
+        x, y, w, h = self.tracked_bbox
+        return [{'track_id': self.track_id, 'box': (x, y, x + w, y + h), 'confidence': self.tracking_confidence()}]
+
+    def update_tracks(self, boxes=None, scores=None):
+        """
+        Updates all tracks with the detections of the current frame (multi mode).
+
+        Args:
+            boxes (numpy.ndarray): An (N, 4) array of detected boxes in xyxy format, or
+                None to propagate the tracks with the motion model only.
+            scores (numpy.ndarray): An (N,) array of detection confidences.
+
+        Returns:
+            list: The active tracks, each a dictionary with 'track_id', 'box' and 'confidence'.
+        """
+        self.active_tracks = self.multi_tracker.update(boxes, scores)
+        primary = self._select_primary_track(self.active_tracks)
+        if primary is None:
+            self.tracked_bbox = None
+        else:
+            x1, y1, x2, y2 = primary['box']
+            self.track_id = primary['track_id']
+            self.tracked_bbox = (x1, y1, x2 - x1, y2 - y1)
+        return self.active_tracks
+
+    def _select_primary_track(self, tracks):
+        """
+        Keeps the current primary track while it is active, otherwise picks the largest one.
+        """
+        if not tracks:
+            return None
+        for track in tracks:
+            if track['track_id'] == self.track_id:
+                return track
+        return max(tracks, key=lambda t: (t['box'][2] - t['box'][0]) * (t['box'][3] - t['box'][1]))
+
+    def _init_tracker(self, frame):
+        """
+        (Re-)initializes the OpenCV tracker on self.tracked_bbox.
+        """
+        self.tracker = self.tracker_constructors[self.tracker_type]()
+        self.tracker.init(frame, self.tracked_bbox)
+        self.tracker_initialization_frame = frame.copy()
+        self.detection_agreement = 1.0
+        self.frames_since_detection = 0
+        self.drift_misses = 0
+
     def reacquire_target(self):
         """
         Resets the tracker to handle tracking failure.
@@ -1,3 +1,6 @@
+import collections
+import threading
+import time
 import cv2
 import numpy as np
 from utils.logger import logger
@@ -5,8 +8,14 @@ from utils.logger import logger
 class VideoStreamProcessor:
     """
     Handles video input, frame reading, and basic preprocessing.
+
+    In threaded mode a background thread grabs frames continuously and only the
+    newest one is handed out, so a slow consumer sees fresh frames instead of
+    a growing backlog. Frames are resized into a ring of preallocated buffers,
+    so steady-state capture does not allocate.
     """
-    def __init__(self, source, width=640, height=480):
+    def __init__(self, source, width=640, height=480, threaded=False, pool_size=5,
+                 late_threshold=0.1, read_timeout=1.0):
         """
         Initializes the video stream processor.
 
@@ -14,16 +23,61 @@ class VideoStreamProcessor:
             source (int or str): The video source (webcam index or file path).
             width (int): The desired width for frame resizing.
             height (int): The desired height for frame resizing.
+            threaded (bool): If True, grab frames on a background thread with
+                latest-frame-wins semantics.
+            pool_size (int): The number of preallocated frame buffers in threaded mode.
+                A frame returned by read_frame stays valid for the next
+                `pool_size - 2` calls.
+            late_threshold (float): Age in seconds above which a frame handed to
+                the consumer is counted as late.
+            read_timeout (float): How long read_frame waits for a new frame in
+                threaded mode before reporting failure.
         """
         self.source = source
         self.width = width
         self.height = height
+        self.threaded = threaded
+        self.pool_size = max(3, pool_size)
+        self.late_threshold = late_threshold
+        self.read_timeout = read_timeout
+
+        # Sequence number and capture timestamp of the last frame returned by read_frame
+        self.last_seq = -1
+        self.last_timestamp = None
+
+        self.frames_grabbed = 0
+        self.frames_dropped = 0
+        self.frames_late = 0
+
+        self._pool = None
+        self._latest = None  # (slot, seq, timestamp) of the newest grabbed frame
+        self._leased = collections.deque(maxlen=self.pool_size - 2)
+        self._condition = threading.Condition()
+        self._grab_thread = None
+        self._running = False
+        self._stream_ended = False
+
         self.capture = cv2.VideoCapture(self.source)
         if self.capture.isOpened():
             logger.info(f"Successfully opened video source: {self.source}")
+            if self.threaded:
+                self.start()
         else:
             logger.error(f"Failed to open video source: {self.source}")
 
+    def start(self):
+        """
+        Starts the background grabber thread.
+        """
+        if self._grab_thread is not None:
+            return
+        # Keep the driver-side queue as short as possible; we only want the newest frame.
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._running = True
+        self._grab_thread = threading.Thread(target=self._grab_loop, name="arc-frame-grabber", daemon=True)
+        self._grab_thread.start()
+        logger.info(f"Started background frame grabber for source: {self.source}")
+
     def read_frame(self):
         """
         Reads and preprocesses a single frame from the video source.
@@ -33,16 +87,111 @@ class VideoStreamProcessor:
                 - bool: True if a frame was successfully read, False otherwise.
                 - numpy.ndarray or None: The processed frame, or None on failure.
         """
+        if self.threaded:
+            return self._read_latest_frame()
+
         status, frame = self.capture.read()
         if status:
             frame = cv2.resize(frame, (self.width, self.height))
+            self.last_seq += 1
+            self.last_timestamp = time.time()
+            self.frames_grabbed += 1
             return True, frame
         return False, None
 
+    def stats(self):
+        """
+        Returns frame counters for the stream.
+
+        Returns:
+            dict: Grabbed, dropped (overwritten before being read) and late frame counts.
+        """
+        return {
+            'frames_grabbed': self.frames_grabbed,
+            'frames_dropped': self.frames_dropped,
+            'frames_late': self.frames_late,
+        }
+
+    def _read_latest_frame(self):
+        """
+        Returns the newest grabbed frame that has not been returned yet.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._has_new_frame() or self._stream_ended or not self._running,
+                timeout=self.read_timeout,
+            )
+            if not self._has_new_frame():
+                return False, None
+            slot, seq, timestamp = self._latest
+            self._leased.append(slot)
+            self.last_seq = seq
+            self.last_timestamp = timestamp
+
+        if time.time() - timestamp > self.late_threshold:
+            self.frames_late += 1
+        return True, self._pool[slot]
+
+    def _has_new_frame(self):
+        return self._latest is not None and self._latest[1] > self.last_seq
+
+    def _grab_loop(self):
+        """
+        Continuously grabs frames and resizes them into the next free pool buffer.
+        """
+        raw = None
+        seq = 0
+        while self._running:
+            status, raw = self.capture.read(raw)
+            timestamp = time.time()
+            if not status:
+                logger.warning(f"Frame grabber stopped: no more frames from source {self.source}")
+                break
+
+            if self._pool is None:
+                channels = raw.shape[2:]
+                self._pool = [np.empty((self.height, self.width) + channels, dtype=raw.dtype)
+                              for _ in range(self.pool_size)]
+
+            with self._condition:
+                slot = self._free_slot()
+            cv2.resize(raw, (self.width, self.height), dst=self._pool[slot])
+
+            with self._condition:
+                if self._has_new_frame():
+                    self.frames_dropped += 1
+                self._latest = (slot, seq, timestamp)
+                self.frames_grabbed += 1
+                self._condition.notify_all()
+            seq += 1
+
+        with self._condition:
+            self._stream_ended = True
+            self._condition.notify_all()
+
+    def _free_slot(self):
+        """
+        Picks a pool buffer that is neither published nor still held by the consumer.
+        """
+        busy = set(self._leased)
+        if self._latest is not None:
+            busy.add(self._latest[0])
+        for slot in range(self.pool_size):
+            if slot not in busy:
+                return slot
+        # Unreachable: at most pool_size - 1 slots can be busy.
+        return 0
+
     def release(self):
         """
         Releases the video capture object.
         """
+        if self._grab_thread is not None:
+            self._running = False
+            with self._condition:
+                self._condition.notify_all()
+            self._grab_thread.join(timeout=2.0)
+            self._grab_thread = None
         if self.capture.isOpened():
             self.capture.release()
-            logger.info(f"Released video source: {self.source}")
\ No newline at end of file
+            logger.info(f"Released video source: {self.source}")
@@ -0,0 +1,112 @@
+"""
+Compares person-detection backends against the PyTorch backend on the same frames.
+
+For every backend it reports per-frame latency and how closely its detections
+agree with PyTorch's (boxes matched one-to-one at IoU >= --iou).
+
+Usage:
+    python -m benchmarks.bench_detection_backends --source footage.mp4 --backends onnx openvino --int8
+"""
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from arc_engine.human_detection_module import HumanDetectionModule
+from arc_engine.multi_object_tracker import iou_matrix
+
+
+def load_frames(source, count, width=640, height=480):
+    """
+    Reads up to `count` frames from a video file, resized like VideoStreamProcessor does.
+    """
+    capture = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < count:
+        status, frame = capture.read()
+        if not status:
+            break
+        frames.append(cv2.resize(frame, (width, height)))
+    capture.release()
+    return frames
+
+
+def count_matches(reference, candidate, iou_threshold):
+    """
+    Greedily matches candidate boxes to reference boxes one-to-one by IoU.
+    """
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0
+    iou = iou_matrix(reference, candidate)
+    matches = 0
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < iou_threshold:
+            return matches
+        matches += 1
+        iou[i, :] = -1
+        iou[:, j] = -1
+
+
+def run_backend(detector, frames):
+    latencies = []
+    outputs = []
+    for frame in frames:
+        start = time.perf_counter()
+        boxes, _ = detector.detect_humans_batch([frame])[0]
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        outputs.append(boxes)
+    return np.array(latencies), outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', required=True, help="Video file to take frames from.")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--backends', nargs='+', default=['onnx', 'openvino'])
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--iou', type=float, default=0.5)
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.frames)
+    if not frames:
+        raise SystemExit(f"No frames could be read from {args.source}")
+
+    reference = HumanDetectionModule(args.model, backend='pytorch', imgsz=args.imgsz)
+    ref_latency, ref_boxes = run_backend(reference, frames)
+    report = {'frames': len(frames), 'backends': {}}
+    report['backends']['pytorch'] = _latency_summary(ref_latency)
+
+    for backend in args.backends:
+        detector = HumanDetectionModule(args.model, backend=backend, imgsz=args.imgsz, int8=args.int8)
+        if detector.model is None:
+            report['backends'][backend] = {'error': "model failed to load"}
+            continue
+        latency, boxes = run_backend(detector, frames)
+        matched = sum(count_matches(r, c, args.iou) for r, c in zip(ref_boxes, boxes))
+        ref_total = sum(len(r) for r in ref_boxes)
+        cand_total = sum(len(c) for c in boxes)
+        summary = _latency_summary(latency)
+        summary.update({
+            'int8': args.int8,
+            'speedup_vs_pytorch': float(np.mean(ref_latency) / np.mean(latency)),
+            'recall_vs_pytorch': matched / ref_total if ref_total else 1.0,
+            'precision_vs_pytorch': matched / cand_total if cand_total else 1.0,
+        })
+        report['backends'][backend] = summary
+
+    print(json.dumps(report, indent=2))
+
+
+def _latency_summary(latencies):
+    return {
+        'mean_ms': float(np.mean(latencies)),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+    }
+
+
+if __name__ == '__main__':
+    main()
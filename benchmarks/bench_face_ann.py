@@ -0,0 +1,107 @@
+"""
+Measures the recall and speed of the IVF face index against exact search.
+
+The gallery is either the known_faces database (--db) or a synthetic set of
+clustered 128-d embeddings (--size), which mimics several photos per person.
+Queries are gallery entries with added noise, searched one at a time as the
+recognition path does. For each nprobe it reports recall@k against
+FaceGalleryIndex and the per-query speedup.
+
+Usage:
+    python -m benchmarks.bench_face_ann --size 1000000 --nprobe 4 8 16 32
+    python -m benchmarks.bench_face_ann --db data/known_faces.db
+"""
+import argparse
+import json
+import time
+import numpy as np
+from arc_engine.face_ann_index import IVFFaceIndex
+from arc_engine.face_gallery import FaceGalleryIndex
+from benchmarks.synthetic import synthetic_gallery
+
+
+def time_queries(index, queries, k):
+    latencies = np.empty(len(queries))
+    rows = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, found = index.search(query, k)
+        latencies[i] = (time.perf_counter() - start) * 1000.0
+        rows.append(found[0])
+    return latencies, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="Use the embeddings in this known_faces database.")
+    parser.add_argument('--size', type=int, default=200000, help="Synthetic gallery size if --db is not given.")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32])
+    parser.add_argument('--noise', type=float, default=0.02, help="Query noise (embedding units).")
+    args = parser.parse_args()
+
+    if args.db:
+        from communication.database_manager import DatabaseManager
+        db_manager = DatabaseManager(args.db)
+        _, names, encodings = db_manager.get_faces_since(0)
+        db_manager.close_connection()
+    else:
+        names, encodings = synthetic_gallery(args.size)
+    if len(encodings) == 0:
+        raise SystemExit("The gallery is empty.")
+
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, len(encodings), args.queries)
+    queries = encodings[picks] + rng.normal(scale=args.noise, size=(args.queries, encodings.shape[1]))
+    queries = queries.astype(np.float32)
+
+    exact = FaceGalleryIndex(dim=encodings.shape[1], initial_capacity=len(encodings))
+    exact.add(names, encodings)
+    exact_latency, exact_rows = time_queries(exact, queries, args.k)
+
+    start = time.perf_counter()
+    ivf = IVFFaceIndex(dim=encodings.shape[1], nlist=args.nlist)
+    ivf.build(names, encodings)
+    build_seconds = time.perf_counter() - start
+
+    report = {
+        'gallery_size': len(encodings),
+        'queries': args.queries,
+        'k': args.k,
+        'cells': ivf.stats()['cells'],
+        'build_seconds': build_seconds,
+        'exact': _latency_summary(exact_latency),
+        'ivf': {},
+    }
+    exact_ids = [set(np.asarray(exact.entry_ids)[rows].tolist()) for rows in exact_rows]
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        ivf.queries = ivf.candidates_scanned = 0
+        latency, rows = time_queries(ivf, queries, args.k)
+        found_ids = [set(np.asarray(ivf.entry_ids)[r].tolist()) for r in rows]
+        recall = np.mean([len(a & b) / max(len(a), 1) for a, b in zip(exact_ids, found_ids)])
+        top1 = np.mean([exact.entry_ids[e[0]] == ivf.entry_ids[f[0]] for e, f in zip(exact_rows, rows)])
+        summary = _latency_summary(latency)
+        summary.update({
+            f'recall_at_{args.k}': float(recall),
+            'top1_agreement': float(top1),
+            'mean_candidates': ivf.stats()['mean_candidates'],
+            'speedup_vs_exact': float(np.mean(exact_latency) / np.mean(latency)),
+        })
+        report['ivf'][str(nprobe)] = summary
+
+    print(json.dumps(report, indent=2))
+
+
+def _latency_summary(latencies):
+    return {
+        'mean_ms': float(np.mean(latencies)),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Checks that a float16 or int8 face gallery makes the same match decisions as
+float32 and reports the memory and latency savings.
+
+The gallery is the known_faces database (--db) or a synthetic clustered set
+(--size). Half of the queries are noisy copies of gallery entries (genuine),
+half are unseen identities (impostors). A decision is the matched name, or
+no match, at --threshold (FacialRecognitionModule's similarity_threshold).
+
+Usage:
+    python -m benchmarks.bench_gallery_quantization --size 500000 --rerank 0 16
+    python -m benchmarks.bench_gallery_quantization --db data/known_faces.db
+"""
+import argparse
+import json
+import time
+import numpy as np
+from arc_engine.face_gallery import FaceGalleryIndex
+from benchmarks.synthetic import synthetic_gallery
+
+
+def make_queries(encodings, count, noise, rng):
+    genuine = encodings[rng.integers(0, len(encodings), count // 2)]
+    genuine = genuine + rng.normal(scale=noise, size=genuine.shape)
+    # Impostors: drawn like the gallery's identities but never enrolled.
+    impostors = rng.normal(scale=encodings.std(axis=0), size=(count - len(genuine), encodings.shape[1]))
+    impostors = impostors + encodings.mean(axis=0)
+    return np.concatenate([genuine, impostors]).astype(np.float32)
+
+
+def time_matches(gallery, queries, threshold, batch):
+    decisions = []
+    latencies = []
+    for start in range(0, len(queries), batch):
+        t0 = time.perf_counter()
+        decisions.extend(gallery.match(queries[start:start + batch], threshold))
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+    return decisions, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="Use the embeddings in this known_faces database.")
+    parser.add_argument('--size', type=int, default=200000, help="Synthetic gallery size if --db is not given.")
+    parser.add_argument('--queries', type=int, default=400)
+    parser.add_argument('--batch', type=int, default=1, help="Faces matched per call, as in one frame.")
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--noise', type=float, default=0.02, help="Genuine query noise (embedding units).")
+    parser.add_argument('--precisions', nargs='+', default=['float16', 'int8'])
+    parser.add_argument('--rerank', type=int, nargs='+', default=[0, 16])
+    args = parser.parse_args()
+
+    if args.db:
+        from communication.database_manager import DatabaseManager
+        db_manager = DatabaseManager(args.db)
+        _, names, encodings = db_manager.get_faces_since(0)
+        db_manager.close_connection()
+    else:
+        names, encodings = synthetic_gallery(args.size)
+    if len(encodings) == 0:
+        raise SystemExit("The gallery is empty.")
+    queries = make_queries(encodings, args.queries, args.noise, np.random.default_rng(1))
+
+    reference = FaceGalleryIndex(dim=encodings.shape[1], initial_capacity=len(encodings))
+    reference.add(names, encodings)
+    ref_decisions, ref_latency = time_matches(reference, queries, args.threshold, args.batch)
+    report = {
+        'gallery_size': len(encodings),
+        'queries': len(queries),
+        'threshold': args.threshold,
+        'float32': {
+            'scanned_bytes_per_face': reference.nbytes / len(reference),
+            'mean_ms': float(ref_latency.mean()),
+            'matches': sum(name is not None for name, _ in ref_decisions),
+        },
+    }
+
+    for precision in args.precisions:
+        for rerank in args.rerank:
+            gallery = FaceGalleryIndex(dim=encodings.shape[1], initial_capacity=len(encodings),
+                                       precision=precision, rerank=rerank)
+            gallery.add(names, encodings)
+            decisions, latency = time_matches(gallery, queries, args.threshold, args.batch)
+            changed = sum(a[0] != b[0] for a, b in zip(ref_decisions, decisions))
+            distance_error = [abs(a[1] - b[1]) for a, b in zip(ref_decisions, decisions)
+                              if a[1] is not None and b[1] is not None]
+            report[f'{precision}_rerank{rerank}'] = {
+                'decisions_changed': changed,
+                'decision_agreement': 1.0 - changed / len(queries),
+                'max_distance_error': float(max(distance_error, default=0.0)),
+                'scanned_bytes_per_face': gallery.nbytes / len(gallery),
+                'memory_saving': 1.0 - gallery.nbytes / reference.nbytes,
+                'mean_ms': float(latency.mean()),
+                'speedup_vs_float32': float(ref_latency.mean() / latency.mean()),
+            }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
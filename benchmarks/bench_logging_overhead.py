@@ -0,0 +1,110 @@
+"""
+Measures the per-frame cost of logging in the hot loop, before and after the
+queue-based backend in utils.logger.
+
+Each simulated frame logs --messages-per-frame records from distinct call
+sites, like "Recognized: ...", "Face recognized ... distance" and the tracker
+warnings. "sync" is the previous setup, a StreamHandler and a FileHandler
+writing on the calling thread; "queued" and "queued_rate_limited" use the
+current backend without and with rate limiting. --stall-ms delays every
+console write to simulate a slow or blocked terminal.
+
+Usage:
+    python -m benchmarks.bench_logging_overhead --frames 2000 --frame-ms 33
+    python -m benchmarks.bench_logging_overhead --stall-ms 2
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from utils.logger import LOG_FORMAT, configure_logging, flush_logging, get_logger, logging_stats
+
+
+class SlowStream:
+    """
+    A file stream whose writes take at least `stall_ms`.
+    """
+
+    def __init__(self, path, stall_ms):
+        self.file = open(path, 'a')
+        self.stall = stall_ms / 1000.0
+
+    def write(self, text):
+        if self.stall:
+            time.sleep(self.stall)
+        return self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def log_frame(logger, i, messages):
+    # Separate call sites, as in the engine; rate limiting is per call site.
+    logger.info(f"Recognized: person_{i % 7}")
+    if messages > 1:
+        logger.info(f"Face recognized: person_{i % 7} with distance {0.31 + (i % 5) * 0.01}")
+    if messages > 2:
+        logger.warning("Tracker update failed. Target may be lost.")
+    for _ in range(messages - 3):
+        logger.info(f"Track {i % 11} updated")
+
+
+def time_frames(logger, frames, messages):
+    start = time.perf_counter()
+    for i in range(frames):
+        log_frame(logger, i, messages)
+    return (time.perf_counter() - start) / frames * 1e6
+
+
+def sync_logger(workdir, stall_ms):
+    logger = logging.getLogger('bench.sync')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    console = logging.StreamHandler(SlowStream(os.path.join(workdir, 'console_sync.log'), stall_ms))
+    file_handler = logging.FileHandler(os.path.join(workdir, 'sync.log'))
+    for handler in (console, file_handler):
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+    return logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--messages-per-frame', type=int, default=3)
+    parser.add_argument('--frame-ms', type=float, default=33.3, help="Frame time to compare against.")
+    parser.add_argument('--stall-ms', type=float, default=0.0, help="Extra latency of every console write.")
+    args = parser.parse_args()
+
+    report = {'config': vars(args), 'results': {}}
+    with tempfile.TemporaryDirectory(prefix='arc-log-bench-') as workdir:
+        runs = [('sync', lambda: sync_logger(workdir, args.stall_ms))]
+        for name, rate in (('queued', None), ('queued_rate_limited', 5)):
+            def setup(rate=rate, name=name):
+                console = SlowStream(os.path.join(workdir, f'console_{name}.log'), args.stall_ms)
+                configure_logging(log_dir=os.path.join(workdir, name), console=console, rate=rate)
+                return get_logger(f'bench.{name}')
+            runs.append((name, setup))
+
+        for name, setup in runs:
+            logger = setup()
+            per_frame_us = time_frames(logger, args.frames, args.messages_per_frame)
+            start = time.perf_counter()
+            flush_logging()
+            report['results'][name] = {
+                'per_frame_us': per_frame_us,
+                'overhead_pct_of_frame': 100.0 * per_frame_us / (args.frame_ms * 1000.0),
+                'drain_ms': (time.perf_counter() - start) * 1000.0,
+                **({} if name == 'sync' else logging_stats()),
+            }
+        configure_logging(log_dir=None, console=False)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Measures the cost of the stage instrumentation (utils.metrics) relative to
+the frame time.
+
+Each instrumented frame records a handful of stage timings (capture,
+detection, tracking, recognition, frame). This times the timer context
+manager and a plain observe() call, the cost of a Prometheus scrape, and
+reports the overhead per frame as a share of --frame-ms.
+
+Usage:
+    python -m benchmarks.bench_metrics_overhead --frame-ms 33 --timers-per-frame 5
+"""
+import argparse
+import json
+import time
+from utils.metrics import MetricsRegistry
+
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--frame-ms', type=float, default=33.3, help="Frame time to compare against.")
+    parser.add_argument('--timers-per-frame', type=int, default=5)
+    parser.add_argument('--feeds', type=int, default=4, help="Feeds with populated histograms for the scrape.")
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    samples = [0.3, 2.0, 12.0, 45.0, 7.5]
+
+    def timed_block():
+        with registry.time('detection', 'feed1'):
+            pass
+
+    counter = iter(range(1 << 62))
+
+    def observe():
+        registry.observe('tracking', samples[next(counter) % 5], 'feed1')
+
+    def baseline():
+        pass
+
+    baseline_ns = time_per_call(baseline, args.iterations)
+    timer_ns = time_per_call(timed_block, args.iterations) - baseline_ns
+    observe_ns = time_per_call(observe, args.iterations) - baseline_ns
+
+    for feed in range(args.feeds):
+        for stage in ('capture', 'detection', 'tracking', 'recognition', 'frame'):
+            for sample in samples:
+                registry.observe(stage, sample, f'feed{feed}')
+    scrape_ms = time_per_call(registry.render_prometheus, 200) / 1e6
+
+    registry.enabled = False
+    disabled_timer_ns = time_per_call(timed_block, args.iterations) - baseline_ns
+    registry.enabled = True
+
+    per_frame_us = args.timers_per_frame * timer_ns / 1000.0
+    report = {
+        'timer_ns': timer_ns,
+        'observe_ns': observe_ns,
+        'per_frame_us': per_frame_us,
+        'overhead_pct_of_frame': 100.0 * per_frame_us / (args.frame_ms * 1000.0),
+        'scrape_ms': scrape_ms,
+        'scrape_series': len(registry.render_prometheus().splitlines()),
+        'disabled_timer_ns': disabled_timer_ns,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
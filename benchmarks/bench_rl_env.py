@@ -0,0 +1,110 @@
+"""
+Measures how many ARCEnv steps per second can be collected: one environment,
+a SyncVectorEnv and an AsyncVectorEnv (one subprocess per environment).
+
+The replay trace is synthetic by default: the ground-truth boxes of a
+SyntheticScene, jittered like detector output, with random face quality
+scores and detection times. Pass --replay to use a trace recorded with
+`python -m arc_engine.rl_system record`. Actions are drawn uniformly at
+random ahead of time.
+
+Usage:
+    python -m benchmarks.bench_rl_env --num-envs 8 --steps 20000
+    python -m benchmarks.bench_rl_env --replay replays/footage.npz --only async
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks.synthetic import SyntheticScene
+
+MODES = ('single', 'sync', 'async')
+
+
+def synthetic_replay(frames=3000, people=3, detection_ms=25.0, seed=0):
+    """
+    Returns a ReplayTrace of jittered SyntheticScene boxes, with the occasional
+    missed detection and random face quality.
+    """
+    from arc_engine.rl_system import ReplayTrace
+
+    rng = np.random.default_rng(seed)
+    scene = SyntheticScene(people=people, seed=seed)
+    recorded = []
+    for index in range(frames):
+        boxes = scene.boxes(index)
+        keep = rng.random(len(boxes)) > 0.05
+        boxes = boxes[keep] + rng.normal(scale=2.0, size=(int(keep.sum()), 4)).astype(np.float32)
+        scores = rng.uniform(0.4, 0.95, len(boxes)).astype(np.float32)
+        quality = rng.uniform(0.0, 0.6, len(boxes)).astype(np.float32)
+        recorded.append((boxes, scores, quality, quality >= 0.3))
+    times = rng.normal(detection_ms, detection_ms * 0.1, frames).clip(1.0)
+    return ReplayTrace.from_frames(recorded, times, fps=30.0)
+
+
+def bench_single(replay_path, args):
+    from arc_engine.rl_system import ARCEnv
+
+    env = ARCEnv(replay_path, episode_length=args.episode_length)
+    env.reset(seed=args.seed)
+    actions = np.random.default_rng(args.seed).integers(0, 3, args.steps)
+    start = time.perf_counter()
+    for action in actions:
+        _, _, terminated, truncated, _ = env.step(int(action))
+        if terminated or truncated:
+            env.reset()
+    return args.steps / (time.perf_counter() - start)
+
+
+def bench_vector(replay_path, args, asynchronous):
+    from arc_engine.rl_system import make_vec_env
+
+    env = make_vec_env(replay_path, num_envs=args.num_envs, asynchronous=asynchronous, seed=args.seed,
+                       episode_length=args.episode_length)
+    try:
+        iterations = max(1, args.steps // args.num_envs)
+        actions = np.random.default_rng(args.seed).integers(0, 3, (iterations, args.num_envs))
+        start = time.perf_counter()
+        for batch in actions:
+            env.step(batch)
+        return iterations * args.num_envs / (time.perf_counter() - start)
+    finally:
+        env.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=MODES)
+    parser.add_argument('--num-envs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--steps', type=int, default=20000, help="Timed steps per mode, over all environments.")
+    parser.add_argument('--episode-length', type=int, default=300)
+    parser.add_argument('--frames', type=int, default=3000, help="Frames of the synthetic trace.")
+    parser.add_argument('--people', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help="Use this recorded trace instead of a synthetic one.")
+    args = parser.parse_args()
+
+    report = {'config': vars(args), 'results': {}}
+    with tempfile.TemporaryDirectory(prefix='arc-rl-bench-') as workdir:
+        replay_path = args.replay
+        for mode in args.only or MODES:
+            try:
+                if replay_path is None:
+                    path = os.path.join(workdir, 'synthetic.npz')
+                    synthetic_replay(args.frames, args.people, seed=args.seed).save(path)
+                    replay_path = path
+                if mode == 'single':
+                    steps_per_second = bench_single(replay_path, args)
+                else:
+                    steps_per_second = bench_vector(replay_path, args, asynchronous=mode == 'async')
+                report['results'][mode] = {'steps_per_second': steps_per_second,
+                                           'num_envs': 1 if mode == 'single' else args.num_envs}
+            except ImportError as e:
+                report['results'][mode] = {'skipped': f"missing dependency: {e.name or e}"}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Measures dashboard startup, each run in a fresh interpreter:
+
+    process_s        interpreter start up to the end of the run, seen by the parent
+    import_s         importing PyQt5 and gui.dispatcher_dashboard
+    window_s         constructing the DispatcherDashboard and showing its window
+    engine_ready_s   the feed's engine has loaded and warmed up its models
+    first_frame_s    the first processed frame has reached the GUI thread
+
+Times other than process_s are seconds from the start of the child's
+measurement. engine_load_s (engine_ready_s - window_s) is the model loading
+the window no longer waits for. The window is rendered offscreen unless
+--show is given.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --video footage.mp4 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+METRICS = ('process_s', 'import_s', 'window_s', 'engine_ready_s', 'engine_load_s', 'first_frame_s')
+
+
+def measure_startup(source, timeout):
+    """
+    Starts the dashboard on one video source and records the startup milestones.
+    """
+    start = time.perf_counter()
+
+    def elapsed():
+        return time.perf_counter() - start
+
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication
+    from gui.dispatcher_dashboard import DispatcherDashboard, parse_video_source
+    times = {'import_s': elapsed()}
+
+    app = QApplication(sys.argv[:1])
+    dashboard = DispatcherDashboard(video_sources=[parse_video_source(source)])
+    dashboard.show()
+    app.processEvents()
+    times['window_s'] = elapsed()
+
+    worker = dashboard.feeds[0][1]
+
+    def on_ready(_):
+        times.setdefault('engine_ready_s', elapsed())
+
+    def on_frame():
+        times.setdefault('first_frame_s', elapsed())
+        app.quit()
+
+    worker.engine_ready.connect(on_ready)
+    worker.frame_ready.connect(on_frame)
+    QTimer.singleShot(int(timeout * 1000), app.quit)
+    app.exec_()
+    dashboard.close()
+    if 'engine_ready_s' in times:
+        times['engine_load_s'] = times['engine_ready_s'] - times['window_s']
+    return times
+
+
+def run_child(source, timeout, show):
+    env = dict(os.environ)
+    if not show:
+        env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    command = [sys.executable, '-m', 'benchmarks.bench_startup', '--child', source, '--timeout', str(timeout)]
+    start = time.perf_counter()
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, timeout=timeout + 60)
+    process_s = time.perf_counter() - start
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        error = completed.stderr.strip().splitlines()
+        return {'skipped': error[-1] if error else f"exit status {completed.returncode}"}
+    result = json.loads(lines[-1])
+    if 'skipped' not in result:
+        result['process_s'] = process_s
+    return result
+
+
+def summarize(runs):
+    summary = {}
+    for metric in METRICS:
+        values = [run[metric] for run in runs if metric in run]
+        if values:
+            summary[metric] = {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--video', help="Video source to open (default: a synthetic clip).")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Seconds to wait for the first frame.")
+    parser.add_argument('--show', action='store_true', help="Show the window instead of rendering offscreen.")
+    parser.add_argument('--output', help="Also write the report to this file.")
+    parser.add_argument('--child', metavar='SOURCE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        try:
+            result = measure_startup(args.child, args.timeout)
+        except ImportError as e:
+            result = {'skipped': f"missing dependency: {e.name or e}"}
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory(prefix='arc-startup-') as workdir:
+        source = args.video
+        if source is None:
+            from benchmarks.synthetic import write_video
+            source = os.path.join(workdir, 'synthetic.avi')
+            write_video(source, frames=300)
+        runs = [run_child(source, args.timeout, args.show) for _ in range(args.runs)]
+
+    completed = [run for run in runs if 'skipped' not in run]
+    report = {'runs': runs, 'summary': summarize(completed)}
+    if not completed:
+        report['skipped'] = runs[0].get('skipped') if runs else "no runs"
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+
+
+if __name__ == '__main__':
+    main()
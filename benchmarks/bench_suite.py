@@ -0,0 +1,250 @@
+"""
+Runs the engine's component benchmarks on seeded synthetic inputs and reports
+machine-readable JSON, optionally compared against a stored baseline.
+
+Benchmarks (each timed per call, after --warmup untimed calls):
+    video_read      VideoStreamProcessor.read_frame on a synthetic video file
+    detection       HumanDetectionModule.detect_humans
+    tracking        TargetTrackingModule.update_tracker (CSRT) on a moving figure
+    recognition     FacialRecognitionModule.recognize_face on the figure's box
+    gallery_match   FacialRecognitionModule.identify against the synthetic gallery
+    engine          ARCEngineCore.process_frame end to end, headless
+
+The synthetic figures have no real faces, so `recognition` measures the face
+search in the crop (the dominant cost when nobody is recognized); pass --video
+with real footage for representative detection and recognition numbers.
+Benchmarks whose dependencies are missing are reported as skipped.
+
+Usage:
+    python -m benchmarks.bench_suite --output results.json
+    python -m benchmarks.bench_suite --baseline benchmarks/baseline.json --tolerance 0.15
+    python -m benchmarks.bench_suite --only tracking gallery_match --save-baseline benchmarks/baseline.json
+
+The exit status is 1 if any benchmark's p50 is slower than the baseline's by
+more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+from benchmarks.synthetic import SyntheticScene, synthetic_gallery, write_gallery_db, write_video
+
+BENCHMARKS = ('video_read', 'detection', 'tracking', 'recognition', 'gallery_match', 'engine')
+
+
+class BenchmarkContext:
+    """
+    The inputs shared by all benchmarks, generated once per run.
+    """
+
+    def __init__(self, args, workdir):
+        self.args = args
+        self.frames_count = args.frames + args.warmup
+        if args.video:
+            self.video_path = args.video
+            self.frames, self.boxes = _load_video(args.video, self.frames_count)
+        else:
+            self.video_path = os.path.join(workdir, 'synthetic.avi')
+            write_video(self.video_path, frames=self.frames_count, people=args.people, seed=args.seed)
+            scene = SyntheticScene(people=args.people, seed=args.seed)
+            rendered = [scene.frame(i) for i in range(self.frames_count)]
+            self.frames = [frame for frame, _ in rendered]
+            self.boxes = [boxes[0] for _, boxes in rendered]
+        self.db_path = os.path.join(workdir, 'gallery.db')
+        write_gallery_db(self.db_path, args.gallery_size, seed=args.seed)
+
+
+def bench_video_read(ctx):
+    from arc_engine.video_stream_processor import VideoStreamProcessor
+
+    processor = VideoStreamProcessor(ctx.video_path)
+    try:
+        return _time_calls(lambda _: processor.read_frame(), range(ctx.frames_count), ctx.args.warmup)
+    finally:
+        processor.release()
+
+
+def bench_detection(ctx):
+    from arc_engine.human_detection_module import HumanDetectionModule
+
+    detector = HumanDetectionModule()
+    if detector.model is None:
+        raise RuntimeError("The detection model could not be loaded.")
+    return _time_calls(detector.detect_humans, ctx.frames, ctx.args.warmup)
+
+
+def bench_tracking(ctx):
+    from arc_engine.target_tracking_module import TargetTrackingModule
+
+    tracker = TargetTrackingModule()
+    box = ctx.boxes[0]
+    tracker.select_target(ctx.frames[0], [{'box': box.tolist(), 'confidence': 1.0, 'class_id': 0}])
+    return _time_calls(tracker.update_tracker, ctx.frames[1:], ctx.args.warmup)
+
+
+def bench_recognition(ctx):
+    from arc_engine.facial_recognition_module import FacialRecognitionModule
+    from communication.database_manager import DatabaseManager
+
+    db_manager = DatabaseManager(ctx.db_path)
+    try:
+        # Without the quality gate every call searches and encodes, as for a new track.
+        module = FacialRecognitionModule(db_manager, quality_gate=False)
+        calls = [(frame, tuple(int(v) for v in box)) for frame, box in zip(ctx.frames, ctx.boxes)]
+        return _time_calls(lambda call: module.recognize_face(*call), calls, ctx.args.warmup)
+    finally:
+        db_manager.close_connection()
+
+
+def bench_gallery_match(ctx):
+    from arc_engine.face_gallery import FaceGalleryIndex
+
+    names, encodings = synthetic_gallery(ctx.args.gallery_size, seed=ctx.args.seed)
+    gallery = FaceGalleryIndex(initial_capacity=len(encodings))
+    gallery.add(names, encodings)
+    rng = np.random.default_rng(ctx.args.seed + 1)
+    queries = encodings[rng.integers(0, len(encodings), ctx.frames_count)]
+    queries = (queries + rng.normal(scale=0.02, size=queries.shape)).astype(np.float32)
+    # FacialRecognitionModule.identify is gallery.match plus name mapping.
+    return _time_calls(lambda query: gallery.match(query, 0.6), queries, ctx.args.warmup)
+
+
+def bench_engine(ctx):
+    from arc_engine.arc_engine_core import ARCEngineCore
+    from arc_engine.shared_resources import SharedResources
+
+    shared = SharedResources(db_path=ctx.db_path)
+    engine = ARCEngineCore(video_source=ctx.video_path, shared=shared, feed_name='bench')
+    try:
+        return _time_calls(lambda _: engine.process_frame(), range(ctx.frames_count), ctx.args.warmup)
+    finally:
+        engine.shutdown()
+        shared.shutdown()
+
+
+def _time_calls(fn, inputs, warmup):
+    latencies = []
+    for i, item in enumerate(inputs):
+        start = time.perf_counter()
+        fn(item)
+        if i >= warmup:
+            latencies.append((time.perf_counter() - start) * 1000.0)
+    return np.array(latencies)
+
+
+def _load_video(path, count):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        status, frame = capture.read()
+        if not status:
+            break
+        frames.append(cv2.resize(frame, (640, 480)))
+    capture.release()
+    if not frames:
+        raise SystemExit(f"Cannot read frames from {path}.")
+    # No ground truth: track and recognize the centre of the frame.
+    centre = np.array([160, 60, 480, 420], dtype=np.float32)
+    return frames, [centre] * len(frames)
+
+
+def summarize(latencies):
+    return {
+        'iterations': int(len(latencies)),
+        'mean_ms': float(np.mean(latencies)),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'per_second': float(1000.0 / np.mean(latencies)) if np.mean(latencies) > 0 else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares each benchmark's p50 with the baseline's.
+
+    Returns:
+        dict: Per benchmark, the baseline and current p50, their ratio and whether
+              it is a regression (ratio above 1 + tolerance).
+    """
+    comparison = {}
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if 'p50_ms' not in result or not reference or 'p50_ms' not in reference:
+            continue
+        ratio = result['p50_ms'] / reference['p50_ms'] if reference['p50_ms'] > 0 else float('inf')
+        comparison[name] = {
+            'baseline_p50_ms': reference['p50_ms'],
+            'p50_ms': result['p50_ms'],
+            'ratio': ratio,
+            'regression': ratio > 1.0 + tolerance,
+        }
+    return comparison
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help="Run only these benchmarks.")
+    parser.add_argument('--frames', type=int, default=200, help="Timed calls per benchmark.")
+    parser.add_argument('--warmup', type=int, default=10, help="Untimed calls before timing.")
+    parser.add_argument('--people', type=int, default=3, help="Figures in the synthetic video.")
+    parser.add_argument('--gallery-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--video', help="Use this clip instead of synthetic video.")
+    parser.add_argument('--output', help="Also write the report to this file.")
+    parser.add_argument('--baseline', help="Compare against this earlier report.")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed p50 slowdown vs the baseline.")
+    parser.add_argument('--save-baseline', help="Write the report to this file as the new baseline.")
+    args = parser.parse_args()
+
+    report = {
+        'environment': environment(),
+        'config': {key: getattr(args, key) for key in ('frames', 'warmup', 'people', 'gallery_size', 'seed', 'video')},
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='arc-bench-') as workdir:
+        ctx = BenchmarkContext(args, workdir)
+        for name in args.only or BENCHMARKS:
+            try:
+                latencies = globals()[f'bench_{name}'](ctx)
+                report['results'][name] = summarize(latencies)
+            except ImportError as e:
+                report['results'][name] = {'skipped': f"missing dependency: {e.name or e}"}
+            except Exception as e:
+                report['results'][name] = {'skipped': f"{type(e).__name__}: {e}"}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['baseline'] = {'path': args.baseline, 'tolerance': args.tolerance}
+            report['comparison'] = compare(report['results'], json.load(f), args.tolerance)
+        regressions = [name for name, entry in report['comparison'].items() if entry['regression']]
+        report['regressions'] = regressions
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                f.write(text + "\n")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
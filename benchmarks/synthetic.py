@@ -0,0 +1,118 @@
+"""
+Synthetic, seeded inputs for the benchmarks: face galleries, a known_faces
+database, and video of person-like figures walking over a textured background.
+"""
+import cv2
+import numpy as np
+
+
+def synthetic_gallery(size, dim=128, per_person=4, spread=0.25, seed=0):
+    """
+    Generates `size` embeddings, `per_person` noisy samples around each identity.
+    Identities are themselves grouped around a few hundred centres, as real face
+    embeddings cluster by demographics and imaging conditions.
+    """
+    rng = np.random.default_rng(seed)
+    people = max(1, size // per_person)
+    groups = max(1, min(people, 500))
+    centres = rng.normal(scale=0.1, size=(groups, dim))
+    identities = centres[rng.integers(0, groups, people)] + rng.normal(scale=0.05, size=(people, dim))
+    identities = identities.astype(np.float32)
+    owner = rng.integers(0, people, size)
+    encodings = identities[owner] + rng.normal(scale=spread * 0.1, size=(size, dim)).astype(np.float32)
+    return [f"person_{i}" for i in owner], encodings
+
+
+def write_gallery_db(path, size, dim=128, seed=0):
+    """
+    Creates a known_faces database at `path` holding a synthetic gallery.
+
+    Returns:
+        numpy.ndarray: The (size, dim) encodings that were stored.
+    """
+    from communication.database_manager import DatabaseManager
+
+    names, encodings = synthetic_gallery(size, dim=dim, seed=seed)
+    db_manager = DatabaseManager(path)
+    db_manager.add_faces([(name, encoding, None) for name, encoding in zip(names, encodings)])
+    db_manager.close_connection()
+    return encodings
+
+
+class SyntheticScene:
+    """
+    Renders frames of person-like figures (head, torso and legs) moving at
+    constant speed and bouncing off the frame edges, with their ground-truth
+    boxes. The same seed always renders the same video.
+    """
+
+    def __init__(self, width=640, height=480, people=3, seed=0):
+        rng = np.random.default_rng(seed)
+        self.width = width
+        self.height = height
+        # Low-frequency texture so trackers have something to (not) lock on to.
+        noise = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+        self.background = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC) // 2 + 40
+        self.sizes = rng.uniform(0.35, 0.6, people) * height
+        self.positions = np.column_stack([rng.uniform(0, width - self.sizes * 0.4),
+                                          rng.uniform(0, height - self.sizes)])
+        self.velocities = rng.uniform(-4, 4, (people, 2))
+        self.colours = [tuple(int(c) for c in rng.integers(60, 255, 3)) for _ in range(people)]
+
+    def boxes(self, index):
+        """
+        Returns the figures' x1, y1, x2, y2 boxes at `index` as an (N, 4) float32
+        array, without rendering the frame.
+        """
+        boxes = []
+        for size, start, velocity in zip(self.sizes, self.positions, self.velocities):
+            w, h = size * 0.4, size
+            x = _bounce(start[0] + velocity[0] * index, self.width - w)
+            y = _bounce(start[1] + velocity[1] * index, self.height - h)
+            boxes.append((x, y, x + w, y + h))
+        return np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+    def frame(self, index):
+        """
+        Returns (frame, boxes): the BGR frame at `index` and an (N, 4) float32 array
+        of the figures' x1, y1, x2, y2 boxes.
+        """
+        frame = self.background.copy()
+        boxes = self.boxes(index)
+        for (x1, y1, x2, y2), colour in zip(boxes.tolist(), self.colours):
+            w, h = x2 - x1, y2 - y1
+            cx = int(x1 + w / 2)
+            head = int(h * 0.12)
+            cv2.circle(frame, (cx, int(y1 + head)), head, (90, 120, 200), -1)
+            cv2.ellipse(frame, (cx, int(y1 + h * 0.45)), (int(w / 2), int(h * 0.22)), 0, 0, 360, colour, -1)
+            stride = int(w * 0.15 * np.sin(index * 0.3))
+            for offset in (-1, 1):
+                cv2.line(frame, (cx + offset * int(w * 0.15), int(y1 + h * 0.62)),
+                         (cx + offset * int(w * 0.2) + offset * stride, int(y2)), colour, max(2, int(w * 0.12)))
+        return frame, boxes
+
+
+def _bounce(position, limit):
+    period = 2 * max(limit, 1)
+    position = position % period
+    return position if position <= limit else period - position
+
+
+def write_video(path, frames=300, width=640, height=480, people=3, fps=30, seed=0):
+    """
+    Writes a SyntheticScene to an MJPG video file that VideoStreamProcessor can open.
+
+    Returns:
+        list: The ground-truth boxes of every frame.
+    """
+    scene = SyntheticScene(width, height, people, seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot write video to {path}.")
+    truth = []
+    for index in range(frames):
+        frame, boxes = scene.frame(index)
+        writer.write(frame)
+        truth.append(boxes)
+    writer.release()
+    return truth
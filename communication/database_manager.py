@@ -1,26 +1,34 @@
 import sqlite3
 import numpy as np
 import io
+import os
 from utils.logger import get_logger
+from communication.embedding_snapshot import EmbeddingSnapshot
 
 class DatabaseManager:
     """
     Manages the SQLite database for storing and retrieving known face embeddings.
     """
 
-    def __init__(self, db_path='data/known_faces.db'):
+    def __init__(self, db_path='data/known_faces.db', snapshot_path=None):
         """
         Initializes the DatabaseManager, connects to the database, and creates the table if it doesn't exist.
 
         Args:
             db_path (str): The path to the SQLite database file.
+            snapshot_path (str or None): The path prefix of the gallery snapshot files.
+                Defaults to the database path with a '.gallery' suffix instead of its extension.
         """
         self.db_path = db_path
+        self.snapshot = EmbeddingSnapshot(snapshot_path or os.path.splitext(db_path)[0] + '.gallery')
         self.logger = get_logger(__name__)
         self.conn = None
         self.cursor = None
         try:
             self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # WAL lets readers proceed during bulk writes and makes commits far cheaper.
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
             self.cursor = self.conn.cursor()
             self._create_table()
             self.logger.info(f"Successfully connected to the database at {self.db_path}")
@@ -36,9 +44,14 @@ class DatabaseManager:
             self.cursor.execute('''
                 CREATE TABLE IF NOT EXISTS known_faces (
                     name TEXT NOT NULL,
-                    embedding BLOB NOT NULL
+                    embedding BLOB NOT NULL,
+                    source_hash TEXT
                 )
             ''')
+            columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(known_faces)")]
+            if 'source_hash' not in columns:
+                self.cursor.execute("ALTER TABLE known_faces ADD COLUMN source_hash TEXT")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_known_faces_source_hash ON known_faces (source_hash)")
             self.conn.commit()
             self.logger.info("Table 'known_faces' created or already exists.")
         except sqlite3.Error as e:
@@ -54,12 +67,7 @@ class DatabaseManager:
             embedding (np.ndarray): The face embedding as a NumPy array.
         """
         try:
-            # Serialize the NumPy array to a binary format
-            out = io.BytesIO()
-            np.save(out, embedding)
-            out.seek(0)
-            serialized_embedding = out.read()
-
+            serialized_embedding = serialize_embedding(embedding)
             self.cursor.execute("INSERT INTO known_faces (name, embedding) VALUES (?, ?)", (name, serialized_embedding))
             self.conn.commit()
             self.logger.info(f"Added face for '{name}' to the database.")
@@ -67,6 +75,43 @@ class DatabaseManager:
             self.logger.error(f"Error adding face for '{name}': {e}")
             raise
 
+    def add_faces(self, faces):
+        """
+        Adds many face embeddings in a single transaction.
+
+        Args:
+            faces (iterable): (name, embedding, source_hash) tuples; source_hash may be
+                None. It identifies the image the embedding was computed from.
+
+        Returns:
+            int: The number of rows inserted.
+        """
+        rows = [(name, serialize_embedding(embedding), source_hash) for name, embedding, source_hash in faces]
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO known_faces (name, embedding, source_hash) VALUES (?, ?, ?)", rows
+                )
+            self.logger.info(f"Added {len(rows)} faces to the database.")
+            return len(rows)
+        except sqlite3.Error as e:
+            self.logger.error(f"Error adding {len(rows)} faces: {e}")
+            raise
+
+    def get_known_names(self):
+        """
+        Returns the set of names that have at least one stored face.
+        """
+        return {row[0] for row in self.conn.execute("SELECT DISTINCT name FROM known_faces")}
+
+    def get_known_hashes(self):
+        """
+        Returns the set of source image hashes of the stored faces.
+        """
+        return {row[0] for row in self.conn.execute(
+            "SELECT DISTINCT source_hash FROM known_faces WHERE source_hash IS NOT NULL"
+        )}
+
     def get_all_known_faces(self):
         """
         Retrieves all face embeddings from the database.
@@ -95,10 +140,129 @@ class DatabaseManager:
             self.logger.error(f"An unexpected error occurred while deserializing embeddings: {e}")
             raise
 
+    def get_faces_since(self, rowid):
+        """
+        Retrieves the face embeddings added after a given rowid.
+
+        Args:
+            rowid (int): The watermark; only rows with a greater rowid are returned.
+
+        Returns:
+            tuple: (rowids, names, embeddings), where rowids is an int64 array and
+                   embeddings an (N, dim) float32 array.
+        """
+        try:
+            rows = self.conn.execute(
+                "SELECT rowid, name, embedding FROM known_faces WHERE rowid > ? ORDER BY rowid", (int(rowid),)
+            ).fetchall()
+        except sqlite3.Error as e:
+            self.logger.error(f"Error retrieving faces: {e}")
+            raise
+        rowids = np.array([row[0] for row in rows], dtype=np.int64)
+        names = [row[1] for row in rows]
+        return rowids, names, decode_embeddings([row[2] for row in rows])
+
+    def get_face_rowids(self, max_rowid=None):
+        """
+        Returns the rowids of all stored faces, optionally only up to max_rowid.
+        """
+        query = "SELECT rowid FROM known_faces"
+        params = ()
+        if max_rowid is not None:
+            query += " WHERE rowid <= ?"
+            params = (int(max_rowid),)
+        return np.array([row[0] for row in self.conn.execute(query, params)], dtype=np.int64)
+
+    def count_faces(self, max_rowid=None):
+        """
+        Returns the number of stored faces, optionally only those up to max_rowid.
+        """
+        if max_rowid is None:
+            return self.conn.execute("SELECT COUNT(*) FROM known_faces").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM known_faces WHERE rowid <= ?", (int(max_rowid),)).fetchone()[0]
+
+    def sync_gallery_snapshot(self):
+        """
+        Brings the on-disk gallery snapshot up to date with the database and loads it.
+
+        Rows added since the snapshot's watermark are appended to it. If rows were
+        deleted, the snapshot is rebuilt. The snapshot's write lock is held
+        throughout, so processes syncing at the same time append each row once.
+
+        Returns:
+            tuple: (rowids, names, embeddings) as returned by EmbeddingSnapshot.load.
+        """
+        with self.snapshot.lock():
+            rowids, names, embeddings = self.snapshot.load()
+            watermark = int(rowids[-1]) if len(rowids) else 0
+            if self.count_faces(watermark) != len(rowids):
+                self.logger.info("Faces were removed from the database. Rebuilding the gallery snapshot.")
+                self.snapshot.rewrite(*self.get_faces_since(0))
+            else:
+                new_rowids, new_names, new_embeddings = self.get_faces_since(watermark)
+                if len(new_rowids) == 0:
+                    return rowids, names, embeddings
+                self.snapshot.append(new_rowids, new_names, new_embeddings)
+                self.logger.info(f"Appended {len(new_rowids)} faces to the gallery snapshot.")
+            return self.snapshot.load()
+
     def close_connection(self):
         """
         Closes the database connection.
         """
         if self.conn:
             self.conn.close()
-            self.logger.info("Database connection closed.")
\ No newline at end of file
+            self.logger.info("Database connection closed.")
+
+def serialize_embedding(embedding, dtype=np.float32):
+    """
+    Serializes an embedding to the BLOB format stored in the database (np.save).
+
+    Embeddings are stored as float32: face_recognition returns float64, but the
+    extra precision does not change any match and doubles the storage.
+    """
+    out = io.BytesIO()
+    np.save(out, np.asarray(embedding, dtype=dtype))
+    return out.getvalue()
+
+
+def decode_embeddings(blobs):
+    """
+    Decodes embedding BLOBs written by add_face (np.save format) into one matrix.
+
+    The .npy header is parsed once per distinct header instead of once per row,
+    and the payloads of all rows are decoded with a single np.frombuffer call.
+
+    Args:
+        blobs (list): The serialized embeddings, all with the same shape and dtype.
+
+    Returns:
+        numpy.ndarray: An (N, dim) float32 array.
+    """
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+
+    headers = {}
+    payloads = []
+    dtype = None
+    for blob in blobs:
+        blob = bytes(blob)
+        # Bytes 8-9 (version 1.0) or 8-11 (2.0/3.0) hold the little-endian header length.
+        major = blob[6]
+        start = 10 if major == 1 else 12
+        header_end = start + int.from_bytes(blob[8:start], 'little')
+        header = blob[:header_end]
+        if header not in headers:
+            fp = io.BytesIO(header)
+            version = np.lib.format.read_magic(fp)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            headers[header] = read_header(fp)[2]
+        if dtype is None:
+            dtype = headers[header]
+        elif headers[header] != dtype:
+            # Mixed dtypes are rare enough to fall back to per-row decoding.
+            return np.stack([np.load(io.BytesIO(bytes(b))).astype(np.float32).ravel() for b in blobs])
+        payloads.append(blob[header_end:])
+
+    flat = np.frombuffer(b''.join(payloads), dtype=dtype)
+    return flat.reshape(len(blobs), -1).astype(np.float32)
@@ -0,0 +1,197 @@
+import contextlib
+import json
+import os
+import threading
+import numpy as np
+from utils.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process locking of the snapshot
+    fcntl = None
+
+
+class EmbeddingSnapshot:
+    """
+    An append-only on-disk copy of the face gallery kept next to the SQLite database.
+
+    Embeddings are stored as one contiguous raw float32 matrix (`<base>.f32`) that
+    is memory-mapped on load, so startup does not deserialize rows one by one. The
+    SQLite rowid and name of each row are kept in `<base>.ids.jsonl`, and the
+    highest rowid in the snapshot is the watermark up to which it is in sync with
+    the database. New rows are appended; a full rewrite is only needed when rows
+    were deleted from the database.
+
+    Writers hold an exclusive file lock (`<base>.lock`) and first cut off
+    whatever an interrupted append left behind; rewrites replace the files
+    atomically. Readers do not lock: embeddings are written before their ids,
+    so the ids file bounds the rows a reader sees.
+    """
+
+    def __init__(self, base_path):
+        """
+        Initializes the EmbeddingSnapshot.
+
+        Args:
+            base_path (str): The path prefix of the snapshot files.
+        """
+        self.base_path = base_path
+        self.matrix_path = base_path + '.f32'
+        self.ids_path = base_path + '.ids.jsonl'
+        self.meta_path = base_path + '.meta.json'
+        self.lock_path = base_path + '.lock'
+        self._thread_lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+        self.logger = get_logger(__name__)
+
+    def load(self):
+        """
+        Loads the snapshot.
+
+        Returns:
+            tuple: (rowids, names, embeddings), where rowids is an int64 array, names a
+                   list, and embeddings a read-only (N, dim) float32 memory map. All are
+                   empty if no snapshot exists.
+        """
+        dim = self._read_dim()
+        if dim is None or not os.path.exists(self.ids_path) or not os.path.exists(self.matrix_path):
+            return np.empty((0,), dtype=np.int64), [], np.empty((0, dim or 0), dtype=np.float32)
+
+        rowids, names = [], []
+        with open(self.ids_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                # A partially written last line means an interrupted append.
+                try:
+                    rowid, name = json.loads(line)
+                except ValueError:
+                    break
+                rowids.append(rowid)
+                names.append(name)
+
+        # Embeddings are appended before ids, so the ids file bounds the usable rows.
+        rows = min(len(rowids), os.path.getsize(self.matrix_path) // (4 * dim))
+        if rows == 0:
+            embeddings = np.empty((0, dim), dtype=np.float32)
+        else:
+            embeddings = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(rows, dim))
+        return np.asarray(rowids[:rows], dtype=np.int64), names[:rows], embeddings
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Holds the snapshot's exclusive inter-process write lock. Callers that
+        load, compare with the database and then append or rewrite should hold
+        it for the whole sequence; the lock is reentrant.
+        """
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+                self._lock_file = open(self.lock_path, 'a')
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    # Closing the file releases the flock.
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def append(self, rowids, names, embeddings):
+        """
+        Appends rows to the snapshot, after repairing an interrupted earlier append.
+
+        Args:
+            rowids (numpy.ndarray): The SQLite rowids, all above the current watermark.
+            names (list): The names.
+            embeddings (numpy.ndarray): An (N, dim) array of embeddings.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(embeddings) == 0:
+            return
+        with self.lock():
+            if self._read_dim() is None:
+                self._write_dim(embeddings.shape[1])
+            else:
+                self._repair()
+            with open(self.matrix_path, 'ab') as f:
+                f.write(embeddings.tobytes())
+            with open(self.ids_path, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps([int(rowid), name]) + '\n' for rowid, name in zip(rowids, names))
+
+    def rewrite(self, rowids, names, embeddings):
+        """
+        Replaces the snapshot with the given rows.
+
+        The new files are written next to the old ones and moved into place. The
+        ids file is emptied first and replaced last, so an interrupted rewrite
+        leaves an empty snapshot (rebuilt by the next sync), never ids that
+        point into the wrong matrix.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with self.lock():
+            temp = {path: path + '.tmp' for path in (self.matrix_path, self.ids_path, self.meta_path)}
+            with open(temp[self.matrix_path], 'wb') as f:
+                f.write(embeddings.tobytes())
+            with open(temp[self.ids_path], 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps([int(rowid), name]) + '\n' for rowid, name in zip(rowids, names))
+            dim = embeddings.shape[1] if embeddings.ndim == 2 and len(embeddings) else self._read_dim()
+            if dim is None:
+                del temp[self.meta_path]
+            else:
+                self._write_dim(dim, temp[self.meta_path])
+
+            if os.path.exists(self.ids_path):
+                open(self.ids_path + '.empty', 'w').close()
+                os.replace(self.ids_path + '.empty', self.ids_path)
+            for path in (self.matrix_path, self.meta_path, self.ids_path):
+                if path in temp:
+                    os.replace(temp[path], path)
+
+    def _repair(self):
+        """
+        Cuts the ids file back to its last complete line and the matrix back to
+        the rows those ids describe, undoing an interrupted append.
+        """
+        dim = self._read_dim()
+        complete_bytes, rows = 0, 0
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, 'rb') as f:
+                for line in f:
+                    try:
+                        json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    complete_bytes += len(line)
+                    rows += 1
+        matrix_bytes = os.path.getsize(self.matrix_path) if os.path.exists(self.matrix_path) else 0
+        if matrix_bytes < rows * 4 * dim:
+            # Only possible if the files were damaged outside an append; keep the rows both cover.
+            rows = matrix_bytes // (4 * dim)
+            complete_bytes = 0
+            with open(self.ids_path, 'rb') as f:
+                for _ in range(rows):
+                    complete_bytes += len(f.readline())
+        if os.path.exists(self.ids_path) and os.path.getsize(self.ids_path) != complete_bytes:
+            self.logger.warning(f"Truncating the interrupted append of {self.ids_path} to {rows} rows.")
+            os.truncate(self.ids_path, complete_bytes)
+        if matrix_bytes != rows * 4 * dim:
+            if matrix_bytes > rows * 4 * dim:
+                self.logger.warning(f"Truncating the interrupted append of {self.matrix_path} to {rows} rows.")
+            with open(self.matrix_path, 'ab') as f:
+                f.truncate(rows * 4 * dim)
+
+    def _read_dim(self):
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)['dim']
+
+    def _write_dim(self, dim, path=None):
+        with open(path or self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'dim': int(dim), 'dtype': 'float32'}, f)
@@ -0,0 +1,348 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from utils.logger import get_logger
+
+_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS detections (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        feed TEXT NOT NULL,
+        frame_seq INTEGER,
+        x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+        score REAL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS tracks (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        feed TEXT NOT NULL,
+        frame_seq INTEGER,
+        track_id INTEGER NOT NULL,
+        x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+        confidence REAL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS identifications (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        feed TEXT NOT NULL,
+        track_id INTEGER,
+        name TEXT NOT NULL,
+        distance REAL,
+        x1 REAL, y1 REAL, x2 REAL, y2 REAL
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_detections_ts ON detections (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_tracks_ts ON tracks (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_tracks_track ON tracks (track_id, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_identifications_ts ON identifications (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_identifications_name ON identifications (name, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_identifications_track ON identifications (track_id, ts)",
+]
+
+_INSERTS = {
+    'detections': "INSERT INTO detections (ts, feed, frame_seq, x1, y1, x2, y2, score) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+    'tracks': "INSERT INTO tracks (ts, feed, frame_seq, track_id, x1, y1, x2, y2, confidence) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    'identifications': "INSERT INTO identifications (ts, feed, track_id, name, distance, x1, y1, x2, y2) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+}
+
+
+class EventStore:
+    """
+    Persists detections, tracks and identifications to SQLite for after-action review.
+
+    The record_* methods only enqueue rows; a background writer thread drains the
+    bounded queue and inserts everything that accumulated within `flush_interval`
+    (or `batch_size` rows) in one transaction. When the queue is full new events
+    are dropped and counted instead of blocking the caller, so a slow disk never
+    stalls the live pipeline. The database runs in WAL mode, and the query_*
+    methods use their own per-thread read-only connections, so reviews can run
+    while the engine keeps writing.
+    """
+    def __init__(self, db_path='data/events.db', max_queue=10000, batch_size=1000, flush_interval=0.5,
+                 feed='default'):
+        """
+        Initializes the EventStore, creates its tables and starts the writer thread.
+
+        Args:
+            db_path (str): The path to the SQLite events database.
+            max_queue (int): The maximum number of pending event batches (one batch is
+                e.g. all tracks of one frame).
+            batch_size (int): The number of rows after which the writer commits early.
+            flush_interval (float): The maximum time in seconds events wait before being committed.
+            feed (str): The default feed name stored with events.
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.feed = feed
+        self.logger = get_logger(__name__)
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._running = True
+        self.enqueued_rows = 0
+        self.dropped_rows = 0
+        self.written_rows = 0
+        self.commits = 0
+        self.commit_seconds = 0.0
+        self.max_queue_depth = 0
+        self._writer = threading.Thread(target=self._write_loop, name="arc-event-writer", daemon=True)
+        self._writer.start()
+        self.logger.info(f"EventStore writing to {db_path}.")
+
+    def record_detections(self, boxes, scores, frame_seq=None, timestamp=None, feed=None):
+        """
+        Records the person detections of one frame.
+
+        Args:
+            boxes (numpy.ndarray or list): (N, 4) boxes (x1, y1, x2, y2).
+            scores (numpy.ndarray or list): N confidence scores.
+            frame_seq (int or None): The frame sequence number.
+            timestamp (float or None): The frame time, defaults to time.time().
+            feed (str or None): The feed name, defaults to the store's feed.
+        """
+        ts = time.time() if timestamp is None else timestamp
+        feed = feed or self.feed
+        self._enqueue('detections', [
+            (ts, feed, frame_seq, float(x1), float(y1), float(x2), float(y2), float(score))
+            for (x1, y1, x2, y2), score in zip(boxes, scores)
+        ])
+
+    def record_tracks(self, tracks, frame_seq=None, timestamp=None, feed=None):
+        """
+        Records the active tracks of one frame.
+
+        Args:
+            tracks (list): Dicts with 'track_id', 'box' (x1, y1, x2, y2) and optionally
+                'confidence', as returned by TargetTrackingModule.update_tracks.
+            frame_seq (int or None): The frame sequence number.
+            timestamp (float or None): The frame time, defaults to time.time().
+            feed (str or None): The feed name, defaults to the store's feed.
+        """
+        ts = time.time() if timestamp is None else timestamp
+        feed = feed or self.feed
+        self._enqueue('tracks', [
+            (ts, feed, frame_seq, int(track['track_id']), *(float(v) for v in track['box']),
+             None if track.get('confidence') is None else float(track['confidence']))
+            for track in tracks
+        ])
+
+    def record_frame(self, frame_seq, timestamp=None, detections=None, tracks=None, feed=None):
+        """
+        Records the detections (if detection ran) and the tracks of one frame.
+
+        Args:
+            frame_seq (int or None): The frame sequence number.
+            timestamp (float or None): The frame time, defaults to time.time().
+            detections (tuple, list or None): (boxes, scores) as returned by
+                detect_humans_batch, or a list of dicts as returned by detect_humans.
+            tracks (list or None): Tracks as returned by TargetTrackingModule.current_tracks.
+            feed (str or None): The feed name, defaults to the store's feed.
+        """
+        ts = time.time() if timestamp is None else timestamp
+        if detections is not None:
+            if isinstance(detections, tuple):
+                boxes, scores = detections
+            else:
+                boxes = [d['box'] for d in detections]
+                scores = [d['confidence'] for d in detections]
+            self.record_detections(boxes, scores, frame_seq, ts, feed)
+        if tracks:
+            self.record_tracks(tracks, frame_seq, ts, feed)
+
+    def record_identification(self, track_id, name, distance, face_bbox=None, timestamp=None, feed=None):
+        """
+        Records a face recognition result.
+
+        Args:
+            track_id (int or None): The track the face belongs to.
+            name (str): The recognized name or "Unknown".
+            distance (float or None): The face distance of the best match.
+            face_bbox (tuple or None): The face box (x1, y1, x2, y2) in frame coordinates.
+            timestamp (float or None): The time of recognition, defaults to time.time().
+            feed (str or None): The feed name, defaults to the store's feed.
+        """
+        ts = time.time() if timestamp is None else timestamp
+        box = tuple(float(v) for v in face_bbox) if face_bbox is not None else (None,) * 4
+        self._enqueue('identifications', [
+            (ts, feed or self.feed, track_id, name, None if distance is None else float(distance), *box)
+        ])
+
+    def flush(self, timeout=5.0):
+        """
+        Blocks until every event recorded so far is committed.
+
+        Returns:
+            bool: True if the events were committed within the timeout.
+        """
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """
+        Commits the pending events and stops the writer thread.
+        """
+        if not self._running:
+            return
+        self.flush(timeout)
+        self._running = False
+        self._writer.join(timeout=timeout)
+        self.logger.info(f"EventStore closed after writing {self.written_rows} rows "
+                         f"({self.dropped_rows} dropped).")
+
+    def stats(self):
+        """
+        Returns the write throughput and the backpressure counters.
+        """
+        return {
+            'enqueued_rows': self.enqueued_rows,
+            'written_rows': self.written_rows,
+            'dropped_rows': self.dropped_rows,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'commits': self.commits,
+            'mean_rows_per_commit': self.written_rows / self.commits if self.commits else 0.0,
+            'mean_commit_ms': 1000.0 * self.commit_seconds / self.commits if self.commits else 0.0,
+        }
+
+    def query_identifications(self, name=None, track_id=None, start=None, end=None, feed=None, limit=1000):
+        """
+        Returns identifications, newest first.
+
+        Args:
+            name (str or None): Only this name.
+            track_id (int or None): Only this track.
+            start (float or None): Only events at or after this time.
+            end (float or None): Only events before this time.
+            feed (str or None): Only this feed.
+            limit (int): The maximum number of rows.
+
+        Returns:
+            list: One dict per identification.
+        """
+        return self._select('identifications', {'name': name, 'track_id': track_id, 'feed': feed},
+                            start, end, limit, order='DESC')
+
+    def query_tracks(self, track_id=None, start=None, end=None, feed=None, limit=10000):
+        """
+        Returns track positions in time order, e.g. the path of one track.
+        """
+        return self._select('tracks', {'track_id': track_id, 'feed': feed}, start, end, limit)
+
+    def query_detections(self, start=None, end=None, feed=None, limit=10000):
+        """
+        Returns detections in time order.
+        """
+        return self._select('detections', {'feed': feed}, start, end, limit)
+
+    def sightings(self, name=None, start=None, end=None):
+        """
+        Summarizes identifications per person and track.
+
+        Returns:
+            list: Dicts with feed, track_id, name, first_seen, last_seen, count and
+                  best_distance, most recent first.
+        """
+        where, params = self._where({'name': name}, start, end)
+        query = ("SELECT feed, track_id, name, MIN(ts) AS first_seen, MAX(ts) AS last_seen, "
+                 "COUNT(*) AS count, MIN(distance) AS best_distance FROM identifications"
+                 f"{where} GROUP BY feed, track_id, name ORDER BY last_seen DESC")
+        return self._fetch(query, params)
+
+    def _enqueue(self, table, rows):
+        if not rows:
+            return
+        try:
+            self._queue.put_nowait((table, rows))
+        except queue.Full:
+            self.dropped_rows += len(rows)
+            return
+        self.enqueued_rows += len(rows)
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while self._running or not self._queue.empty():
+                pending = {}
+                waiters = []
+                count = 0
+                deadline = time.monotonic() + self.flush_interval
+                while count < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        break
+                    table, rows = item
+                    pending.setdefault(table, []).extend(rows)
+                    count += len(rows)
+                if pending:
+                    self._commit(conn, pending, count)
+                for waiter in waiters:
+                    waiter.set()
+        finally:
+            conn.close()
+
+    def _commit(self, conn, pending, count):
+        start = time.perf_counter()
+        try:
+            with conn:
+                for table, rows in pending.items():
+                    conn.executemany(_INSERTS[table], rows)
+        except sqlite3.Error as e:
+            self.logger.error(f"Failed to write {count} events: {e}")
+            self.dropped_rows += count
+            return
+        self.commit_seconds += time.perf_counter() - start
+        self.commits += 1
+        self.written_rows += count
+
+    def _select(self, table, filters, start, end, limit, order='ASC'):
+        where, params = self._where(filters, start, end)
+        query = f"SELECT * FROM {table}{where} ORDER BY ts {order} LIMIT ?"
+        return self._fetch(query, params + [int(limit)])
+
+    @staticmethod
+    def _where(filters, start, end):
+        clauses, params = [], []
+        for column, value in filters.items():
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _fetch(self, query, params):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{os.path.abspath(self.db_path)}?mode=ro", uri=True,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return [dict(row) for row in conn.execute(query, params)]
@@ -1,57 +1,199 @@
+import math
 import sys
+import threading
+import time
+import cv2
+import numpy as np
 from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
     QWidget,
     QVBoxLayout,
+    QGridLayout,
     QLabel,
     QPushButton,
+    QCheckBox,
     QStatusBar,
 )
-from PyQt5.QtCore import QThread, QObject, pyqtSignal, pyqtSlot
+from PyQt5.QtCore import Qt, QThread, QObject, QTimer, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QImage, QPixmap
 from utils.logger import get_logger
+from utils.metrics import metrics
 
 logger = get_logger(__name__)
-from arc_engine.arc_engine_core import ARCEngineCore
+
+DISPLAY_SIZE = (1280, 720)  # width, height of the video label
+DEFAULT_DISPLAY_FPS = 60.0
+OVERLAY_REFRESH_SECONDS = 0.5
+OVERLAY_STAGES = ('capture', 'detection', 'tracking', 'recognition', 'frame', 'end_to_end')
+
+
+def parse_video_source(value):
+    """
+    Converts a command-line video source to what VideoStreamProcessor expects:
+    camera indices as int, anything else (file path, stream URL) unchanged.
+    """
+    return int(value) if str(value).isdigit() else value
+
+
+class DisplayFrameSlot:
+    """
+    Hands display-ready RGB frames from the engine thread to the GUI thread.
+
+    The worker renders into one of three reusable buffers and publishes it; the
+    GUI takes the newest published buffer when it paints. A frame published
+    while an earlier one is still waiting replaces it, so the GUI never paints
+    a backlog of stale frames. Three buffers guarantee the worker always has
+    one that is neither waiting nor being painted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffers = []
+        self._shape = None
+        self._write = 0
+        self._pending = None
+        self._painting = None
+        self.published = 0
+        self.coalesced = 0
+
+    def acquire(self, height, width):
+        """
+        Returns a free (height, width, 3) uint8 buffer for the worker to render into.
+        """
+        with self._lock:
+            if self._shape != (height, width):
+                # Buffers being painted keep their old arrays alive until release.
+                self._buffers = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(3)]
+                self._shape = (height, width)
+                self._pending = self._painting = None
+            index = self._write
+            while index == self._pending or index == self._painting:
+                index = (index + 1) % 3
+            self._write = index
+            return self._buffers[index]
+
+    def publish(self):
+        """
+        Publishes the buffer last returned by acquire().
+
+        Returns:
+            bool: True if the GUI has to be notified, False if a frame was
+                already waiting (it is replaced and counted as coalesced).
+        """
+        with self._lock:
+            notify = self._pending is None
+            if not notify:
+                self.coalesced += 1
+            self._pending = self._write
+            self._write = (self._write + 1) % 3
+            self.published += 1
+            return notify
+
+    def take(self):
+        """
+        Returns the newest published frame, or None, and marks it as being painted.
+        """
+        with self._lock:
+            if self._pending is None:
+                return None
+            self._painting, self._pending = self._pending, None
+            return self._buffers[self._painting]
+
+    def release(self):
+        """
+        Returns the buffer from take() to the pool once it has been copied.
+        """
+        with self._lock:
+            self._painting = None
 
 
 class EngineWorker(QObject):
     """
-    Worker thread for running the ARCEngineCore.
+    Worker thread for running the ARCEngineCore of one video feed.
+
+    The engine is created on the worker thread when it starts, so the window
+    is shown while the models load and warm up; engine_ready is emitted once
+    it can process frames.
+
+    Frames are converted to RGB and scaled to the display size in this thread
+    and emitted no faster than the display refresh rate. frame_ready carries
+    no payload: the GUI collects the newest frame from `frame_slot`.
     """
-    frame_ready = pyqtSignal(object)
+    frame_ready = pyqtSignal()
+    engine_ready = pyqtSignal(str)  # feed name
     status_updated = pyqtSignal(str)
-    person_identified = pyqtSignal(str)
+    person_identified = pyqtSignal(str, str)  # feed name, person name
 
-    def __init__(self):
+    def __init__(self, video_source=0, shared=None, feed_name='feed1', display_size=DISPLAY_SIZE,
+                 max_fps=DEFAULT_DISPLAY_FPS, shared_options=None):
+        """
+        Args:
+            video_source (int or str): The feed's video source.
+            shared (SharedResources or None): Models and gallery shared between feeds. If None,
+                the process-wide instance is used, loaded by the first worker that needs it.
+            feed_name (str): The name the feed is shown and its events stored under.
+            display_size (tuple): (width, height) frames are scaled to fit.
+            max_fps (float): Maximum rate at which frames are handed to the GUI.
+            shared_options (dict or None): SharedResources arguments used if this worker
+                loads the process-wide instance.
+        """
         super().__init__()
-        self.engine = ARCEngineCore(video_source=0)
+        self.feed_name = feed_name
+        self.video_source = video_source
+        self.shared = shared
+        self.shared_options = shared_options or {}
+        self.engine = None
         self.running = True
+        self.frames_processed = 0
+        self.latency_ms = 0.0  # moving average of process_frame time
+        self.frame_slot = DisplayFrameSlot()
+        self.display_size = display_size
+        self.min_frame_interval = 1.0 / max_fps if max_fps else 0.0
+        self.throttled = 0
+        self.show_overlay = False
+        self._overlay_lines = []
+        self._overlay_time = 0.0
+        self._last_emit = 0.0
+        self._scaled = None
 
     @pyqtSlot()
     def run(self):
         """
         Starts the engine's processing loop.
         """
-        logger.info("EngineWorker started.")
+        logger.info(f"EngineWorker for {self.feed_name} started.")
+        self.status_updated.emit("Engine warming: loading models...")
+        try:
+            self.engine = self._create_engine()
+        except Exception as e:
+            logger.error(f"Engine for {self.feed_name} failed to start: {e}")
+            self.status_updated.emit(f"Engine failed to start: {e}")
+            return
+        if self.running:
+            self.status_updated.emit("Engine ready.")
+            self.engine_ready.emit(self.feed_name)
         while self.running:
+            start = time.perf_counter()
             status, frame, message, name = self.engine.process_frame()
             if not status:
                 self.status_updated.emit("Failed to read frame from video stream.")
                 break
             
             if frame is not None:
-                self.frame_ready.emit(frame)
+                elapsed_ms = (time.perf_counter() - start) * 1000.0
+                self.latency_ms += 0.1 * (elapsed_ms - self.latency_ms) if self.frames_processed else elapsed_ms
+                self.frames_processed += 1
+                self._publish_frame(frame)
             
             if message:
                 self.status_updated.emit(message)
             
             if name:
-                self.person_identified.emit(name)
+                self.person_identified.emit(self.feed_name, name)
         
         self.engine.shutdown()
-        logger.info("EngineWorker finished.")
+        logger.info(f"EngineWorker for {self.feed_name} finished.")
 
     def stop(self):
         """
@@ -59,25 +201,204 @@ class EngineWorker(QObject):
         """
         self.running = False
 
+    def _create_engine(self):
+        """
+        Creates the feed's engine, loading the shared models first if no other
+        feed has. The engine modules are imported here, not at module level,
+        because they pull in torch, ultralytics and dlib.
+        """
+        from arc_engine.arc_engine_core import ARCEngineCore
+        from arc_engine.shared_resources import get_shared_resources
+
+        if self.shared is None:
+            self.shared = get_shared_resources(**self.shared_options)
+        return ARCEngineCore(video_source=self.video_source, shared=self.shared, feed_name=self.feed_name)
+
+    def _publish_frame(self, frame):
+        """
+        Renders a BGR frame into a display buffer and notifies the GUI,
+        skipping frames that arrive faster than the display can show them.
+        """
+        now = time.monotonic()
+        if now - self._last_emit < self.min_frame_interval:
+            self.throttled += 1
+            return
+        self._last_emit = now
+
+        h, w = frame.shape[:2]
+        scale = min(self.display_size[0] / w, self.display_size[1] / h)
+        out_w, out_h = max(1, int(w * scale)), max(1, int(h * scale))
+        target = self.frame_slot.acquire(out_h, out_w)
+        if (out_w, out_h) == (w, h):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=target)
+        else:
+            # Scale first so the colour conversion touches display-sized pixels only.
+            if self._scaled is None or self._scaled.shape != target.shape:
+                self._scaled = np.empty_like(target)
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+            cv2.resize(frame, (out_w, out_h), dst=self._scaled, interpolation=interpolation)
+            cv2.cvtColor(self._scaled, cv2.COLOR_BGR2RGB, dst=target)
+        if self.show_overlay:
+            self._draw_overlay(target, now)
+        if self.frame_slot.publish():
+            self.frame_ready.emit()
+
+
+    def _draw_overlay(self, image, now):
+        """
+        Draws the feed's FPS and per-stage p50/p95 latencies onto a display frame.
+        The text is recomputed every OVERLAY_REFRESH_SECONDS.
+        """
+        if now - self._overlay_time >= OVERLAY_REFRESH_SECONDS:
+            self._overlay_time = now
+            summaries = metrics.stage_summaries(feed=self.feed_name)
+            lines = [f"{self.engine.fps:.1f} FPS"]
+            for stage in OVERLAY_STAGES:
+                summary = summaries.get(stage)
+                if summary and summary['count']:
+                    lines.append(f"{stage}: p50 {summary['p50_ms']:.1f} / p95 {summary['p95_ms']:.1f} ms")
+            self._overlay_lines = lines
+        for i, line in enumerate(self._overlay_lines):
+            cv2.putText(image, line, (8, 18 + 16 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1, cv2.LINE_AA)
+
+
+class FeedView(QWidget):
+    """
+    Shows one feed's video with its status, FPS, latency and render counters.
+    """
+
+    def __init__(self, worker, display_size, parent=None):
+        """
+        Args:
+            worker (EngineWorker): The worker producing the feed's frames.
+            display_size (tuple): (width, height) of the video label.
+            parent (QWidget or None): The parent widget.
+        """
+        super().__init__(parent)
+        self.worker = worker
+        self.frames_painted = 0
+        self._last_frames = 0
+        self._last_time = time.monotonic()
+        self.fps = 0.0
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.video_display = QLabel(f"{worker.feed_name}: engine warming...")
+        self.video_display.setStyleSheet("background-color: black; color: white;")
+        self.video_display.setFixedSize(*display_size)
+        self.video_display.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.video_display)
+        self.status_label = QLabel(f"{worker.feed_name}: starting")
+        layout.addWidget(self.status_label)
+        self.stats_label = QLabel(self)
+        layout.addWidget(self.stats_label)
+
+        worker.frame_ready.connect(self.update_frame)
+        worker.engine_ready.connect(self.show_engine_ready)
+        worker.status_updated.connect(self.update_status)
+
+    @pyqtSlot()
+    def update_frame(self):
+        """
+        Paints the newest frame rendered by the worker.
+        """
+        slot = self.worker.frame_slot
+        frame = slot.take()
+        if frame is None:
+            return
+        try:
+            # The frame is already RGB at display size; fromImage copies it
+            # into the pixmap, so the buffer can go back to the worker.
+            h, w, ch = frame.shape
+            qt_image = QImage(frame.data, w, h, ch * w, QImage.Format_RGB888)
+            self.video_display.setPixmap(QPixmap.fromImage(qt_image))
+        finally:
+            slot.release()
+        self.frames_painted += 1
+
+    @pyqtSlot(str)
+    def show_engine_ready(self, feed_name):
+        """
+        Replaces the warming placeholder until the first frame is painted.
+        """
+        if self.frames_painted == 0:
+            self.video_display.setText(f"{feed_name}: waiting for video...")
+
+    @pyqtSlot(str)
+    def update_status(self, message):
+        """
+        Shows the feed's latest status message.
+        """
+        self.status_label.setText(f"{self.worker.feed_name}: {message}")
+
+    def render_stats(self):
+        """
+        Returns the feed's frame counters.
+
+        Returns:
+            dict: Engine FPS over the last refresh, mean processing latency, frames
+                painted and frames dropped (throttled in the worker plus coalesced
+                while a newer one was waiting) with both causes.
+        """
+        throttled = self.worker.throttled
+        coalesced = self.worker.frame_slot.coalesced
+        return {
+            'fps': self.fps,
+            'latency_ms': self.worker.latency_ms,
+            'painted': self.frames_painted,
+            'dropped': throttled + coalesced,
+            'throttled': throttled,
+            'coalesced': coalesced,
+        }
+
+    def update_render_stats(self):
+        """
+        Recomputes the FPS and shows the counters below the video.
+        """
+        now = time.monotonic()
+        frames = self.worker.frames_processed
+        self.fps = (frames - self._last_frames) / max(now - self._last_time, 1e-6)
+        self._last_frames, self._last_time = frames, now
+        stats = self.render_stats()
+        self.stats_label.setText(
+            f"{stats['fps']:.1f} FPS  {stats['latency_ms']:.1f} ms  "
+            f"painted: {stats['painted']}  dropped: {stats['dropped']} "
+            f"(throttled {stats['throttled']}, coalesced {stats['coalesced']})")
+
 
 class DispatcherDashboard(QMainWindow):
     """
     Main application window for the Dispatcher Dashboard.
+
+    Each video source gets its own engine (capture, tracking and identity state)
+    on its own thread and a cell in a grid; the detector, face gallery and
+    databases are loaded once and shared by all feeds. The engines are
+    started once the event loop runs, so the window appears before the
+    models are loaded.
     """
 
-    def __init__(self):
+    def __init__(self, video_sources=(0,), shared_options=None):
         """
         Initializes the DispatcherDashboard window.
+
+        Args:
+            video_sources (sequence): The video sources of the feeds to show.
+            shared_options (dict or None): Arguments of the SharedResources loaded by
+                the first feed, e.g. {'detection_server': 'local'}.
         """
         super().__init__()
 
         self.setWindowTitle("ARC System - Dispatcher Dashboard")
-        self.setGeometry(100, 100, 1280, 720)  # x, y, width, height
+        self.setGeometry(100, 100, *DISPLAY_SIZE)  # x, y, width, height
+        self.video_sources = list(video_sources) or [0]
+        self.shared_options = shared_options or {}
+        self.feeds = []  # (view, worker, thread)
+        self.feeds_ready = 0
 
         logger.info("Dispatcher Dashboard GUI initialized.")
 
         self._init_ui()
-        self._init_engine_thread()
+        self._init_engine_threads()
 
     def _init_ui(self):
         """
@@ -88,48 +409,86 @@ class DispatcherDashboard(QMainWindow):
         self.setCentralWidget(central_widget)
         main_layout = QVBoxLayout(central_widget)
 
-        # Video Display Label
-        self.video_display = QLabel("Video feed will be displayed here.")
-        self.video_display.setStyleSheet("background-color: black; color: white;")
-        self.video_display.setFixedSize(1280, 720)  # Example size
-        main_layout.addWidget(self.video_display)
+        # Video grid, filled in by _init_engine_threads
+        self.feed_grid = QGridLayout()
+        main_layout.addLayout(self.feed_grid)
+
+        # Per-feed counters, refreshed once a second
+        self.render_stats_timer = QTimer(self)
+        self.render_stats_timer.timeout.connect(self.update_render_stats)
+        self.render_stats_timer.start(1000)
 
         # Status Bar
         self.setStatusBar(QStatusBar(self))
-        self.statusBar().showMessage("ARC Engine status will be shown here.")
+        self.statusBar().showMessage("ARC Engine warming: loading models...")
+
+        # Metrics overlay toggle
+        self.overlay_checkbox = QCheckBox("Show latency overlay", self)
+        self.overlay_checkbox.toggled.connect(self.set_overlay)
+        main_layout.addWidget(self.overlay_checkbox)
 
         # Quit Button
         quit_button = QPushButton("Quit", self)
         quit_button.clicked.connect(self.close)
         main_layout.addWidget(quit_button)
 
-    def _init_engine_thread(self):
+    def _init_engine_threads(self):
         """
-        Initializes and starts the background thread for the ARC engine.
+        Creates one engine worker, thread and grid cell per video source. The
+        threads are started from the event loop, after the window is shown.
         """
-        self.thread = QThread()
-        self.worker = EngineWorker()
-        self.worker.moveToThread(self.thread)
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 0
+        columns = math.ceil(math.sqrt(len(self.video_sources)))
+        rows = math.ceil(len(self.video_sources) / columns)
+        cell_size = (DISPLAY_SIZE[0] // columns, DISPLAY_SIZE[1] // rows)
 
-        # Connect signals and slots
-        self.thread.started.connect(self.worker.run)
-        self.worker.frame_ready.connect(self.update_frame)
-        self.worker.status_updated.connect(self.update_status)
-        self.worker.person_identified.connect(self.handle_person_identified)
+        for index, source in enumerate(self.video_sources):
+            thread = QThread()
+            worker = EngineWorker(video_source=source, feed_name=f"feed{index + 1}", display_size=cell_size,
+                                  max_fps=refresh_rate or DEFAULT_DISPLAY_FPS, shared_options=self.shared_options)
+            worker.moveToThread(thread)
+            view = FeedView(worker, cell_size, self)
+            self.feed_grid.addWidget(view, index // columns, index % columns)
 
-        self.thread.start()
-        logger.info("ARCEngine thread started.")
+            # Connect signals and slots
+            thread.started.connect(worker.run)
+            worker.engine_ready.connect(self.handle_engine_ready)
+            worker.person_identified.connect(self.handle_person_identified)
+            self.feeds.append((view, worker, thread))
+        QTimer.singleShot(0, self._start_engine_threads)
 
-    @pyqtSlot(object)
-    def update_frame(self, frame):
+    @pyqtSlot()
+    def _start_engine_threads(self):
+        for _, worker, thread in self.feeds:
+            if worker.running:
+                thread.start()
+                logger.info(f"ARCEngine thread for {worker.feed_name} started.")
+
+    def render_stats(self):
         """
-        Updates the video display with a new frame.
+        Returns the per-feed frame counters.
+
+        Returns:
+            dict: FeedView.render_stats() of each feed, by feed name.
         """
-        # Convert OpenCV frame (BGR) to QImage (RGB)
-        h, w, ch = frame.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888).rgbSwapped()
-        self.video_display.setPixmap(QPixmap.fromImage(qt_image))
+        return {worker.feed_name: view.render_stats() for view, worker, _ in self.feeds}
+
+    @pyqtSlot()
+    def update_render_stats(self):
+        """
+        Refreshes every feed's FPS, latency and render counters.
+        """
+        for view, _, _ in self.feeds:
+            view.update_render_stats()
+
+    @pyqtSlot(bool)
+    def set_overlay(self, enabled):
+        """
+        Shows or hides the per-stage latency overlay on every feed.
+        """
+        for _, worker, _ in self.feeds:
+            worker.show_overlay = enabled
 
     @pyqtSlot(str)
     def update_status(self, message):
@@ -139,29 +498,49 @@ class DispatcherDashboard(QMainWindow):
         self.statusBar().showMessage(message)
 
     @pyqtSlot(str)
-    def handle_person_identified(self, name):
+    def handle_engine_ready(self, feed_name):
+        """
+        Counts the feeds whose engines have finished warming up.
         """
-        Handles the event when a person is identified.
+        self.feeds_ready += 1
+        if self.feeds_ready < len(self.feeds):
+            self.update_status(f"ARC Engine warming: {self.feeds_ready}/{len(self.feeds)} feeds ready.")
+        else:
+            self.update_status("ARC Engine ready.")
+
+    @pyqtSlot(str, str)
+    def handle_person_identified(self, feed_name, name):
+        """
+        Handles the event when a person is identified on one of the feeds.
         """
         # For now, just log it. This can be expanded to show alerts, etc.
-        logger.info(f"Person Identified: {name}")
-        self.update_status(f"Person Identified: {name}")
+        logger.info(f"Person Identified on {feed_name}: {name}")
+        self.update_status(f"Person Identified on {feed_name}: {name}")
 
     def closeEvent(self, event):
         """
         Handles the main window's close event to ensure graceful shutdown.
         """
         logger.info("Closing application...")
-        self.worker.stop()
-        self.thread.quit()
-        self.thread.wait()
-        logger.info("Thread finished.")
+        self.render_stats_timer.stop()
+        logger.info(f"Render stats: {self.render_stats()}")
+        for _, worker, _ in self.feeds:
+            worker.stop()
+        for _, _, thread in self.feeds:
+            thread.quit()
+            thread.wait()
+        logger.info("Threads finished.")
+        # Shared resources exist only if a feed finished loading them.
+        for _, worker, _ in self.feeds:
+            if worker.shared is not None:
+                worker.shared.shutdown()
+                break
         event.accept()
 
 
 if __name__ == "__main__":
     # This part is for testing the component independently
     app = QApplication(sys.argv)
-    dashboard = DispatcherDashboard()
+    dashboard = DispatcherDashboard(video_sources=[parse_video_source(v) for v in sys.argv[1:]] or (0,))
     dashboard.show()
     sys.exit(app.exec_())
\ No newline at end of file
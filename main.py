@@ -1,7 +1,9 @@
+import argparse
 import sys
 from PyQt5.QtWidgets import QApplication
-from gui.dispatcher_dashboard import DispatcherDashboard
-from utils.logger import get_logger
+from utils.metrics import start_http_server
+from gui.dispatcher_dashboard import DispatcherDashboard, parse_video_source
+from utils.logger import configure_logging, get_logger
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -11,10 +13,28 @@ def main():
     """
     Main function to launch the ARC system's Dispatcher Dashboard GUI.
     """
+    parser = argparse.ArgumentParser(description="ARC system Dispatcher Dashboard.")
+    parser.add_argument('sources', nargs='*', default=['0'],
+                        help="Video sources (camera index, file or stream URL), one grid cell each.")
+    parser.add_argument('--detection-server', metavar='local|HOST:PORT',
+                        help="Run person detection in a separate server process shared by all feeds. "
+                             "A HOST:PORT server's key is read from ARC_DETECTION_AUTHKEY.")
+    parser.add_argument('--metrics-port', type=int,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics.")
+    parser.add_argument('--log-json', metavar='PATH', help="Also write structured JSON logs to this file.")
+    # Remaining arguments are left to Qt.
+    args, qt_args = parser.parse_known_args()
+    if args.log_json:
+        configure_logging(json_path=args.log_json)
+
     logger.info("ARC system starting up...")
 
-    app = QApplication(sys.argv)
-    dashboard = DispatcherDashboard()
+    app = QApplication(sys.argv[:1] + qt_args)
+    if args.metrics_port is not None:
+        start_http_server(args.metrics_port)
+    # The engines and models are loaded in the background once the window is shown.
+    dashboard = DispatcherDashboard(video_sources=[parse_video_source(s) for s in args.sources],
+                                    shared_options={'detection_server': args.detection_server})
     dashboard.show()
 
     logger.info("Dispatcher Dashboard GUI launched.")
@@ -22,4 +42,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,64 @@
+"""
+Authentication keys of the connections between ARC processes.
+
+The shard and detection servers exchange pickled objects with their clients,
+so anyone who can authenticate to one can run code in it. Processes started
+by the engine itself share a random key; a server that other hosts can reach
+only starts with a key given explicitly.
+"""
+import ipaddress
+import os
+import secrets
+
+
+def new_authkey():
+    """
+    Returns a random key for servers whose clients are started by the same process.
+    """
+    return os.urandom(32)
+
+
+def is_loopback(host):
+    """
+    Returns whether `host` only accepts connections from this machine.
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def authkey_from_env(env_var):
+    """
+    Returns the key set in the environment variable `env_var`, or None if it is unset.
+    """
+    value = os.environ.get(env_var)
+    return value.encode() if value else None
+
+
+def server_authkey(host, authkey, env_var):
+    """
+    Returns the key a standalone server listening on `host` requires of its clients.
+
+    Args:
+        host (str): The address the server listens on.
+        authkey (str or None): The key given on the command line.
+        env_var (str): The environment variable read if no key was given.
+
+    Returns:
+        tuple: The key (bytes) and whether it was generated, in which case the
+               caller reports it so that local clients can use it.
+
+    Raises:
+        ValueError: If no key was given and the server is reachable from other hosts.
+    """
+    if authkey:
+        return authkey.encode(), False
+    key = authkey_from_env(env_var)
+    if key is not None:
+        return key, False
+    if not is_loopback(host):
+        raise ValueError(f"Listening on {host} requires an authentication key: pass --authkey or set {env_var}.")
+    return secrets.token_hex(32).encode(), True
@@ -1,32 +1,260 @@
+"""
+Centralized, non-blocking logging.
+
+Loggers returned by get_logger only put records on an in-memory queue; a
+listener thread formats them and writes them to the console, the log file
+and, optionally, a JSON lines file. Disk and console I/O therefore never
+runs inside the frame budget. Records from the same call site are rate
+limited, so a message logged on every frame is written a few times per
+second, with a count of the records suppressed in between.
+
+Usage:
+    from utils.logger import get_logger, configure_logging
+
+    logger = get_logger(__name__)
+    configure_logging(json_path="logs/arc_system.jsonl")   # optional, at startup
+"""
+import atexit
+import json
 import logging
 import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import util as mp_util
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Attributes every LogRecord has; anything else was passed with `extra=`.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `rate` records per call site every `interval` seconds.
+
+    The next record let through from a call site reports how many were
+    suppressed before it. Records at or above `exempt_level` always pass.
+    Counters are updated without a lock; concurrent threads may let a record
+    more or less through, which is harmless.
+    """
+
+    def __init__(self, rate=5, interval=1.0, exempt_level=logging.ERROR):
+        super().__init__()
+        self.rate = rate
+        self.interval = interval
+        self.exempt_level = exempt_level
+        self.suppressed = 0
+        self._sites = {}  # (pathname, lineno) -> [window start, records let through, suppressed]
+
+    def filter(self, record):
+        if record.levelno >= self.exempt_level:
+            return True
+        key = (record.pathname, record.lineno)
+        site = self._sites.get(key)
+        if site is None or record.created - site[0] >= self.interval:
+            if site is not None and site[2]:
+                record.msg = f"{record.getMessage()} [{site[2]} similar messages suppressed]"
+                record.args = None
+            self._sites[key] = [record.created, 1, 0]
+            return True
+        if site[1] < self.rate:
+            site[1] += 1
+            return True
+        site[2] += 1
+        self.suppressed += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, including any `extra=` fields.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """
+    A QueueHandler that drops records instead of blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than fail when the queue is full.
+        self.queue.put(self._sentinel)
+
+
+class _LoggingBackend:
+    """
+    The process-wide queue, the handler shared by all ARC loggers and the listener
+    thread that drains the queue into the configured sinks.
+    """
+
+    def __init__(self, max_queue=10000):
+        self.queue = queue.Queue(max_queue)
+        self.handler = _DroppingQueueHandler(self.queue)
+        self.listener = None
+        self.level = logging.INFO
+        self.loggers = set()
+        self._settings = None
+        self._lock = threading.Lock()
+
+    def configure(self, level=logging.INFO, log_dir="logs", console=True, json_path=None, rate=5, interval=1.0):
+        with self._lock:
+            self._settings = dict(level=level, log_dir=log_dir, console=console, json_path=json_path,
+                                  rate=rate, interval=interval)
+            self._stop_listener()
+            self._start(**self._settings)
+
+    def _start(self, level, log_dir, console, json_path, rate, interval):
+        self.level = level
+        for name in self.loggers:
+            logging.getLogger(name).setLevel(level)
+
+        log_format = logging.Formatter(LOG_FORMAT)
+        sinks = []
+        if console:
+            sinks.append(logging.StreamHandler(sys.stderr if console is True else console))
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            sinks.append(logging.FileHandler(os.path.join(log_dir, "arc_system.log")))
+        for sink in sinks:
+            sink.setFormatter(log_format)
+        if json_path:
+            os.makedirs(os.path.dirname(json_path) or '.', exist_ok=True)
+            json_sink = logging.FileHandler(json_path)
+            json_sink.setFormatter(JsonFormatter())
+            sinks.append(json_sink)
+
+        if not any(isinstance(f, RateLimitFilter) and (f.rate, f.interval) == (rate, interval)
+                   for f in self.handler.filters):
+            for existing in list(self.handler.filters):
+                self.handler.removeFilter(existing)
+            if rate:
+                self.handler.addFilter(RateLimitFilter(rate, interval))
+        self.listener = _Listener(self.queue, *sinks)
+        self.listener.start()
+
+    def ensure_started(self):
+        if self.listener is None:
+            self.configure(**(self._settings or {}))
+
+    def restart_in_child(self):
+        # A forked child inherits the queue but not the listener thread.
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.handler.queue = self.queue
+        self.listener = None
+        self._lock = threading.Lock()
+        if self._settings is not None:
+            self.configure(**self._settings)
+
+    def stop(self):
+        """
+        Writes out the queued records and stops the listener thread.
+        """
+        with self._lock:
+            self._stop_listener()
+
+    def flush(self):
+        with self._lock:
+            if self.listener is not None:
+                self._stop_listener()
+                self._start(**self._settings)
+
+    def _stop_listener(self):
+        if self.listener is not None:
+            self.listener.stop()
+            for sink in self.listener.handlers:
+                sink.close()
+            self.listener = None
+
+    def stats(self):
+        filters = [f for f in self.handler.filters if isinstance(f, RateLimitFilter)]
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'suppressed': filters[0].suppressed if filters else 0,
+        }
+
+
+_backend = _LoggingBackend()
+atexit.register(_backend.stop)
+# Worker processes started by multiprocessing exit without running atexit handlers.
+mp_util.Finalize(None, _backend.stop, exitpriority=0)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_backend.restart_in_child)
+
+
+def configure_logging(level=logging.INFO, log_dir="logs", console=True, json_path=None, rate=5, interval=1.0):
+    """
+    (Re)configures where the ARC loggers write to. Loggers already handed out
+    by get_logger keep working and switch to the new sinks.
+
+    Args:
+        level (int): The minimum level logged.
+        log_dir (str or None): Directory of arc_system.log; None disables the file.
+        console (bool or stream): Log to stderr, to the given stream, or not at all.
+        json_path (str or None): Also write records as JSON lines to this file.
+        rate (int or None): Records let through per call site every `interval`
+            seconds; None disables rate limiting. Errors are never rate limited.
+        interval (float): The rate limiting window in seconds.
+    """
+    _backend.configure(level=level, log_dir=log_dir, console=console, json_path=json_path, rate=rate,
+                       interval=interval)
+
+
+def logging_stats():
+    """
+    Returns the number of records waiting in the queue, dropped because it was
+    full, and suppressed by rate limiting.
+    """
+    return _backend.stats()
+
+
+def flush_logging():
+    """
+    Blocks until every record logged so far has been written.
+    """
+    _backend.flush()
+
 
 def get_logger(name="arc_logger"):
     """
     Configures and returns a logger instance.
     """
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-
-    # Create handlers if they don't exist
-    if not logger.handlers:
-        # Console Handler
-        c_handler = logging.StreamHandler()
-        
-        # File Handler
-        log_dir = "logs"
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-        f_handler = logging.FileHandler(os.path.join(log_dir, "arc_system.log"))
-
-        # Create formatters and add it to handlers
-        log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        c_handler.setFormatter(log_format)
-        f_handler.setFormatter(log_format)
-
-        # Add handlers to the logger
-        logger.addHandler(c_handler)
-        logger.addHandler(f_handler)
+    if _backend.handler not in logger.handlers:
+        _backend.ensure_started()
+        logger.setLevel(_backend.level)
+        logger.addHandler(_backend.handler)
+        _backend.loggers.add(name)
 
     return logger
 
@@ -36,4 +264,4 @@ logger = get_logger()
 if __name__ == '__main__':
     logger.info("This is an info message from the centralized logger.")
     logger.warning("This is a warning message.")
-    logger.error("This is an error message.")
\ No newline at end of file
+    logger.error("This is an error message.")
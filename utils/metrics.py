@@ -0,0 +1,297 @@
+"""
+Low-overhead runtime metrics: per-stage latency histograms and engine gauges,
+exported in the Prometheus text format.
+
+Stage timings are recorded into fixed-bucket histograms, which costs one
+bisect and two additions per observation and no allocation. Gauges such as
+queue depths, dropped frames and cache hit rates are not recorded per frame;
+collectors registered by the engines compute them when the metrics are
+scraped or rendered.
+
+Usage:
+    from utils.metrics import metrics, start_http_server
+
+    with metrics.time('detection', feed='feed1'):
+        ...
+    start_http_server(9108)   # GET http://127.0.0.1:9108/metrics
+"""
+import bisect
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Bucket upper bounds in milliseconds, roughly 1.5x apart from 0.1 ms to 5 s.
+DEFAULT_BUCKETS_MS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.5, 10.0, 15.0, 20.0, 25.0, 30.0,
+                      40.0, 50.0, 75.0, 100.0, 150.0, 200.0, 300.0, 500.0, 750.0, 1000.0, 2000.0, 5000.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """
+    A fixed-bucket latency histogram with quantile estimates.
+
+    Each histogram is meant to have one writing thread (one stage of one feed);
+    readers may see an observation's count and sum a moment apart.
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'sum_ms', 'max_ms')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q):
+        """
+        Estimates the q-quantile in milliseconds by interpolating within its bucket.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max_ms
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max_ms
+
+    def summary(self):
+        """
+        Returns the count, mean, max and p50/p95/p99 latency in milliseconds.
+        """
+        summary = {
+            'count': self.count,
+            'mean_ms': self.sum_ms / self.count if self.count else 0.0,
+            'max_ms': self.max_ms,
+        }
+        for q in QUANTILES:
+            summary[f'p{int(q * 100)}_ms'] = self.quantile(q)
+        return summary
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter() - self.start) * 1000.0)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Holds the stage latency histograms of every feed and the gauge collectors.
+    """
+
+    def __init__(self, bounds=DEFAULT_BUCKETS_MS):
+        self.bounds = bounds
+        self.enabled = True
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def histogram(self, stage, feed='default'):
+        """
+        Returns the histogram of a stage and feed, creating it on first use.
+        """
+        key = (stage, feed)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram(self.bounds))
+        return histogram
+
+    def observe(self, stage, ms, feed='default'):
+        """
+        Records a stage latency in milliseconds.
+        """
+        if self.enabled:
+            self.histogram(stage, feed).observe(ms)
+
+    def time(self, stage, feed='default'):
+        """
+        Returns a context manager that records the duration of its block.
+        """
+        return _Timer(self.histogram(stage, feed) if self.enabled else _NULL_HISTOGRAM)
+
+    def add_collector(self, collector):
+        """
+        Registers a callable returning {(name, labels): value} gauges, where
+        labels is a tuple of (label, value) pairs. It is called on every export.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def stage_summaries(self, feed=None):
+        """
+        Returns the latency summary of every stage.
+
+        Args:
+            feed (str or None): Only this feed's stages, keyed by stage name. If None,
+                all stages keyed by (stage, feed).
+        """
+        with self._lock:
+            items = list(self._histograms.items())
+        if feed is None:
+            return {key: histogram.summary() for key, histogram in items}
+        return {stage: histogram.summary() for (stage, f), histogram in items if f == feed}
+
+    def collect_gauges(self):
+        """
+        Calls every collector and merges their gauges.
+        """
+        with self._lock:
+            collectors = list(self._collectors)
+        gauges = {}
+        for collector in collectors:
+            try:
+                gauges.update(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        return gauges
+
+    def render_prometheus(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP arc_stage_latency_seconds Processing latency of each engine stage.",
+            "# TYPE arc_stage_latency_seconds histogram",
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+        for (stage, feed), histogram in items:
+            labels = f'stage="{_escape(stage)}",feed="{_escape(feed)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.bounds, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'arc_stage_latency_seconds_bucket{{{labels},le="{bound / 1000.0:g}"}} {cumulative}')
+            lines.append(f'arc_stage_latency_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'arc_stage_latency_seconds_sum{{{labels}}} {histogram.sum_ms / 1000.0:.9g}')
+            lines.append(f'arc_stage_latency_seconds_count{{{labels}}} {histogram.count}')
+
+        lines.append("# HELP arc_stage_latency_quantile_seconds Estimated latency quantiles of each engine stage.")
+        lines.append("# TYPE arc_stage_latency_quantile_seconds gauge")
+        for (stage, feed), histogram in items:
+            for q in QUANTILES:
+                lines.append(f'arc_stage_latency_quantile_seconds{{stage="{_escape(stage)}",feed="{_escape(feed)}",'
+                             f'quantile="{q}"}} {histogram.quantile(q) / 1000.0:.9g}')
+
+        by_name = {}
+        for (name, labels), value in self.collect_gauges().items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in by_name[name]:
+                label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {float(value):.9g}" if label_text else f"{name} {float(value):.9g}")
+        return "\n".join(lines) + "\n"
+
+
+class _NullHistogram:
+    def observe(self, ms):
+        pass
+
+
+_NULL_HISTOGRAM = _NullHistogram()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def flatten_stats(stats, prefix='arc', labels=(), skip=('tracks',)):
+    """
+    Turns a nested stats dict, as returned by ARCEngineCore.get_stats, into
+    gauges: every numeric leaf becomes arc_<section>_<key>.
+
+    Args:
+        stats (dict): The nested statistics.
+        prefix (str): The metric name prefix.
+        labels (tuple): (label, value) pairs added to every gauge.
+        skip (tuple): Keys whose subtrees are left out (e.g. per-track tables).
+
+    Returns:
+        dict: {(name, labels): value}.
+    """
+    gauges = {}
+    for key, value in stats.items():
+        if key in skip:
+            continue
+        name = f"{prefix}_{_METRIC_NAME.sub('_', str(key))}"
+        if isinstance(value, dict):
+            gauges.update(flatten_stats(value, name, labels, skip))
+        elif isinstance(value, bool):
+            gauges[(name, labels)] = int(value)
+        elif isinstance(value, (int, float)):
+            gauges[(name, labels)] = value
+    return gauges
+
+
+_METRIC_NAME = re.compile(r'[^a-zA-Z0-9_]')
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1', registry=None):
+    """
+    Serves the metrics at http://host:port/metrics from a daemon thread.
+
+    Args:
+        port (int): The port; 0 picks a free one.
+        host (str): The interface to bind, localhost by default.
+        registry (MetricsRegistry or None): Defaults to the global registry.
+
+    Returns:
+        ThreadingHTTPServer: The server; call shutdown() to stop it.
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry or metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="arc-metrics-http", daemon=True).start()
+    logger.info(f"Metrics served at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+metrics = MetricsRegistry()